@@ -0,0 +1,81 @@
+"""
+Benchmark de arranque en frío: tiempo de importar la app y de construir los clientes.
+
+Cada medición corre en un proceso nuevo (como un arranque de Render): mide `import main`
+y, con `--clients`, la primera llamada a `get_sheet_service()` / `get_drive_service()`
+(requiere `service_account.json`). Con `--eager` se mide además el arranque anterior,
+que cargaba las credenciales y construía ambos clientes durante el import.
+
+Uso (desde backend/):  python -m benchmarks.bench_cold_start --runs 5 --clients --eager
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+_LAZY = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+result = {"import": imported - started}
+if CLIENTS:
+    main.get_sheet_service()
+    main.get_drive_service()
+    result["clients"] = time.perf_counter() - imported
+print(json.dumps(result))
+"""
+
+# Lo que hacía el import de main antes de los clientes diferidos
+_EAGER = """
+import json, time
+started = time.perf_counter()
+from google_clients import SCOPES, SERVICE_ACCOUNT_FILE
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+with open(SERVICE_ACCOUNT_FILE, 'r', encoding='utf-8') as f:
+    data = json.load(f)
+data['private_key'] = data['private_key'].replace('\\\\n', '\\n')
+creds = service_account.Credentials.from_service_account_info(data, scopes=SCOPES)
+build('sheets', 'v4', credentials=creds)
+build('drive', 'v3', credentials=creds)
+print(json.dumps({"eager_build": time.perf_counter() - started}))
+"""
+
+
+def run_once(code: str, backend_dir: str) -> dict:
+    env = dict(os.environ, GOOGLE_WARMUP="0")
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=backend_dir, env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--clients', action='store_true', help="medir también la construcción de los clientes")
+    parser.add_argument('--eager', action='store_true', help="medir el arranque anterior (construcción en el import)")
+    args = parser.parse_args()
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    samples: dict[str, list[float]] = {}
+    for _ in range(args.runs):
+        for key, value in run_once(f"CLIENTS = {args.clients}\n" + _LAZY, backend_dir).items():
+            samples.setdefault(key, []).append(value)
+        if args.eager:
+            for key, value in run_once(_EAGER, backend_dir).items():
+                samples.setdefault(key, []).append(value)
+
+    print(f"corridas={args.runs}")
+    for key, values in samples.items():
+        print(f"{key:12s} mediana {statistics.median(values) * 1000:8.1f} ms   mín {min(values) * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+Benchmark de carga sin red: la app completa contra Google y Resend simulados.
+
+Genera datos sintéticos (`benchmarks/fakes.py`), conecta los servicios simulados con la
+latencia indicada y recorre cada endpoint con peticiones concurrentes a través de
+`httpx.ASGITransport` (sin sockets). El flujo SSE no termina nunca, así que ese escenario
+llama al endpoint directamente y mide hasta el primer evento. Por escenario informa
+throughput, latencias p50/p99, errores, llamadas a las APIs simuladas y el pico de memoria
+(RSS) del proceso. Al final comprueba que escrituras concurrentes a celdas distintas
+lleguen todas a la hoja. Requiere `httpx` (sólo para el benchmark).
+
+Uso (desde backend/):
+    python -m benchmarks.bench_load --rows 10000 --latency-ms 50 --concurrency 32 --requests 500
+    python -m benchmarks.bench_load --rows 100000 --scenarios tab_page,tab_search,tab_ndjson
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import tempfile
+import time
+
+
+SCENARIOS = (
+    'tab_full', 'tab_page', 'tab_search', 'tab_columnar', 'tab_ndjson', 'tab_revalidate', 'tabs_batch',
+    'sheet_events', 'employee_search', 'employee_lookup', 'pdf_link', 'pdf_metadata', 'pdf_download',
+    'send_email', 'email_job_status', 'send_batch', 'metrics',
+)
+# Trabajos de envío que se crean antes de medir 'email_job_status'
+STATUS_JOBS = 10
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(round(q * (len(sorted_values) - 1))), len(sorted_values) - 1)]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def build_scenarios(dataset, state: dict) -> dict:
+    """
+    Cada escenario: f(i) -> (método, URL, argumentos de httpx). `state` guarda lo que se
+    prepara antes de medir (el ETag de la primera página y los IDs de trabajos de envío).
+    """
+    import download_links
+    from tabs import TABS
+
+    licencia = TABS['licencia']
+    pages = max(dataset.rows // 10, 1)
+    file_ids = list(dataset.files)
+    surnames = ["gómez", "pérez", "sosa", "díaz", "romero"]
+
+    def send_payload(i: int) -> dict:
+        return {
+            "pdf_drive_id": file_ids[i % len(file_ids)],
+            "recipient_email": f"empleado{i}@example.com",
+            "sheet_row_number": 2 + i % max(dataset.rows, 1),
+            "sheet_name": licencia.key,
+            "update_column_letter": licencia.status_column,
+        }
+
+    def download_path(i: int) -> str:
+        file_id = file_ids[i % len(file_ids)]
+        url, _ = download_links.signed_download_url(file_id, dataset.md5(file_id), dataset.files[file_id]['name'])
+        return url.removeprefix(download_links.PUBLIC_BASE_URL)
+
+    def download(i: int) -> tuple:
+        # La mitad de las descargas piden un rango, como un visor o una descarga reanudada
+        headers = {"Range": "bytes=0-65535"} if i % 2 else {}
+        return 'GET', download_path(i), {"headers": headers}
+
+    return {
+        'tab_full': lambda i: ('GET', licencia.route, {}),
+        'tab_page': lambda i: ('GET', f"/sheets/data?page={i % pages + 1}&page_size=10&sort=-sheet_row_number", {}),
+        'tab_search': lambda i: ('GET', f"{licencia.route}?page=1&q={surnames[i % len(surnames)]}", {}),
+        'tab_columnar': lambda i: ('GET', f"{licencia.route}?format=columnar&page_size=200&page={i % max(pages // 20, 1) + 1}", {}),
+        'tab_ndjson': lambda i: ('GET', f"{licencia.route}?format=ndjson", {}),
+        'tab_revalidate': lambda i: ('GET', f"{licencia.route}?page=1", {"headers": {"If-None-Match": state.get('page1_etag', '')}}),
+        'tabs_batch': lambda i: ('GET', "/sheets/batch?page=1&page_size=50", {}),
+        'sheet_events': lambda i: ('SSE', f"/sheets/{licencia.key}/events", {}),
+        'employee_search': lambda i: ('GET', f"/employees?prefix={surnames[i % len(surnames)][:3]}", {}),
+        'employee_lookup': lambda i: ('GET', f"/employees/{10000 + i % max(dataset.rows, 1)}", {}),
+        'pdf_link': lambda i: ('GET', f"/pdf/{file_ids[i % len(file_ids)]}", {}),
+        'pdf_metadata': lambda i: ('POST', "/pdf/metadata", {"json": {"file_ids": [file_ids[(i * 50 + k) % len(file_ids)] for k in range(50)]}}),
+        'pdf_download': download,
+        'send_email': lambda i: ('POST', "/send_pdf_email", {"json": send_payload(i)}),
+        'email_job_status': lambda i: ('GET', f"/send_pdf_email/jobs/{state['job_ids'][i % len(state['job_ids'])]}", {}),
+        'send_batch': lambda i: ('POST', "/send_pdf_email/batch", {"json": {"items": [send_payload(i * 10 + k) for k in range(10)]}}),
+        'metrics': lambda i: ('GET', "/metrics", {}),
+    }
+
+
+async def run_scenario(client, make_request, total: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, next_index
+        while next_index < total:
+            i = next_index
+            next_index += 1
+            method, url, kwargs = make_request(i)
+            started = time.perf_counter()
+            try:
+                if method == 'SSE':
+                    if not await read_first_event(url):
+                        errors += 1
+                else:
+                    response = await client.request(method, url, **kwargs)
+                    await response.aread()
+                    if response.status_code >= 400:
+                        errors += 1
+            except Exception as e:
+                print(f"ERROR: {method} {url}: {e}")
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput": total / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+    }
+
+
+async def read_first_event(url: str) -> bool:
+    """
+    Abre el flujo SSE de la pestaña llamando al endpoint (ASGITransport espera el cuerpo
+    completo, que en un flujo no llega nunca), lee el primer evento y cierra el flujo.
+    """
+    import main
+
+    tab_key = url.split('/')[2]
+    response = await main.get_sheet_events(tab_key)
+    events = response.body_iterator
+    try:
+        event = await anext(events)
+    finally:
+        await events.aclose()
+    return 'event: ready' in event
+
+
+async def check_concurrent_writes(dataset, backend, writes: int = 8) -> bool:
+    """
+    Escrituras concurrentes a celdas distintas: cada una debe llegar a la hoja simulada con
+    su propia llamada (las escrituras nunca se agrupan como las lecturas idénticas).
+    """
+    from email_delivery import SENT_MARKER, mark_as_sent, status_cell_range
+    from google_clients import get_sheet_service
+    from tabs import SPREADSHEET_ID, TABS, column_index
+
+    tab = TABS['licencia']
+    # Filas por debajo de los datos para no pisar el estado de las filas reales
+    first_row = dataset.rows + 2
+    batches = [
+        [status_cell_range(tab.key, tab.status_column, first_row + 2 * i + k) for k in range(2)]
+        for i in range(writes)
+    ]
+    calls_before = backend.sheets.calls['sheets.spreadsheets.values.batchUpdate']
+    await asyncio.gather(*(mark_as_sent(get_sheet_service(), SPREADSHEET_ID, batch) for batch in batches))
+    calls = backend.sheets.calls['sheets.spreadsheets.values.batchUpdate'] - calls_before
+
+    values = dataset.sheets[tab.key]
+    status = column_index(tab.status_column)
+    missing = [
+        row_number for row_number in range(first_row, first_row + 2 * writes)
+        if row_number > len(values) or len(values[row_number - 1]) <= status
+        or values[row_number - 1][status] != SENT_MARKER
+    ]
+    ok = calls == writes and not missing
+    print(f"{'escrituras':16s} {writes} concurrentes -> {calls} batchUpdate, "
+          f"{'todas escritas' if not missing else f'filas sin escribir: {missing}'}")
+    return ok
+
+
+async def wait_for_email_queue(email_job_queue, status_writer, timeout: float = 300.0) -> float:
+    """
+    Espera a que los workers vacíen la cola de emails y a que se escriban las marcas de
+    'Enviado' diferidas; devuelve cuánto tardaron.
+    """
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if not await email_job_queue.pending_count() and not status_writer.pending:
+            break
+        await asyncio.sleep(0.1)
+    return time.perf_counter() - started
+
+
+async def run(args) -> None:
+    import httpx
+
+    from benchmarks import fakes
+
+    dataset = fakes.SyntheticDataset(rows=args.rows, pdfs=args.pdfs, pdf_size=args.pdf_size)
+    backend = fakes.install(dataset, args.latency_ms, args.resend_latency_ms)
+
+    import main
+
+    scenarios = [name.strip() for name in args.scenarios.split(',')] if args.scenarios else list(SCENARIOS)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Escenarios desconocidos: {', '.join(sorted(unknown))}")
+
+    print(f"filas={args.rows} pdfs={dataset.pdfs} tamaño_pdf={args.pdf_size} latencia_google={args.latency_ms}ms "
+          f"latencia_resend={args.resend_latency_ms}ms concurrencia={args.concurrency}")
+    print(f"{'escenario':16s} {'peticiones':>10s} {'errores':>8s} {'req/s':>9s} {'p50 ms':>9s} {'p99 ms':>9s} "
+          f"{'RSS MB':>8s} {'llamadas API':>13s}")
+
+    state: dict = {}
+    make_requests = build_scenarios(dataset, state)
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            from tabs import TABS
+            response = await client.get(f"{TABS['licencia'].route}?page=1")
+            state['page1_etag'] = response.headers.get('etag', '')
+            if 'email_job_status' in scenarios:
+                state['job_ids'] = []
+                for i in range(STATUS_JOBS):
+                    method, url, kwargs = make_requests['send_email'](i)
+                    response = await client.request(method, url, **kwargs)
+                    state['job_ids'].append(response.json()['job_id'])
+
+            for name in scenarios:
+                total = args.requests if name != 'send_batch' else max(args.requests // 10, 1)
+                calls_before = sum(backend.upstream_calls().values())
+                result = await run_scenario(client, make_requests[name], total, args.concurrency)
+                calls = sum(backend.upstream_calls().values()) - calls_before
+                print(f"{name:16s} {result['requests']:10d} {result['errors']:8d} {result['throughput']:9.1f} "
+                      f"{result['p50'] * 1000:9.1f} {result['p99'] * 1000:9.1f} {peak_rss_mb():8.1f} {calls:13d}")
+                if name == 'send_email':
+                    drained = await wait_for_email_queue(main.email_job_queue, main.status_writer)
+                    print(f"{'  cola vaciada':16s} en {drained:.2f}s ({backend.resend.calls} envíos a Resend)")
+
+            writes_ok = await check_concurrent_writes(dataset, backend)
+
+    print("llamadas por método: " + ', '.join(f"{k}={v}" for k, v in sorted(backend.upstream_calls().items())))
+    if not writes_ok:
+        raise SystemExit("ERROR: se perdieron escrituras concurrentes a la hoja")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1000, help="filas por pestaña (100 a 100000)")
+    parser.add_argument('--pdfs', type=int, default=None, help="PDFs por carpeta (por defecto, tantos como filas)")
+    parser.add_argument('--pdf-size', type=int, default=64 * 1024, help="tamaño de cada PDF en bytes")
+    parser.add_argument('--latency-ms', type=float, default=50.0, help="latencia simulada de Google")
+    parser.add_argument('--resend-latency-ms', type=float, default=150.0, help="latencia simulada de Resend")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200, help="peticiones por escenario")
+    parser.add_argument('--scenarios', default='', help=f"lista separada por comas ({', '.join(SCENARIOS)})")
+    args = parser.parse_args()
+
+    # Estado del backend en un directorio temporal; se configura antes de importar la app
+    data_dir = tempfile.mkdtemp(prefix='bench-load-')
+    os.environ.setdefault('GOOGLE_WARMUP', '0')
+    os.environ.setdefault('EMAIL_QUEUE_DB', os.path.join(data_dir, 'email_jobs.sqlite3'))
+    os.environ.setdefault('PDF_CACHE_DIR', os.path.join(data_dir, 'pdf_cache'))
+    os.environ.setdefault('SHEET_MIRROR_DB', os.path.join(data_dir, 'sheet_mirror.sqlite3'))
+    os.environ.setdefault('STATUS_WRITE_DB', os.path.join(data_dir, 'status_writes.sqlite3'))
+    # Enlaces de descarga firmados para el escenario 'pdf_download'
+    os.environ.setdefault('PUBLIC_BASE_URL', 'http://bench')
+    os.environ.setdefault('DOWNLOAD_LINK_SECRET', 'bench')
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
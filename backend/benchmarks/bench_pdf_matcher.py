@@ -0,0 +1,78 @@
+"""
+Microbenchmark: `PdfNameMatcher` frente a `find_pdf_drive_id` (recorrido lineal).
+
+Genera una carpeta y una columna 'id' sintéticas con coincidencias exactas, parciales y
+fallidas, comprueba que ambas implementaciones devuelven exactamente lo mismo y mide
+el tiempo de enriquecer la columna completa.
+
+Uso (desde backend/):  python -m benchmarks.bench_pdf_matcher --files 5000 --rows 5000
+"""
+
+import argparse
+import random
+import string
+import time
+
+from pdf_matcher import PdfNameMatcher, find_pdf_drive_id
+
+
+def build_dataset(n_files: int, n_rows: int, seed: int = 7):
+    rng = random.Random(seed)
+    surnames = ["gomez", "perez", "rodriguez", "fernandez", "lopez", "martinez", "sosa", "diaz"]
+
+    pdf_name_to_id_map = {}
+    for i in range(n_files):
+        name = f"{rng.choice(['certificado', 'licencia', 'form81'])}_{i:06d}_{rng.choice(surnames)}.pdf"
+        file_id = ''.join(rng.choices(string.ascii_letters + string.digits, k=33))
+        pdf_name_to_id_map[name] = file_id
+
+    filenames = list(pdf_name_to_id_map)
+    column = []
+    for _ in range(n_rows):
+        kind = rng.random()
+        filename = rng.choice(filenames)
+        if kind < 0.4:
+            column.append(filename[:-4].upper())               # exacta sin extensión
+        elif kind < 0.7:
+            column.append(filename.split('_', 1)[1][:6])       # parcial (número)
+        elif kind < 0.8:
+            column.append(rng.choice(surnames)[:2])             # parcial muy corta
+        elif kind < 0.95:
+            column.append(f"inexistente_{rng.randint(0, 10**6)}")
+        else:
+            column.append(rng.choice([None, '']))
+    return pdf_name_to_id_map, column
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--files', type=int, default=5000)
+    parser.add_argument('--rows', type=int, default=5000)
+    args = parser.parse_args()
+
+    pdf_name_to_id_map, column = build_dataset(args.files, args.rows)
+
+    started = time.perf_counter()
+    expected = [find_pdf_drive_id(name, pdf_name_to_id_map) for name in column]
+    linear_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    matcher = PdfNameMatcher(pdf_name_to_id_map)
+    build_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = matcher.find_many(column)
+    lookup_seconds = time.perf_counter() - started
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    print(f"archivos={args.files} filas={args.rows} coincidencias={sum(1 for x in expected if x)}")
+    print(f"find_pdf_drive_id (lineal): {linear_seconds * 1000:9.1f} ms")
+    print(f"PdfNameMatcher construcción: {build_seconds * 1000:9.1f} ms")
+    print(f"PdfNameMatcher find_many:    {lookup_seconds * 1000:9.1f} ms")
+    print(f"diferencias: {mismatches}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
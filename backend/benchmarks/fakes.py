@@ -0,0 +1,429 @@
+"""
+Dobles en proceso de Google Sheets, Google Drive y Resend para los benchmarks.
+
+`SyntheticDataset` genera las pestañas del registro (`tabs.TABS`) con N filas y sus
+carpetas de Drive con M PDFs, con nombres que coinciden total o parcialmente con la
+columna 'id' (y un resto sin PDF). Los servicios simulados responden a las mismas
+llamadas que hace el backend (`values.get/batchGet/update/batchUpdate`, `files.list/get/
+get_media`, el feed de cambios y las peticiones por lotes) con una latencia configurable,
+y `install()` los conecta a la app en lugar de los clientes reales.
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from tabs import SPREADSHEET_ID, TABS, column_index
+
+
+NAMES = ["Ana", "Luis", "María", "Jorge", "Lucía", "Pedro", "Sofía", "Diego", "Carla", "Martín"]
+SURNAMES = ["Gómez", "Pérez", "Rodríguez", "Fernández", "López", "Martínez", "Sosa", "Díaz", "Romero", "Álvarez"]
+BASE_HEADERS = ["id", "Name", "Apellido", "Legajo", "Email", "Fecha", "Desde", "Hasta", "Observaciones"]
+PDF_MIME_TYPE = 'application/pdf'
+_CELL_RE = re.compile(r"^([A-Z]+)(\d+)$")
+
+
+class Latency:
+    """Latencia simulada de cada llamada: `mean_ms` ± `jitter` (proporción), bloqueante."""
+
+    def __init__(self, mean_ms: float = 0.0, jitter: float = 0.2, seed: int = 11):
+        self.mean = mean_ms / 1000
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if self.mean <= 0:
+            return
+        with self._lock:
+            factor = self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+        time.sleep(self.mean * factor)
+
+
+class SyntheticDataset:
+    def __init__(self, rows: int = 1000, pdfs: int | None = None, pdf_size: int = 64 * 1024, seed: int = 7):
+        self.rows = rows
+        self.pdfs = rows if pdfs is None else pdfs
+        self.pdf_size = pdf_size
+        self.version = 1
+        self.modified_time = time.time()
+        # nombre de pestaña -> filas (la primera son los encabezados)
+        self.sheets: dict[str, list[list]] = {}
+        # file_id -> {'id', 'name', 'parents'}
+        self.files: dict[str, dict] = {}
+        self._md5: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        rng = random.Random(seed)
+        for tab in TABS.values():
+            self._build_tab(tab, rng)
+
+    def _build_tab(self, tab, rng: random.Random) -> None:
+        status_index = column_index(tab.status_column)
+        extra = [f"Campo {i}" for i in range(len(BASE_HEADERS), status_index)]
+        headers = BASE_HEADERS + extra + ["Estado"]
+
+        for i in range(self.pdfs):
+            file_id = f"{tab.key}-pdf-{i:06d}"
+            name = f"{tab.filename_prefix}_{i:06d}_{SURNAMES[i % len(SURNAMES)]}.pdf"
+            self.files[file_id] = {"id": file_id, "name": name, "parents": [tab.drive_folder_id]}
+
+        values = [headers]
+        for i in range(self.rows):
+            kind = rng.random()
+            pdf_number = rng.randrange(self.pdfs) if self.pdfs else 0
+            if not self.pdfs or kind >= 0.9:
+                row_id = f"sin_pdf_{i:06d}"                                # sin PDF asociado
+            elif kind < 0.6:
+                row_id = f"{tab.filename_prefix}_{pdf_number:06d}"         # coincidencia parcial
+            else:
+                row_id = f"{tab.filename_prefix}_{pdf_number:06d}_{SURNAMES[pdf_number % len(SURNAMES)]}"
+            row = [
+                row_id,
+                rng.choice(NAMES),
+                rng.choice(SURNAMES),
+                str(10000 + i),
+                f"empleado{i}@example.com",
+                f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025",
+                "", "",
+                rng.choice(["", "", "Urgente", "Revisar"]),
+            ] + [""] * len(extra)
+            # La mitad de las filas ya fueron enviadas; las hojas reales omiten celdas vacías finales
+            if rng.random() < 0.5:
+                row.append("Enviado")
+            else:
+                while row and row[-1] == "":
+                    row.pop()
+            values.append(row)
+        self.sheets[tab.key] = values
+
+    # --- Hoja ---
+
+    def read_range(self, range_name: str) -> list[list]:
+        sheet_name, _, cells = range_name.partition('!')
+        values = self.sheets.get(sheet_name)
+        if values is None:
+            raise _http_error(400, f"Unable to parse range: {range_name}")
+        width = None
+        if ':' in cells:
+            last_column = ''.join(c for c in cells.split(':')[1] if c.isalpha())
+            width = column_index(last_column) + 1 if last_column else None
+        with self._lock:
+            return [list(row[:width]) if width else list(row) for row in values]
+
+    def write_cell(self, cell_range: str, value) -> None:
+        sheet_name, _, cell = cell_range.partition('!')
+        match = _CELL_RE.match(cell)
+        if sheet_name not in self.sheets or match is None:
+            raise _http_error(400, f"Unable to parse range: {cell_range}")
+        column, row_number = column_index(match.group(1)), int(match.group(2))
+        with self._lock:
+            values = self.sheets[sheet_name]
+            while len(values) < row_number:
+                values.append([])
+            row = values[row_number - 1]
+            row.extend([""] * (column + 1 - len(row)))
+            row[column] = value
+            self.version += 1
+            self.modified_time = time.time()
+
+    # --- PDFs ---
+
+    def pdf_bytes(self, file_id: str) -> bytes:
+        """Contenido determinístico del PDF (se genera al pedirlo, no se guarda en memoria)."""
+        header = f"%PDF-1.4\n% {file_id}\n".encode('ascii')
+        filler = hashlib.sha256(file_id.encode('ascii')).digest()
+        body_size = max(self.pdf_size - len(header), 0)
+        return header + (filler * (body_size // len(filler) + 1))[:body_size]
+
+    def md5(self, file_id: str) -> str:
+        checksum = self._md5.get(file_id)
+        if checksum is None:
+            checksum = self._md5[file_id] = hashlib.md5(self.pdf_bytes(file_id)).hexdigest()
+        return checksum
+
+
+def _http_error(status: int, message: str) -> HttpError:
+    return HttpError(httplib2.Response({'status': str(status)}), message.encode('utf-8'))
+
+
+class FakeRequest:
+    """
+    Equivalente a `googleapiclient.http.HttpRequest`: `execute()` simula la latencia. Como
+    en el real, `method` es el verbo HTTP y `body` el cuerpo serializado en JSON, así que
+    la agrupación de lecturas (single-flight) y las cuotas ven lo mismo que en producción.
+    """
+
+    def __init__(self, method_id: str, handler, latency: Latency, calls: Counter,
+                 method: str = 'GET', body: dict | None = None, **params):
+        self.methodId = method_id
+        self.uri = f"fake://{method_id}?" + '&'.join(f"{k}={params[k]}" for k in sorted(params))
+        self.method = method
+        self.body = None if body is None else json.dumps(body)
+        self.headers = {}
+        self.http = None
+        self._handler = handler
+        self._latency = latency
+        self._calls = calls
+
+    def execute(self, http=None, num_retries: int = 0):
+        self._calls[self.methodId] += 1
+        self._latency.wait()
+        return self._handler()
+
+
+# --- Google Sheets ---
+
+class FakeSheetService:
+    def __init__(self, dataset: SyntheticDataset, latency: Latency):
+        self.dataset = dataset
+        self.latency = latency
+        self.calls: Counter = Counter()
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def _request(self, method_id: str, handler, method: str = 'GET', body: dict | None = None, **params) -> FakeRequest:
+        return FakeRequest(method_id, handler, self.latency, self.calls, method=method, body=body, **params)
+
+    def get(self, spreadsheetId: str, range: str, **kwargs):
+        return self._request(
+            'sheets.spreadsheets.values.get',
+            lambda: {"range": range, "values": self.dataset.read_range(range)},
+            spreadsheetId=spreadsheetId, range=range,
+        )
+
+    def batchGet(self, spreadsheetId: str, ranges: list[str], **kwargs):
+        return self._request(
+            'sheets.spreadsheets.values.batchGet',
+            lambda: {"valueRanges": [{"range": r, "values": self.dataset.read_range(r)} for r in ranges]},
+            spreadsheetId=spreadsheetId, ranges=','.join(ranges),
+        )
+
+    def update(self, spreadsheetId: str, range: str, valueInputOption: str, body: dict, **kwargs):
+        def handler():
+            self.dataset.write_cell(range, body['values'][0][0])
+            return {"updatedRange": range, "updatedCells": 1}
+        return self._request(
+            'sheets.spreadsheets.values.update', handler, method='PUT', body=body,
+            spreadsheetId=spreadsheetId, range=range, valueInputOption=valueInputOption,
+        )
+
+    def batchUpdate(self, spreadsheetId: str, body: dict, **kwargs):
+        def handler():
+            for data in body['data']:
+                self.dataset.write_cell(data['range'], data['values'][0][0])
+            return {"totalUpdatedCells": len(body['data'])}
+        return self._request(
+            'sheets.spreadsheets.values.batchUpdate', handler, method='POST', body=body, spreadsheetId=spreadsheetId,
+        )
+
+
+# --- Google Drive ---
+
+class FakeDriveService:
+    def __init__(self, dataset: SyntheticDataset, latency: Latency):
+        self.dataset = dataset
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._files = _FakeFiles(self)
+        self._changes = _FakeChanges(self)
+
+    def files(self):
+        return self._files
+
+    def changes(self):
+        return self._changes
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def _request(self, method_id: str, handler, **params) -> FakeRequest:
+        return FakeRequest(method_id, handler, self.latency, self.calls, **params)
+
+
+class _FakeFiles:
+    _PARENT_RE = re.compile(r"'([^']+)' in parents")
+
+    def __init__(self, service: FakeDriveService):
+        self._service = service
+
+    def list(self, q: str = '', pageSize: int = 100, pageToken: str | None = None, **kwargs):
+        def handler():
+            match = self._PARENT_RE.search(q)
+            folder_id = match.group(1) if match else None
+            matching = [
+                {"id": f["id"], "name": f["name"]}
+                for f in self._service.dataset.files.values()
+                if folder_id is None or folder_id in f["parents"]
+            ]
+            start = int(pageToken or 0)
+            response = {"files": matching[start:start + pageSize]}
+            if start + pageSize < len(matching):
+                response["nextPageToken"] = str(start + pageSize)
+            return response
+        return self._service._request('drive.files.list', handler, q=q, pageSize=pageSize, pageToken=pageToken)
+
+    def get(self, fileId: str, fields: str = '', **kwargs):
+        dataset = self._service.dataset
+
+        def handler():
+            if fileId == SPREADSHEET_ID:
+                return {
+                    "id": fileId,
+                    "version": str(dataset.version),
+                    "modifiedTime": time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(dataset.modified_time)),
+                }
+            drive_file = dataset.files.get(fileId)
+            if drive_file is None:
+                raise _http_error(404, f"File not found: {fileId}")
+            return {
+                "id": fileId,
+                "name": drive_file["name"],
+                "mimeType": PDF_MIME_TYPE,
+                "webViewLink": f"https://drive.example.com/file/d/{fileId}/view",
+                "md5Checksum": dataset.md5(fileId),
+                "size": str(dataset.pdf_size),
+            }
+        return self._service._request('drive.files.get', handler, fileId=fileId, fields=fields)
+
+    def get_media(self, fileId: str, **kwargs):
+        request = self._service._request('drive.files.get_media', lambda: None, fileId=fileId)
+        # MediaIoBaseDownload pide los bloques a `request.http` con esta URI
+        request.uri = f"fake-media://{fileId}"
+        return request
+
+
+class _FakeChanges:
+    def __init__(self, service: FakeDriveService):
+        self._service = service
+
+    def getStartPageToken(self, **kwargs):
+        return self._service._request('drive.changes.getStartPageToken', lambda: {"startPageToken": "1"})
+
+    def list(self, pageToken: str, **kwargs):
+        # Los datos sintéticos no cambian en Drive: el feed siempre está vacío
+        return self._service._request(
+            'drive.changes.list', lambda: {"changes": [], "newStartPageToken": pageToken}, pageToken=pageToken)
+
+
+class FakeBatch:
+    """Equivalente a `BatchHttpRequest`: una latencia para todo el lote."""
+
+    def __init__(self, service: FakeDriveService, callback):
+        self._service = service
+        self._callback = callback
+        self._requests: list[tuple[str, FakeRequest]] = []
+
+    def add(self, request: FakeRequest, request_id: str | None = None, callback=None):
+        self._requests.append((request_id or str(len(self._requests)), request))
+
+    def execute(self, http=None):
+        self._service.calls['drive.batch'] += 1
+        self._service.latency.wait()
+        for request_id, request in self._requests:
+            try:
+                response, exception = request._handler(), None
+            except HttpError as e:
+                response, exception = None, e
+            self._callback(request_id, response, exception)
+
+
+class FakeHttp:
+    """Transporte para `MediaIoBaseDownload`: sirve los PDFs sintéticos por rangos de bytes."""
+
+    def __init__(self, dataset: SyntheticDataset, latency: Latency, calls: Counter):
+        self.dataset = dataset
+        self.latency = latency
+        self.calls = calls
+
+    def request(self, uri: str, method: str = 'GET', body=None, headers=None, **kwargs):
+        self.calls['drive.media.chunk'] += 1
+        self.latency.wait()
+        file_id = uri.removeprefix('fake-media://')
+        if file_id not in self.dataset.files:
+            return httplib2.Response({'status': '404'}), b''
+        content = self.dataset.pdf_bytes(file_id)
+        start, end = 0, len(content) - 1
+        byte_range = (headers or {}).get('range')
+        if byte_range:
+            first, _, last = byte_range.removeprefix('bytes=').partition('-')
+            start, end = int(first), min(int(last or end), end)
+        response = httplib2.Response({
+            'status': '206',
+            'content-range': f"bytes {start}-{end}/{len(content)}",
+            'content-length': str(end - start + 1),
+        })
+        return response, content[start:end + 1]
+
+
+# --- Resend ---
+
+class FakeResend:
+    """Sustituto de `resend.Emails.send`: registra los envíos y respeta la idempotencia."""
+
+    def __init__(self, latency: Latency, failure_rate: float = 0.0, seed: int = 13):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent: dict[str, str] = {}
+        self.calls = 0
+        self.attachment_bytes = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def send(self, params: dict, options: dict | None = None) -> dict:
+        self.latency.wait()
+        key = (options or {}).get('idempotency_key') or uuid.uuid4().hex
+        with self._lock:
+            self.calls += 1
+            if self._rng.random() < self.failure_rate:
+                raise RuntimeError("Fallo simulado de Resend")
+            self.attachment_bytes += sum(len(a['content']) for a in params.get('attachments', []))
+            email_id = self.sent.setdefault(key, uuid.uuid4().hex)
+        return {"id": email_id}
+
+
+class FakeBackend:
+    def __init__(self, dataset: SyntheticDataset, sheets: FakeSheetService, drive: FakeDriveService,
+                 http: FakeHttp, resend: FakeResend):
+        self.dataset = dataset
+        self.sheets = sheets
+        self.drive = drive
+        self.http = http
+        self.resend = resend
+
+    def upstream_calls(self) -> Counter:
+        calls = Counter(self.sheets.calls) + Counter(self.drive.calls)
+        calls['resend.emails.send'] = self.resend.calls
+        return calls
+
+
+def install(dataset: SyntheticDataset, google_latency_ms: float = 50.0, resend_latency_ms: float = 150.0,
+            resend_failure_rate: float = 0.0) -> FakeBackend:
+    """Conecta los servicios simulados a la app en lugar de Google y Resend."""
+    import resend
+
+    import google_async
+    import google_clients
+
+    sheets = FakeSheetService(dataset, Latency(google_latency_ms))
+    drive = FakeDriveService(dataset, Latency(google_latency_ms))
+    http = FakeHttp(dataset, Latency(google_latency_ms / 2), drive.calls)
+    fake_resend = FakeResend(Latency(resend_latency_ms), resend_failure_rate)
+
+    google_clients.use_services(sheets, drive)
+    # Las llamadas reciben este transporte en lugar del autorizado con las credenciales
+    google_async.thread_http = lambda: http
+    resend.Emails.send = fake_resend.send
+    return FakeBackend(dataset, sheets, drive, http, fake_resend)
@@ -0,0 +1,51 @@
+"""
+Enlaces de descarga firmados y con vencimiento para los PDFs demasiado grandes para adjuntar.
+
+El enlace apunta a `/pdf/{file_id}/download` e incluye la versión (MD5) del archivo, el
+nombre con el que se descarga, el vencimiento y una firma HMAC-SHA256 de todo eso con
+`DOWNLOAD_LINK_SECRET`. El endpoint sólo sirve el archivo si la firma es válida y el
+enlace no venció. Requiere `PUBLIC_BASE_URL` (la URL pública del backend) y
+`DOWNLOAD_LINK_SECRET`; sin ellos los PDFs se siguen adjuntando siempre.
+"""
+
+import hashlib
+import hmac
+import os
+import time
+from urllib.parse import quote, urlencode
+
+
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip('/')
+DOWNLOAD_LINK_SECRET = os.getenv("DOWNLOAD_LINK_SECRET", "")
+# Validez (segundos) de un enlace de descarga
+DOWNLOAD_LINK_TTL = int(os.getenv("DOWNLOAD_LINK_TTL", str(7 * 24 * 60 * 60)))
+# El vencimiento se redondea a la hora: los reintentos de un envío generan el mismo enlace
+# y Resend los reconoce como el mismo email por su clave de idempotencia
+_EXPIRY_ROUNDING = 3600
+
+
+def links_enabled() -> bool:
+    return bool(PUBLIC_BASE_URL and DOWNLOAD_LINK_SECRET)
+
+
+def signed_download_url(file_id: str, version: str | None, filename: str, ttl: int = DOWNLOAD_LINK_TTL) -> tuple[str, int]:
+    """URL firmada para descargar el PDF y el momento (epoch) en que vence."""
+    expires = (int(time.time()) + ttl) // _EXPIRY_ROUNDING * _EXPIRY_ROUNDING + _EXPIRY_ROUNDING
+    query = urlencode({
+        "v": version or '',
+        "name": filename,
+        "expires": expires,
+        "signature": _signature(file_id, version or '', filename, expires),
+    })
+    return f"{PUBLIC_BASE_URL}/pdf/{quote(file_id, safe='')}/download?{query}", expires
+
+
+def valid_signature(file_id: str, version: str, filename: str, expires: int, signature: str) -> bool:
+    if not DOWNLOAD_LINK_SECRET:
+        return False
+    return hmac.compare_digest(_signature(file_id, version, filename, expires), signature)
+
+
+def _signature(file_id: str, version: str, filename: str, expires: int) -> str:
+    message = '\n'.join((file_id, version, filename, str(expires))).encode('utf-8')
+    return hmac.new(DOWNLOAD_LINK_SECRET.encode('utf-8'), message, hashlib.sha256).hexdigest()
@@ -0,0 +1,338 @@
+"""
+Índice incremental de las carpetas de PDFs en Google Drive.
+
+Cada carpeta se lista completa (paginando) una sola vez; a partir de ahí sólo se
+aplican los cambios que informa el feed de cambios de Drive (`changes().list` con
+`startPageToken`), que se consulta en segundo plano. Servir una página cuesta así una
+búsqueda en un diccionario en lugar de un `files().list` contra Drive.
+
+Con un `SheetMirror`, los índices y el token del feed se guardan en el espejo local: al
+arrancar se restauran y sólo se aplican los cambios ocurridos desde entonces.
+
+Con un `CacheBackend` compartido, sólo un worker lista cada carpeta: los demás toman el
+listado publicado junto con su token y se ponen al día con el feed de cambios. Si un
+worker descarta los índices (token del feed inválido), los demás también lo hacen.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+
+import google_async
+from pdf_matcher import PdfNameMatcher
+from shared_cache import CacheBackend, LocalCacheBackend
+from sheet_mirror import SheetMirror
+
+
+PDF_MIME_TYPE = "application/pdf"
+DRIVE_LIST_PAGE_SIZE = 1000
+# Intervalo (segundos) entre consultas al feed de cambios de Drive
+DRIVE_CHANGES_POLL_INTERVAL = float(os.getenv("DRIVE_CHANGES_POLL_INTERVAL", "30"))
+
+# Espacio de nombres de los listados de carpetas en el backend compartido
+_SHARED_FOLDERS = 'drive_folders'
+
+
+class FolderIndex:
+    """Archivos PDF de una carpeta de Drive, en el orden en que se conocieron."""
+
+    def __init__(self, folder_id: str):
+        self.folder_id = folder_id
+        self.files: dict[str, str] = {}  # { file_id: nombre }
+        # Contador local de cambios (sólo para memorizar derivados en este proceso)
+        self.generation = 0
+        self._fingerprint: str | None = None
+        self._name_map: dict[str, str] | None = None
+        self._matcher: PdfNameMatcher | None = None
+
+    def replace_all(self, drive_files: list[dict]) -> None:
+        self.files = {file['id']: file['name'] for file in drive_files}
+        self._touch()
+
+    def upsert(self, file_id: str, name: str) -> bool:
+        if self.files.get(file_id) != name:
+            self.files[file_id] = name
+            self._touch()
+            return True
+        return False
+
+    def remove(self, file_id: str) -> bool:
+        if self.files.pop(file_id, None) is not None:
+            self._touch()
+            return True
+        return False
+
+    def fingerprint(self) -> str:
+        """
+        Huella del contenido del listado. A diferencia de `generation`, es la misma en todos
+        los workers (y tras un reinicio) para el mismo listado, así que sirve para los ETags.
+        """
+        if self._fingerprint is None:
+            content = json.dumps(sorted(self.files.items()), ensure_ascii=False, separators=(',', ':'))
+            self._fingerprint = hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+        return self._fingerprint
+
+    def name_map(self) -> dict[str, str]:
+        """
+        Mapa { 'nombre_del_archivo.pdf': 'id_del_archivo' } con nombres en minúsculas,
+        igual al que antes se construía en cada petición. Se reconstruye sólo si hubo cambios.
+        """
+        if self._name_map is None:
+            self._name_map = {name.lower(): file_id for file_id, name in self.files.items()}
+        return self._name_map
+
+    def matcher(self) -> PdfNameMatcher:
+        """Índice de búsqueda de nombres, construido una vez por versión del listado."""
+        if self._matcher is None:
+            self._matcher = PdfNameMatcher(self.name_map())
+        return self._matcher
+
+    def _touch(self) -> None:
+        self.generation += 1
+        self._fingerprint = None
+        self._name_map = None
+        self._matcher = None
+
+
+class DriveFolderIndexer:
+    """Mantiene un `FolderIndex` por carpeta, sincronizado con el feed de cambios de Drive."""
+
+    def __init__(
+        self,
+        get_drive_service,
+        poll_interval: float = DRIVE_CHANGES_POLL_INTERVAL,
+        mirror: SheetMirror | None = None,
+        shared: CacheBackend | None = None,
+    ):
+        self._get_drive_service = get_drive_service
+        self.poll_interval = poll_interval
+        self._folders: dict[str, FolderIndex] = {}
+        self._load_locks: dict[str, asyncio.Lock] = {}
+        self._sync_lock = asyncio.Lock()
+        self._page_token: str | None = None
+        self._mirror = mirror
+        self._restore_lock = asyncio.Lock()
+        self._restored = mirror is None
+        self._shared = shared or LocalCacheBackend()
+        self._invalidation_cursor: int | None = None
+        self.hits = 0
+        self.misses = 0
+
+    async def get_folder(self, folder_id: str) -> FolderIndex:
+        await self._apply_shared_invalidations()
+        folder = self._folders.get(folder_id)
+        if folder is not None:
+            self.hits += 1
+            return folder
+
+        self.misses += 1
+        lock = self._load_locks.setdefault(folder_id, asyncio.Lock())
+        async with lock:
+            await self._restore_from_mirror()
+            folder = self._folders.get(folder_id)
+            if folder is None:
+                async with self._shared.refresh_lock(_SHARED_FOLDERS, folder_id):
+                    folder = await self._adopt_shared_folder(folder_id)
+                    if folder is None:
+                        # El token se obtiene antes del listado para no perder cambios intermedios
+                        await self._ensure_page_token()
+                        listed_at = self._page_token
+                        folder = FolderIndex(folder_id)
+                        folder.replace_all(await self._list_folder(folder_id))
+                        await self._publish_folder(folder, listed_at)
+                self._folders[folder_id] = folder
+                if self._mirror is not None:
+                    await self._mirror.save_folder(folder_id, folder.files, self._page_token)
+        return folder
+
+    async def _apply_shared_invalidations(self) -> None:
+        """Descarta las carpetas que otro worker invalidó en la caché compartida."""
+        try:
+            self._invalidation_cursor, prefixes = await self._shared.poll_invalidations(
+                _SHARED_FOLDERS, self._invalidation_cursor
+            )
+        except Exception as e:
+            print(f"ERROR: No se pudieron leer las invalidaciones compartidas de carpetas: {e}")
+            return
+        for prefix in prefixes:
+            if not prefix:
+                # Todas las carpetas: el token del feed tampoco sirve
+                self._reset()
+                continue
+            for folder_id in [folder_id for folder_id in self._folders if folder_id.startswith(prefix)]:
+                del self._folders[folder_id]
+
+    async def _adopt_shared_folder(self, folder_id: str) -> FolderIndex | None:
+        """
+        Toma el listado que publicó otro worker. Como el feed informa el estado actual de
+        cada archivo, volver a aplicar cambios desde un token anterior es inofensivo: se
+        continúa desde el más antiguo de los dos tokens.
+        """
+        try:
+            stored = await self._shared.get(_SHARED_FOLDERS, folder_id)
+        except Exception as e:
+            print(f"ERROR: No se pudo leer la carpeta {folder_id} de la caché compartida: {e}")
+            return None
+        if stored is None:
+            return None
+        page_token = _older_token(self._page_token, stored['page_token'])
+        if page_token is None:
+            return None
+        self._page_token = page_token
+        folder = FolderIndex(folder_id)
+        folder.files = dict(stored['files'])
+        return folder
+
+    async def _publish_folder(self, folder: FolderIndex, page_token: str | None) -> None:
+        try:
+            await self._shared.set(_SHARED_FOLDERS, folder.folder_id, {"files": dict(folder.files), "page_token": page_token})
+        except Exception as e:
+            print(f"ERROR: No se pudo publicar la carpeta {folder.folder_id} en la caché compartida: {e}")
+
+    async def _restore_from_mirror(self) -> None:
+        """Restaura (una vez) los índices del espejo local y los pone al día con el feed."""
+        if self._restored:
+            return
+        async with self._restore_lock:
+            if self._restored:
+                return
+            self._restored = True
+            try:
+                page_token, folders = await self._mirror.load_drive_state()
+            except Exception as e:
+                print(f"ERROR: No se pudieron leer las carpetas del espejo local: {e}")
+                return
+            if page_token is None or self._page_token is not None or not folders:
+                return
+
+            self._page_token = page_token
+            for folder_id, files in folders.items():
+                folder = FolderIndex(folder_id)
+                folder.files = files
+                self._folders[folder_id] = folder
+            try:
+                await self.sync_changes()
+            except Exception as e:
+                # Se sirve la copia local; el bucle de sincronización reintentará
+                print(f"ERROR: Fallo al poner al día las carpetas restauradas: {e}")
+
+    async def _list_folder(self, folder_id: str) -> list[dict]:
+        """Listado completo y paginado de los PDFs de una carpeta."""
+        drive_service = self._get_drive_service()
+        query = f"'{folder_id}' in parents and mimeType = '{PDF_MIME_TYPE}' and trashed = false"
+        drive_files = []
+        page_token = None
+        while True:
+            drive_response = await google_async.execute(drive_service.files().list(
+                q=query,
+                spaces='drive',
+                pageSize=DRIVE_LIST_PAGE_SIZE,
+                pageToken=page_token,
+                fields='nextPageToken, files(id, name)'
+            ))
+            drive_files.extend(drive_response.get('files', []))
+            page_token = drive_response.get('nextPageToken')
+            if not page_token:
+                return drive_files
+
+    async def _ensure_page_token(self) -> None:
+        if self._page_token is None:
+            response = await google_async.execute(
+                self._get_drive_service().changes().getStartPageToken()
+            )
+            self._page_token = response.get('startPageToken')
+
+    async def sync_changes(self) -> int:
+        """Aplica los cambios pendientes del feed de Drive. Devuelve cuántos se procesaron."""
+        if self._page_token is None or not self._folders:
+            return 0
+
+        async with self._sync_lock:
+            drive_service = self._get_drive_service()
+            processed = 0
+            mirror_changes = []
+            start_token = page_token = self._page_token
+            while page_token:
+                response = await google_async.execute(drive_service.changes().list(
+                    pageToken=page_token,
+                    spaces='drive',
+                    pageSize=DRIVE_LIST_PAGE_SIZE,
+                    fields='nextPageToken, newStartPageToken, '
+                           'changes(fileId, removed, file(name, parents, mimeType, trashed))'
+                ))
+                for change in response.get('changes', []):
+                    mirror_changes.extend(self._apply_change(change))
+                    processed += 1
+
+                if response.get('newStartPageToken'):
+                    self._page_token = response['newStartPageToken']
+                page_token = response.get('nextPageToken')
+
+            if self._mirror is not None and (mirror_changes or self._page_token != start_token):
+                await self._mirror.apply_drive_changes(mirror_changes, self._page_token)
+            return processed
+
+    def _apply_change(self, change: dict) -> list[tuple[str, str, str | None]]:
+        """Aplica un cambio a las carpetas. Devuelve (carpeta, archivo, nombre o None) por carpeta afectada."""
+        file_id = change.get('fileId')
+        file = change.get('file') or {}
+        is_live_pdf = (
+            not change.get('removed')
+            and not file.get('trashed')
+            and file.get('mimeType') == PDF_MIME_TYPE
+        )
+        parents = set(file.get('parents') or [])
+        applied = []
+        for folder in self._folders.values():
+            if is_live_pdf and folder.folder_id in parents:
+                if folder.upsert(file_id, file.get('name', '')):
+                    applied.append((folder.folder_id, file_id, file.get('name', '')))
+            elif folder.remove(file_id):
+                # Eliminado, enviado a la papelera o movido fuera de la carpeta
+                applied.append((folder.folder_id, file_id, None))
+        return applied
+
+    def _reset(self) -> None:
+        """Descarta el token y los índices; se vuelven a listar en el próximo acceso."""
+        self._page_token = None
+        self._folders.clear()
+
+    async def run_forever(self) -> None:
+        """Bucle de sincronización en segundo plano (se lanza desde el lifespan de la app)."""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._apply_shared_invalidations()
+                await self.sync_changes()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"ERROR: Fallo al sincronizar cambios de Google Drive: {e}")
+                # Un token inválido (p. ej. 410/404) obliga a reconstruir los índices
+                status = getattr(getattr(e, 'resp', None), 'status', None)
+                if status in (400, 404, 410):
+                    self._reset()
+                    try:
+                        await self._shared.invalidate(_SHARED_FOLDERS)
+                    except Exception as shared_error:
+                        print(f"ERROR: No se pudo invalidar la caché compartida de carpetas: {shared_error}")
+                    if self._mirror is not None:
+                        try:
+                            await self._mirror.clear_drive_state()
+                        except Exception as mirror_error:
+                            print(f"ERROR: No se pudo limpiar el espejo de carpetas: {mirror_error}")
+
+
+def _older_token(local: str | None, shared: str | None) -> str | None:
+    """
+    El más antiguo de dos tokens del feed de cambios, o None si no se pueden comparar.
+    Drive los emite como enteros crecientes; si no lo son, sólo se aceptan iguales.
+    """
+    if shared is None:
+        return None
+    if local is None or local == shared:
+        return shared
+    if local.isdigit() and shared.isdigit():
+        return min(local, shared, key=int)
+    return None
@@ -0,0 +1,156 @@
+"""
+Caché LRU con expiración de metadatos de archivos de Google Drive.
+
+El enlace de visualización de un archivo prácticamente no cambia, así que `/pdf/{file_id}`
+lo sirve desde esta caché. Los IDs que faltan se resuelven juntos con peticiones por
+lotes de Drive (hasta 100 por petición HTTP), y al servir una página de la hoja se
+precargan en segundo plano los de sus PDFs. Con un `CacheBackend` compartido, los
+metadatos que resolvió un worker los reutilizan los demás.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+import google_async
+from shared_cache import CacheBackend, LocalCacheBackend
+
+
+DRIVE_METADATA_TTL = float(os.getenv("DRIVE_METADATA_TTL", str(6 * 60 * 60)))
+DRIVE_METADATA_MAX_ENTRIES = int(os.getenv("DRIVE_METADATA_MAX_ENTRIES", "10000"))
+DRIVE_METADATA_FIELDS = 'id, name, webViewLink'
+# Límite de llamadas por petición por lotes de la API de Drive
+DRIVE_BATCH_LIMIT = 100
+
+# Espacio de nombres de los metadatos en el backend compartido
+_SHARED_METADATA = 'drive_metadata'
+
+
+class DriveMetadataCache:
+    def __init__(
+        self,
+        get_drive_service,
+        ttl: float = DRIVE_METADATA_TTL,
+        max_entries: int = DRIVE_METADATA_MAX_ENTRIES,
+        shared: CacheBackend | None = None,
+    ):
+        self._get_drive_service = get_drive_service
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._prefill_tasks: set[asyncio.Task] = set()
+        self._shared = shared or LocalCacheBackend()
+
+    def peek(self, file_id: str) -> dict | None:
+        """Metadatos en caché y vigentes, sin consultar a Drive."""
+        entry = self._entries.get(file_id)
+        if entry is None:
+            return None
+        expires_at, metadata = entry
+        if expires_at < time.monotonic():
+            del self._entries[file_id]
+            return None
+        self._entries.move_to_end(file_id)
+        return metadata
+
+    async def get(self, file_id: str) -> dict:
+        return (await self.get_many([file_id]))[file_id]
+
+    async def get_many(self, file_ids: list[str]) -> dict[str, dict]:
+        """
+        Metadatos de varios archivos. Los que no están en caché se piden a Drive en lotes;
+        un archivo inexistente o inaccesible lanza el error de Drive si es el único pedido y
+        en otro caso se omite del resultado.
+        """
+        results, missing = {}, []
+        for file_id in dict.fromkeys(file_ids):
+            metadata = self.peek(file_id)
+            if metadata is None:
+                missing.append(file_id)
+            else:
+                results[file_id] = metadata
+        missing = await self._load_shared(missing, results)
+        self.hits += len(results)
+        self.misses += len(missing)
+
+        if len(missing) == 1 and len(file_ids) == 1:
+            metadata = await google_async.execute(self._get_drive_service().files().get(
+                fileId=missing[0], fields=DRIVE_METADATA_FIELDS))
+            self._store(missing[0], metadata)
+            await self._publish({missing[0]: metadata})
+            results[missing[0]] = metadata
+            return results
+
+        for start in range(0, len(missing), DRIVE_BATCH_LIMIT):
+            fetched = await self._fetch_batch(missing[start:start + DRIVE_BATCH_LIMIT])
+            for file_id, metadata in fetched.items():
+                self._store(file_id, metadata)
+            await self._publish(fetched)
+            results.update(fetched)
+        return results
+
+    async def _load_shared(self, file_ids: list[str], results: dict[str, dict]) -> list[str]:
+        """Completa `results` con la caché compartida; devuelve los IDs que siguen faltando."""
+        if not file_ids:
+            return file_ids
+        try:
+            stored = await self._shared.get_many(_SHARED_METADATA, file_ids)
+        except Exception as e:
+            print(f"ERROR: No se pudo leer la caché compartida de metadatos: {e}")
+            return file_ids
+        for file_id, metadata in stored.items():
+            self._store(file_id, metadata)
+            results[file_id] = metadata
+        return [file_id for file_id in file_ids if file_id not in stored]
+
+    async def _publish(self, fetched: dict[str, dict]) -> None:
+        try:
+            await self._shared.set_many(_SHARED_METADATA, fetched, ttl=self.ttl)
+        except Exception as e:
+            print(f"ERROR: No se pudieron publicar los metadatos en la caché compartida: {e}")
+
+    def prefill(self, file_ids) -> None:
+        """Precarga en segundo plano los metadatos que no estén en caché."""
+        missing = [file_id for file_id in dict.fromkeys(file_ids) if file_id and self.peek(file_id) is None]
+        if not missing:
+            return
+        task = asyncio.create_task(self._prefill_quietly(missing))
+        self._prefill_tasks.add(task)
+        task.add_done_callback(self._prefill_tasks.discard)
+
+    async def _prefill_quietly(self, file_ids: list[str]) -> None:
+        try:
+            await self.get_many(file_ids)
+        except Exception as e:
+            print(f"ERROR: Fallo al precargar metadatos de Google Drive: {e}")
+
+    async def _fetch_batch(self, file_ids: list[str]) -> dict[str, dict]:
+        """Una petición HTTP por lotes de Drive para hasta `DRIVE_BATCH_LIMIT` archivos."""
+        drive_service = self._get_drive_service()
+        fetched: dict[str, dict] = {}
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                fetched[request_id] = response
+            else:
+                print(f"ERROR: No se pudieron obtener los metadatos de {request_id}: {exception}")
+
+        batch = drive_service.new_batch_http_request(callback=callback)
+        for file_id in file_ids:
+            batch.add(drive_service.files().get(fileId=file_id, fields=DRIVE_METADATA_FIELDS), request_id=file_id)
+        # Cada llamada del lote cuenta para la cuota de Drive
+        await google_async.throttle('drive', len(file_ids))
+        await google_async.run_blocking(
+            lambda: batch.execute(http=google_async.thread_http()),
+            label='drive.batch',
+        )
+        return fetched
+
+    def _store(self, file_id: str, metadata: dict) -> None:
+        self._entries[file_id] = (time.monotonic() + self.ttl, metadata)
+        self._entries.move_to_end(file_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,153 @@
+"""
+Envío de PDFs de Google Drive por email (Resend) y marcado de 'Enviado' en la hoja.
+
+Lo usan tanto el envío individual (`/send_pdf_email`) como el envío masivo: un envío
+toma el PDF de la caché en disco, lo codifica en Base64 y lo manda con Resend; las marcas de 'Enviado'
+de un lote se escriben con un único `values.batchUpdate`. Los PDFs de más de
+`EMAIL_INLINE_MAX_BYTES` no se adjuntan: el email lleva un enlace de descarga firmado y
+con vencimiento (`download_links.py`).
+"""
+
+import asyncio
+import hashlib
+import html
+import os
+import time
+
+import resend
+
+import download_links
+import google_async
+import metrics
+from pdf_cache import PdfDiskCache, encode_file_base64
+from tabs import TabConfig
+
+
+# Resend API Configuration
+RESEND_API_KEY = os.getenv("RESEND_API_KEY")
+RESEND_FROM_EMAIL = os.getenv("RESEND_FROM_EMAIL")
+if RESEND_API_KEY:
+    resend.api_key = RESEND_API_KEY
+
+SENT_MARKER = 'Enviado'
+
+# Tamaño máximo (bytes) de un PDF para adjuntarlo; los más grandes se envían como enlace
+EMAIL_INLINE_MAX_BYTES = int(os.getenv("EMAIL_INLINE_MAX_BYTES", str(5 * 1024 * 1024)))
+
+
+class EmailDeliveryError(Exception):
+    """Resend no confirmó el envío del email."""
+
+
+async def send_pdf_email_via_resend(
+    pdf_cache: PdfDiskCache,
+    pdf_drive_id: str,
+    recipient_email: str,
+    subject: str,
+    body_text: str,
+    filename: str,
+    idempotency_key: str | None = None,
+) -> str:
+    """
+    Obtiene el PDF (de la caché en disco o descargándolo de Drive) y lo envía adjunto, o
+    como enlace de descarga si supera `EMAIL_INLINE_MAX_BYTES`. Devuelve el ID del email en Resend.
+    Con `idempotency_key`, Resend descarta los reintentos del mismo envío.
+    """
+    # 1. Fetch PDF content from Google Drive (descarga por bloques a la caché en disco)
+    with metrics.stage('email.pdf_fetch'):
+        pdf_file, pdf_version = await pdf_cache.open_versioned(pdf_drive_id)
+    with pdf_file:
+        pdf_size = os.fstat(pdf_file.fileno()).st_size
+        metrics.EMAIL_ATTACHMENT_SIZE.observe(pdf_size)
+
+        email = {
+            "from": RESEND_FROM_EMAIL,
+            "to": recipient_email,
+            "subject": subject,
+            "html": "<p>" + body_text.replace('\n', '<br>') + "</p>",
+        }
+        if pdf_size > EMAIL_INLINE_MAX_BYTES and download_links.links_enabled():
+            # 2a. PDF grande: se envía un enlace firmado a la copia en disco en lugar del Base64
+            url, expires = download_links.signed_download_url(pdf_drive_id, pdf_version, filename)
+            email["html"] += (
+                f'<p><a href="{html.escape(url)}">Descargar {html.escape(filename)}</a> '
+                f'(disponible hasta el {time.strftime("%d/%m/%Y", time.localtime(expires))}).</p>'
+            )
+            metrics.EMAIL_DELIVERY_MODE.inc('link')
+        else:
+            # 2b. Encode PDF content to Base64, leyendo el archivo por partes
+            with metrics.stage('email.encode'):
+                encoded_file = await asyncio.to_thread(encode_file_base64, pdf_file)
+            email["attachments"] = [
+                {
+                    "filename": filename,
+                    "content": encoded_file,
+                }
+            ]
+            metrics.EMAIL_DELIVERY_MODE.inc('attachment')
+
+    # 3. Send email using Resend
+    # resend es bloqueante: se ejecuta fuera del event loop
+    options = {"idempotency_key": idempotency_key} if idempotency_key else None
+    async with metrics.upstream_call('resend', 'emails.send'):
+        r = await asyncio.to_thread(resend.Emails.send, email, options)
+
+    if r and r.get('id'): # Resend API typically returns an ID on success
+        return r['id']
+    raise EmailDeliveryError("Respuesta inesperada de Resend.")
+
+
+def email_idempotency_key(sheet_name: str, sheet_row_number: int, pdf_drive_id: str, recipient_email: str) -> str:
+    """Clave estable de un envío: la misma fila, PDF y destinatario nunca se envían dos veces."""
+    raw = f"{sheet_name}|{sheet_row_number}|{pdf_drive_id}|{recipient_email.strip().lower()}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def status_cell_range(sheet_name: str, column_letter: str, sheet_row_number: int) -> str:
+    return f"{sheet_name}!{column_letter}{sheet_row_number}"
+
+
+async def mark_as_sent(sheet_service, spreadsheet_id: str, cell_ranges: list[str]) -> None:
+    """Escribe 'Enviado' en las celdas indicadas con una sola llamada a la API de Sheets."""
+    if not cell_ranges:
+        return
+
+    values = sheet_service.spreadsheets().values()
+    if len(cell_ranges) == 1:
+        request = values.update(
+            spreadsheetId=spreadsheet_id,
+            range=cell_ranges[0],
+            valueInputOption="USER_ENTERED",
+            body={'values': [[SENT_MARKER]]}
+        )
+    else:
+        request = values.batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body={
+                'valueInputOption': "USER_ENTERED",
+                'data': [{'range': cell_range, 'values': [[SENT_MARKER]]} for cell_range in cell_ranges],
+            }
+        )
+    await google_async.execute(request)
+
+
+def email_fields_for_row(tab: TabConfig, headers: list[str], row: dict) -> dict:
+    """
+    Asunto, cuerpo y nombre de archivo del email de una fila, con las mismas plantillas
+    que usan las páginas del frontend.
+    """
+    name_header = next((h for h in headers if h.lower() in tab.name_headers), None)
+    surname_header = next((h for h in headers if h.lower() in tab.surname_headers), None)
+    nombre = (row.get(name_header) if name_header else None) or ''
+    apellido = (row.get(surname_header) if surname_header else None) or ''
+
+    sentence = tab.body_template.format(nombre=nombre, apellido=apellido)
+    return {
+        "subject": tab.subject_template.format(nombre=nombre, apellido=apellido),
+        "body_text": f"Estimado/a,\n\n{sentence}\n\nSaludos,\nRecursos Humanos Traful",
+        "filename": f"{tab.filename_prefix}_{nombre}_{apellido}.pdf",
+    }
+
+
+def find_email_header(headers: list[str]) -> str | None:
+    return next((h for h in headers if h.lower() == 'email'), None)
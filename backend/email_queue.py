@@ -0,0 +1,323 @@
+"""
+Cola persistente (SQLite) de envíos de email con un pool de workers en el proceso.
+
+`/send_pdf_email` sólo encola el trabajo y responde `202` con su ID; los workers lo
+procesan en segundo plano con reintentos y espera exponencial. Cada trabajo tiene una
+clave de idempotencia única: encolar dos veces la misma fila devuelve el trabajo
+existente, y la misma clave se envía a Resend para que un reintento tras un fallo
+intermedio no duplique el email.
+
+El worker que toma un trabajo lo reserva por `EMAIL_JOB_LEASE` segundos y renueva la
+reserva mientras lo procesa. Si el proceso muere, la reserva vence y otro worker (de
+este u otro proceso) retoma el trabajo; los que siguen en curso no se tocan.
+"""
+
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+
+EMAIL_QUEUE_DB = os.getenv(
+    "EMAIL_QUEUE_DB",
+    os.path.join(os.path.dirname(__file__), 'data', 'email_jobs.sqlite3'),
+)
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+EMAIL_JOB_MAX_ATTEMPTS = int(os.getenv("EMAIL_JOB_MAX_ATTEMPTS", "5"))
+EMAIL_JOB_RETRY_BASE_DELAY = float(os.getenv("EMAIL_JOB_RETRY_BASE_DELAY", "5"))
+EMAIL_JOB_RETRY_MAX_DELAY = 300.0
+# Duración (segundos) de la reserva de un trabajo en curso; se renueva cada tercio
+EMAIL_JOB_LEASE = float(os.getenv("EMAIL_JOB_LEASE", "60"))
+# Espera máxima de un worker ocioso antes de volver a mirar la cola
+_IDLE_POLL_INTERVAL = 5.0
+# Espera inicial de un worker tras un error inesperado (p. ej. SQLite bloqueado); se duplica
+# con cada error seguido hasta _IDLE_POLL_INTERVAL
+_ERROR_BACKOFF = 0.5
+# Segundos que una conexión espera a que otro proceso suelte la base antes de fallar
+_BUSY_TIMEOUT = 30
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_jobs (
+    id TEXT PRIMARY KEY,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    progress TEXT NOT NULL DEFAULT '{}',
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    claimed_by TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS email_jobs_pending ON email_jobs (status, next_attempt_at);
+"""
+# Columnas agregadas después de crear la tabla; se suman a las bases existentes al abrirlas
+_ADDED_COLUMNS = (('claimed_by', 'TEXT'), ('lease_until', 'REAL'))
+
+
+class EmailJobQueue:
+    """
+    `handler(job, save_progress)` procesa un trabajo. `job['progress']` conserva lo que ya
+    se completó en intentos anteriores (p. ej. el ID del email enviado) y `save_progress`
+    lo persiste antes de pasar a la siguiente etapa.
+    """
+
+    def __init__(
+        self,
+        handler,
+        db_path: str = EMAIL_QUEUE_DB,
+        workers: int = EMAIL_WORKERS,
+        max_attempts: int = EMAIL_JOB_MAX_ATTEMPTS,
+        retry_base_delay: float = EMAIL_JOB_RETRY_BASE_DELAY,
+        lease: float = EMAIL_JOB_LEASE,
+    ):
+        self._handler = handler
+        self.db_path = db_path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.lease = lease
+        # Identifica a este proceso en las reservas de trabajos
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._db_lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    # --- Ciclo de vida ---
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self._open)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        with self._db_lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(
+                    self.db_path, check_same_thread=False, isolation_level=None, timeout=_BUSY_TIMEOUT
+                )
+                self._conn.row_factory = sqlite3.Row
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.executescript(_SCHEMA)
+                columns = {row[1] for row in self._conn.execute("PRAGMA table_info(email_jobs)")}
+                for column, column_type in _ADDED_COLUMNS:
+                    if column not in columns:
+                        self._conn.execute(f"ALTER TABLE email_jobs ADD COLUMN {column} {column_type}")
+
+    # --- API pública ---
+
+    async def enqueue(self, payload: dict, idempotency_key: str) -> tuple[dict, bool]:
+        """
+        Encola un trabajo. Si ya existe uno con la misma clave se devuelve ese (y `False`),
+        salvo que hubiera fallado definitivamente, en cuyo caso se vuelve a encolar.
+        """
+        job, created = await asyncio.to_thread(self._enqueue, payload, idempotency_key)
+        if created:
+            self._wakeup.set()
+        return job, created
+
+    async def get(self, job_id: str) -> dict | None:
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def pending_count(self) -> int:
+        """Trabajos encolados o en curso."""
+        return await asyncio.to_thread(self._pending_count)
+
+    # --- Acceso a SQLite (se ejecuta en hilos, serializado con _db_lock) ---
+
+    def _enqueue(self, payload: dict, idempotency_key: str) -> tuple[dict, bool]:
+        self._open()
+        now = time.time()
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT * FROM email_jobs WHERE idempotency_key = ?", (idempotency_key,)
+            ).fetchone()
+            if row is None:
+                job_id = uuid.uuid4().hex
+                self._conn.execute(
+                    "INSERT INTO email_jobs (id, idempotency_key, payload, status, next_attempt_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, idempotency_key, json.dumps(payload), STATUS_QUEUED, now, now, now),
+                )
+                created = True
+            elif row['status'] == STATUS_FAILED:
+                job_id = row['id']
+                self._conn.execute(
+                    "UPDATE email_jobs SET status = ?, attempts = 0, next_attempt_at = ?, last_error = NULL, "
+                    "payload = ?, updated_at = ? WHERE id = ?",
+                    (STATUS_QUEUED, now, json.dumps(payload), now, job_id),
+                )
+                created = True
+            else:
+                job_id = row['id']
+                created = False
+            return self._row_to_job(self._conn.execute("SELECT * FROM email_jobs WHERE id = ?", (job_id,)).fetchone()), created
+
+    def _get(self, job_id: str) -> dict | None:
+        self._open()
+        with self._db_lock:
+            row = self._conn.execute("SELECT * FROM email_jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else self._row_to_job(row)
+
+    def _pending_count(self) -> int:
+        self._open()
+        with self._db_lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM email_jobs WHERE status IN (?, ?)", (STATUS_QUEUED, STATUS_RUNNING)
+            ).fetchone()[0]
+
+    def _claim_next(self) -> tuple[dict | None, float | None]:
+        """
+        Toma el próximo trabajo listo (o uno en curso cuya reserva venció porque su worker
+        murió). Si no hay, devuelve cuándo vence el siguiente.
+        """
+        now = time.time()
+        # Los trabajos en curso sin reserva quedaron de antes de que existieran las reservas
+        claimable = "(status = ? OR (status = ? AND (lease_until IS NULL OR lease_until < ?)))"
+        with self._db_lock:
+            row = self._conn.execute(
+                f"SELECT * FROM email_jobs WHERE {claimable} ORDER BY next_attempt_at LIMIT 1",
+                (STATUS_QUEUED, STATUS_RUNNING, now),
+            ).fetchone()
+            if row is None:
+                return None, None
+            if row['next_attempt_at'] > now:
+                return None, row['next_attempt_at']
+            # Con varios procesos, otro worker pudo tomar el trabajo entre la consulta y el UPDATE
+            claimed = self._conn.execute(
+                "UPDATE email_jobs SET status = ?, attempts = attempts + 1, claimed_by = ?, lease_until = ?, "
+                f"updated_at = ? WHERE id = ? AND {claimable}",
+                (STATUS_RUNNING, self.origin, now + self.lease, now, row['id'], STATUS_QUEUED, STATUS_RUNNING, now),
+            ).rowcount
+            if not claimed:
+                return None, now
+            row = self._conn.execute("SELECT * FROM email_jobs WHERE id = ?", (row['id'],)).fetchone()
+        return self._row_to_job(row), None
+
+    # Las escrituras de un trabajo en curso sólo se aplican mientras este proceso lo tenga
+    # reservado: si la reserva venció, el trabajo ya es de otro worker
+
+    def _save_progress(self, job_id: str, progress: dict) -> None:
+        with self._db_lock:
+            self._conn.execute(
+                "UPDATE email_jobs SET progress = ?, updated_at = ? WHERE id = ? AND claimed_by = ?",
+                (json.dumps(progress), time.time(), job_id, self.origin),
+            )
+
+    def _renew_lease(self, job_id: str) -> bool:
+        now = time.time()
+        with self._db_lock:
+            return bool(self._conn.execute(
+                "UPDATE email_jobs SET lease_until = ? WHERE id = ? AND status = ? AND claimed_by = ?",
+                (now + self.lease, job_id, STATUS_RUNNING, self.origin),
+            ).rowcount)
+
+    def _finish(self, job_id: str, status: str, next_attempt_at: float | None = None, error: str | None = None) -> None:
+        now = time.time()
+        with self._db_lock:
+            self._conn.execute(
+                "UPDATE email_jobs SET status = ?, next_attempt_at = COALESCE(?, next_attempt_at), "
+                "last_error = ?, claimed_by = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND claimed_by = ?",
+                (status, next_attempt_at, error, now, job_id, self.origin),
+            )
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> dict:
+        return {
+            "id": row['id'],
+            "idempotency_key": row['idempotency_key'],
+            "payload": json.loads(row['payload']),
+            "status": row['status'],
+            "attempts": row['attempts'],
+            "next_attempt_at": row['next_attempt_at'],
+            "progress": json.loads(row['progress']),
+            "last_error": row['last_error'],
+            "created_at": row['created_at'],
+            "updated_at": row['updated_at'],
+        }
+
+    # --- Workers ---
+
+    async def _worker(self) -> None:
+        backoff = _ERROR_BACKOFF
+        while True:
+            # Un error inesperado no debe matar al worker: se registra y se reintenta más tarde
+            try:
+                await self._work_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"ERROR: Fallo el worker de la cola de emails; se reintenta en {backoff:.1f}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, _IDLE_POLL_INTERVAL)
+            else:
+                backoff = _ERROR_BACKOFF
+
+    async def _work_once(self) -> None:
+        """Procesa el próximo trabajo vencido o espera a que llegue uno."""
+        # Se limpia antes de mirar la cola para no perder un aviso de `enqueue`
+        self._wakeup.clear()
+        job, next_due = await asyncio.to_thread(self._claim_next)
+        if job is None:
+            wait = _IDLE_POLL_INTERVAL if next_due is None else min(max(next_due - time.time(), 0.05), _IDLE_POLL_INTERVAL)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+            return
+        await self._process(job)
+
+    async def _process(self, job: dict) -> None:
+        async def save_progress(progress: dict) -> None:
+            job['progress'] = progress
+            await asyncio.to_thread(self._save_progress, job['id'], progress)
+
+        heartbeat = asyncio.create_task(self._heartbeat(job['id']))
+        try:
+            await self._handler(job, save_progress)
+        except asyncio.CancelledError:
+            # Al detener el proceso el trabajo se devuelve a la cola sin esperar a que venza
+            await asyncio.to_thread(self._finish, job['id'], STATUS_QUEUED)
+            raise
+        except Exception as e:
+            print(f"ERROR: Fallo el intento {job['attempts']} del trabajo de email {job['id']}: {e}")
+            if job['attempts'] >= self.max_attempts:
+                await asyncio.to_thread(self._finish, job['id'], STATUS_FAILED, None, str(e))
+            else:
+                delay = min(self.retry_base_delay * 2 ** (job['attempts'] - 1), EMAIL_JOB_RETRY_MAX_DELAY)
+                delay *= random.uniform(0.8, 1.2)
+                await asyncio.to_thread(self._finish, job['id'], STATUS_QUEUED, time.time() + delay, str(e))
+            return
+        finally:
+            heartbeat.cancel()
+        await asyncio.to_thread(self._finish, job['id'], STATUS_SENT)
+
+    async def _heartbeat(self, job_id: str) -> None:
+        """Renueva la reserva del trabajo mientras se procesa."""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                if not await asyncio.to_thread(self._renew_lease, job_id):
+                    print(f"ERROR: Se perdió la reserva del trabajo de email {job_id}")
+                    return
+            except Exception as e:
+                print(f"ERROR: No se pudo renovar la reserva del trabajo de email {job_id}: {e}")
@@ -0,0 +1,127 @@
+"""
+Índice de empleados que cruza las cuatro pestañas (certificados, licencias y formularios 81).
+
+Cada fila se indexa por legajo, por email (en minúsculas) y por nombre completo (en
+ambos órdenes, sin acentos), apuntando a su posición en el `TabIndex` ya cacheado de la
+pestaña, que incluye el `pdf_drive_id` resuelto. Cuando cambia una pestaña se vuelve a
+indexar sólo esa pestaña; consultar el historial de un empleado es un acceso a un dict y
+la búsqueda por prefijo es una búsqueda binaria sobre las claves ordenadas.
+"""
+
+import bisect
+import unicodedata
+
+from sheet_query import ROW_NUMBER_FIELD, TabIndex
+from tabs import TABS, TabConfig
+
+
+# Cantidad máxima de claves devueltas por la búsqueda por prefijo
+EMPLOYEE_SEARCH_LIMIT = 20
+EMPLOYEE_SEARCH_MAX_LIMIT = 100
+
+_SURNAME_HEADERS = ('apellido', 'surname')
+
+
+class EmployeeIndex:
+    def __init__(self):
+        # Último TabIndex indexado de cada pestaña
+        self._tabs: dict[str, TabIndex] = {}
+        # Por pestaña: clave -> posiciones de las filas en su TabIndex
+        self._positions: dict[str, dict[str, list[int]]] = {}
+        # Clave -> tipo ('legajo', 'email' o 'nombre') y pestañas donde aparece
+        self._kinds: dict[str, str] = {}
+        self._tabs_by_key: dict[str, set[str]] = {}
+        # Claves ordenadas para la búsqueda por prefijo; se recalculan al cambiar una pestaña
+        self._sorted_keys: list[str] | None = None
+
+    def update(self, tab: TabConfig, tab_index: TabIndex) -> bool:
+        """Reindexa la pestaña si su índice cambió. Devuelve True si hubo que reindexarla."""
+        if self._tabs.get(tab.key) is tab_index:
+            return False
+
+        for key in self._positions.pop(tab.key, {}):
+            tabs = self._tabs_by_key.get(key)
+            if tabs is not None:
+                tabs.discard(tab.key)
+                if not tabs:
+                    del self._tabs_by_key[key]
+                    self._kinds.pop(key, None)
+
+        positions: dict[str, list[int]] = {}
+        for i, (kind, key) in _row_keys(tab, tab_index):
+            positions.setdefault(key, []).append(i)
+            self._kinds.setdefault(key, kind)
+            self._tabs_by_key.setdefault(key, set()).add(tab.key)
+
+        self._positions[tab.key] = positions
+        self._tabs[tab.key] = tab_index
+        self._sorted_keys = None
+        return True
+
+    def lookup(self, key: str) -> list[dict]:
+        """Filas de todas las pestañas para un legajo, email o nombre completo."""
+        normalized = normalize_key(key)
+        records = []
+        for tab_key in TABS:
+            tab_index = self._tabs.get(tab_key)
+            for i in self._positions.get(tab_key, {}).get(normalized, ()):
+                records.append({"tab": tab_key, **tab_index.row_dict(i), ROW_NUMBER_FIELD: i + 2})
+        return records
+
+    def search(self, prefix: str, limit: int = EMPLOYEE_SEARCH_LIMIT) -> list[dict]:
+        """Claves que empiezan con `prefix`, con su tipo, pestañas y cantidad de filas."""
+        normalized = normalize_key(prefix)
+        if not normalized:
+            return []
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted(self._kinds)
+
+        results = []
+        start = bisect.bisect_left(self._sorted_keys, normalized)
+        for key in self._sorted_keys[start:]:
+            if not key.startswith(normalized) or len(results) >= limit:
+                break
+            tabs = [tab_key for tab_key in TABS if tab_key in self._tabs_by_key[key]]
+            results.append({
+                "key": key,
+                "kind": self._kinds[key],
+                "tabs": tabs,
+                "records": sum(len(self._positions[tab_key][key]) for tab_key in tabs),
+            })
+        return results
+
+
+def normalize_key(value) -> str:
+    """Minúsculas, sin acentos y con los espacios colapsados (e.g., ' Gómez  Ana' -> 'gomez ana')."""
+    text = unicodedata.normalize('NFKD', str(value or ''))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+
+def _row_keys(tab: TabConfig, tab_index: TabIndex):
+    """(posición, (tipo, clave)) de cada clave de cada fila de la pestaña."""
+    lowered = [header.strip().lower() for header in tab_index.headers]
+
+    def position(candidates) -> int | None:
+        return next((lowered.index(name) for name in candidates if name in lowered), None)
+
+    legajo = position(('legajo',))
+    email = position(('email',))
+    name = position(tab.name_headers)
+    surname = position(_SURNAME_HEADERS)
+
+    for i, row in enumerate(tab_index.rows):
+        keys = set()
+        if legajo is not None:
+            keys.add(('legajo', normalize_key(row[legajo])))
+        if email is not None:
+            keys.add(('email', normalize_key(row[email])))
+        first = normalize_key(row[name]) if name is not None else ''
+        last = normalize_key(row[surname]) if surname is not None else ''
+        if first or last:
+            # Se admiten 'nombre apellido' y 'apellido nombre'
+            keys.add(('nombre', f"{first} {last}".strip()))
+            keys.add(('nombre', f"{last} {first}".strip()))
+        for kind, key in keys:
+            if key:
+                yield i, (kind, key)
@@ -0,0 +1,225 @@
+"""
+Capa asíncrona sobre los clientes de Google Sheets y Google Drive.
+
+`googleapiclient` es bloqueante y `httplib2` no es thread-safe, así que las llamadas
+`.execute()` se ejecutan en un pool de hilos acotado donde cada hilo tiene su propio
+transporte httplib2 autorizado. Cada llamada tiene un timeout propio, de modo que una
+llamada lenta a Drive ya no congela el event loop de uvicorn para el resto de usuarios.
+
+`execute()` es además la puerta de salida común hacia Google:
+- Lecturas idénticas en curso (mismo método, URI y cuerpo) se resuelven con una sola
+  llamada cuyo resultado comparten todos los que esperan (single-flight). El resultado
+  compartido no debe modificarse.
+- Cubetas de tokens por API (lecturas y escrituras de Sheets, Drive) ajustadas a las
+  cuotas por minuto: si se agotan, las llamadas esperan en lugar de recibir un 429.
+- Los 429, 5xx, límites de tasa de Drive (403 `rateLimitExceeded`) y, en lecturas, los
+  timeouts y errores de conexión se reintentan con espera exponencial y jitter. Un 429
+  que persiste se informa como `GoogleRateLimitError`, con el `Retry-After` sugerido.
+"""
+
+import asyncio
+import functools
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+
+import metrics
+
+
+# Tamaño del pool de hilos y timeouts (en segundos), configurables por entorno
+GOOGLE_MAX_WORKERS = int(os.getenv("GOOGLE_MAX_WORKERS", "8"))
+GOOGLE_CALL_TIMEOUT = float(os.getenv("GOOGLE_CALL_TIMEOUT", "30"))
+GOOGLE_SOCKET_TIMEOUT = float(os.getenv("GOOGLE_SOCKET_TIMEOUT", "20"))
+# Cuotas por minuto (por usuario: la cuenta de servicio) de cada API
+GOOGLE_SHEETS_READS_PER_MINUTE = float(os.getenv("GOOGLE_SHEETS_READS_PER_MINUTE", "60"))
+GOOGLE_SHEETS_WRITES_PER_MINUTE = float(os.getenv("GOOGLE_SHEETS_WRITES_PER_MINUTE", "60"))
+GOOGLE_DRIVE_REQUESTS_PER_MINUTE = float(os.getenv("GOOGLE_DRIVE_REQUESTS_PER_MINUTE", "12000"))
+# Reintentos de errores transitorios y espera exponencial (en segundos)
+GOOGLE_MAX_RETRIES = int(os.getenv("GOOGLE_MAX_RETRIES", "3"))
+GOOGLE_RETRY_BASE_DELAY = float(os.getenv("GOOGLE_RETRY_BASE_DELAY", "0.5"))
+GOOGLE_RETRY_MAX_DELAY = float(os.getenv("GOOGLE_RETRY_MAX_DELAY", "16"))
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Motivos con los que Drive informa límites de tasa como 403
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+_executor = ThreadPoolExecutor(max_workers=GOOGLE_MAX_WORKERS, thread_name_prefix="google-api")
+_thread_state = threading.local()
+_credentials = None
+# Lecturas en curso: clave de la petición -> tarea que la ejecuta
+_inflight: dict[tuple, asyncio.Task] = {}
+
+
+class GoogleTimeoutError(TimeoutError):
+    """La llamada a la API de Google superó su timeout."""
+
+
+class GoogleRateLimitError(Exception):
+    """Google siguió respondiendo 429 tras los reintentos."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Cubeta de tokens que se recarga a `per_minute / 60` por segundo. Quien toma tokens de
+    más reserva su turno y espera; sin locks porque todo ocurre en el event loop.
+    """
+
+    def __init__(self, name: str, per_minute: float, capacity: float | None = None):
+        self.name = name
+        self.rate = per_minute / 60
+        # Por defecto, una ráfaga de hasta 10 s de cuota
+        self.capacity = capacity if capacity is not None else max(per_minute / 6, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self, cost: float = 1.0) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= cost
+        if self._tokens < 0:
+            wait = -self._tokens / self.rate
+            metrics.RATE_LIMIT_WAIT.observe(wait, self.name)
+            await asyncio.sleep(wait)
+
+
+_buckets = {
+    'sheets.read': TokenBucket('sheets.read', GOOGLE_SHEETS_READS_PER_MINUTE),
+    'sheets.write': TokenBucket('sheets.write', GOOGLE_SHEETS_WRITES_PER_MINUTE),
+    'drive': TokenBucket('drive', GOOGLE_DRIVE_REQUESTS_PER_MINUTE),
+}
+
+
+def configure(credentials) -> None:
+    """Registra las credenciales con las que cada hilo construye su transporte."""
+    global _credentials
+    _credentials = credentials
+
+
+def thread_http() -> AuthorizedHttp:
+    """Devuelve el transporte httplib2 autorizado propio del hilo actual."""
+    http = getattr(_thread_state, "http", None)
+    if http is None:
+        if _credentials is None:
+            raise RuntimeError("Las credenciales de Google no están inicializadas.")
+        http = AuthorizedHttp(_credentials, http=httplib2.Http(timeout=GOOGLE_SOCKET_TIMEOUT))
+        _thread_state.http = http
+    return http
+
+
+async def run_blocking(func, *args, timeout: float | None = None, label: str = "google-api"):
+    """
+    Ejecuta `func(*args)` en el pool de Google y espera el resultado con timeout.
+
+    Si se supera el timeout se libera al llamador; el hilo termina por su cuenta cuando
+    vence el timeout del socket. `label` ('api.método') identifica la llamada en las métricas.
+    """
+    timeout = timeout or GOOGLE_CALL_TIMEOUT
+    loop = asyncio.get_running_loop()
+    api, _, method = label.partition('.')
+    async with metrics.upstream_call(api, method or 'unknown'):
+        future = loop.run_in_executor(_executor, functools.partial(func, *args))
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            raise GoogleTimeoutError(f"La llamada {label} superó el timeout de {timeout:g}s.") from None
+
+
+async def throttle(api: str, cost: float = 1.0, write: bool = False) -> None:
+    """Espera turno en la cubeta de la API (`cost` llamadas, p. ej. las de un lote)."""
+    bucket = _buckets.get(f"sheets.{'write' if write else 'read'}" if api == 'sheets' else api)
+    if bucket is not None:
+        await bucket.acquire(cost)
+
+
+async def execute(request, timeout: float | None = None):
+    """Ejecuta un `HttpRequest` de googleapiclient sin bloquear el event loop."""
+    label = getattr(request, "methodId", None) or "google-api"
+    is_read = getattr(request, "method", "GET") == "GET"
+    if not is_read:
+        return await _execute_with_retries(request, timeout, label, is_read)
+
+    key = (label, request.method, request.uri, getattr(request, "body", None))
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_execute_with_retries(request, timeout, label, is_read))
+        _inflight[key] = task
+        task.add_done_callback(functools.partial(_forget_inflight, key))
+    else:
+        api, _, method = label.partition('.')
+        metrics.SINGLE_FLIGHT_SHARED.inc(api, method or 'unknown')
+    # shield: si un llamador se cancela, la llamada sigue para los demás
+    return await asyncio.shield(task)
+
+
+def _forget_inflight(key: tuple, task: asyncio.Task) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        # Evita el aviso de excepción no recuperada si todos los llamadores se cancelaron
+        task.exception()
+
+
+async def _execute_with_retries(request, timeout: float | None, label: str, is_read: bool):
+    api, _, method = label.partition('.')
+    for attempt in range(GOOGLE_MAX_RETRIES + 1):
+        await throttle(api, write=not is_read)
+        try:
+            return await run_blocking(
+                lambda: request.execute(http=thread_http()),
+                timeout=timeout,
+                label=label,
+            )
+        except Exception as e:
+            delay = _retry_delay(e, attempt, is_read)
+            if delay is None:
+                raise
+            if attempt == GOOGLE_MAX_RETRIES:
+                if _status_of(e) in (403, 429):
+                    raise GoogleRateLimitError(
+                        f"Cuota de Google agotada en {label} tras {attempt + 1} intentos.", retry_after=delay
+                    ) from e
+                raise
+            metrics.UPSTREAM_RETRIES.inc(api, method or 'unknown', metrics.error_reason(e))
+            print(f"ERROR: {label} falló ({e}); reintento {attempt + 1} en {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+def _retry_delay(error: Exception, attempt: int, is_read: bool) -> float | None:
+    """Espera antes del próximo intento, o None si el error no es transitorio."""
+    status = _status_of(error)
+    if status is not None:
+        if status not in RETRYABLE_STATUSES and not (status == 403 and _is_rate_limit(error)):
+            return None
+    elif not (is_read and isinstance(error, (GoogleTimeoutError, ConnectionError, OSError, httplib2.HttpLib2Error))):
+        return None
+
+    # Espera exponencial con jitter completo, respetando el Retry-After de Google
+    delay = random.uniform(0, min(GOOGLE_RETRY_BASE_DELAY * 2 ** attempt, GOOGLE_RETRY_MAX_DELAY))
+    retry_after = getattr(getattr(error, 'resp', None), 'get', lambda key: None)('retry-after')
+    try:
+        delay = max(delay, float(retry_after)) if retry_after else delay
+    except ValueError:
+        pass
+    return delay
+
+
+def _status_of(error: Exception) -> int | None:
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    return int(status) if status is not None else None
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    content = getattr(error, 'content', b'') or b''
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', 'replace')
+    return any(reason in content for reason in RATE_LIMIT_REASONS)
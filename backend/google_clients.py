@@ -0,0 +1,92 @@
+"""
+Credenciales y clientes de Google Sheets / Drive, creados bajo demanda.
+
+Nada se lee ni se construye al importar `main`: las credenciales se cargan y los clientes
+se construyen la primera vez que se usan (o en el precalentamiento del `lifespan`). Los
+clientes se construyen desde el documento de discovery guardado en disco, sin
+descargarlo: primero `backend/discovery/<api>.<versión>.json` si existe, y si no el que
+trae `googleapiclient` (`static_discovery=True`).
+"""
+
+import json
+import os
+import threading
+
+import google_async
+
+
+SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets',
+    'https://www.googleapis.com/auth/drive.readonly'
+]
+SERVICE_ACCOUNT_FILE = os.path.join(os.path.dirname(__file__), 'service_account.json')
+DISCOVERY_DIR = os.getenv("GOOGLE_DISCOVERY_DIR", os.path.join(os.path.dirname(__file__), 'discovery'))
+
+_lock = threading.RLock()
+_credentials = None
+_services: dict[tuple[str, str], object] = {}
+
+
+class GoogleCredentialsError(RuntimeError):
+    """No se pudieron cargar las credenciales de la cuenta de servicio."""
+
+
+def get_credentials():
+    global _credentials
+    with _lock:
+        if _credentials is None:
+            try:
+                from google.oauth2 import service_account
+
+                with open(SERVICE_ACCOUNT_FILE, 'r', encoding='utf-8') as f:
+                    service_account_data = json.load(f)
+                service_account_data['private_key'] = service_account_data['private_key'].replace('\\n', '\n')
+                _credentials = service_account.Credentials.from_service_account_info(service_account_data, scopes=SCOPES)
+            except Exception as e:
+                print(f"ERROR CRÍTICO: Fallo en la inicialización de credenciales de Google: {e}")
+                raise GoogleCredentialsError(f"Credenciales de Google no disponibles: {e}") from e
+            google_async.configure(_credentials)
+        return _credentials
+
+
+def get_sheet_service():
+    return _service('sheets', 'v4')
+
+
+def get_drive_service():
+    return _service('drive', 'v3')
+
+
+def use_services(sheet_service, drive_service) -> None:
+    """Registra clientes ya construidos (p. ej. los simulados de `benchmarks/fakes.py`)."""
+    with _lock:
+        _services[('sheets', 'v4')] = sheet_service
+        _services[('drive', 'v3')] = drive_service
+
+
+def warm_up() -> None:
+    """Carga las credenciales y construye ambos clientes (bloqueante, para un hilo)."""
+    get_sheet_service()
+    get_drive_service()
+    print("DEBUG: Google Services initialized successfully.")
+
+
+def _service(api: str, version: str):
+    service = _services.get((api, version))
+    if service is None:
+        with _lock:
+            service = _services.get((api, version))
+            if service is None:
+                service = _build(api, version, get_credentials())
+                _services[(api, version)] = service
+    return service
+
+
+def _build(api: str, version: str, credentials):
+    from googleapiclient.discovery import build, build_from_document
+
+    document_path = os.path.join(DISCOVERY_DIR, f"{api}.{version}.json")
+    if os.path.exists(document_path):
+        with open(document_path, 'r', encoding='utf-8') as f:
+            return build_from_document(f.read(), credentials=credentials)
+    return build(api, version, credentials=credentials, static_discovery=True, cache_discovery=False)
@@ -0,0 +1,47 @@
+"""
+Validadores HTTP (ETag / If-None-Match) para las respuestas de datos.
+
+El ETag se deriva de la versión de los datos de origen (versión de la hoja y huella del
+listado de la carpeta de Drive) y de los parámetros de la petición, así que se puede
+responder `304 Not Modified` sin reconstruir ni transferir el cuerpo.
+
+Es un validador débil (`W/"..."`): la misma respuesta se envía comprimida con gzip o sin
+comprimir según el cliente, y un ETag fuerte tendría que distinguir cada codificación.
+"""
+
+import hashlib
+
+from fastapi import Request
+from fastapi.responses import Response
+
+
+# Obliga al navegador a revalidar siempre, pero permite reutilizar el cuerpo con un 304
+CACHE_CONTROL = 'no-cache'
+
+
+def weak_etag(*parts) -> str:
+    digest = hashlib.sha256('\x1f'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def request_etag(request: Request, *versions) -> str:
+    """ETag de una respuesta: versiones de los datos más ruta y parámetros de la petición."""
+    query = sorted(request.query_params.multi_items())
+    return weak_etag(request.url.path, query, *versions)
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    # If-None-Match usa la comparación débil: sólo cuenta la parte entre comillas
+    candidates = {candidate.strip().removeprefix('W/') for candidate in if_none_match.split(',')}
+    return '*' in candidates or etag.removeprefix('W/') in candidates
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag))
+
+
+def validator_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
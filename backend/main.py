@@ -2,48 +2,128 @@
 # ... (Previous code remains unchanged until imports)
 
 import os
-import json
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import RedirectResponse
+import asyncio
+import math
+import time
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
-import resend
-import base64
 
-
-# Global definitions to prevent NameError
-sheet_service = None
-drive_service = None
-
-app = FastAPI()
+import download_links
+import metrics
+import google_clients
+from google_async import GoogleRateLimitError
+from google_clients import get_drive_service, get_sheet_service
+from drive_index import DriveFolderIndexer, FolderIndex
+from employee_index import EMPLOYEE_SEARCH_LIMIT, EMPLOYEE_SEARCH_MAX_LIMIT, EmployeeIndex, normalize_key
+from sheet_cache import SheetRangeCache, SheetSnapshot
+from sheet_events import SSE_HEADERS, SSE_MEDIA_TYPE, SheetEventHub
+from sheet_mirror import SheetMirror, indexed_columns
+from shared_cache import cache_backend_from_env
+from sheet_query import (
+    ENRICHMENT_FIELDS,
+    ROW_NUMBER_FIELD,
+    SheetQuery,
+    TabIndex,
+    build_tab_index,
+    pad_row,
+    parse_sheet_query,
+    rows_payload,
+    run_query,
+)
+from serialization import NDJSON_MEDIA_TYPE, json_response, ndjson_lines
+from http_cache import is_not_modified, not_modified_response, request_etag, validator_headers
+from tabs import SPREADSHEET_ID, TABS, TabConfig, column_index
+from email_delivery import (
+    SENT_MARKER,
+    email_fields_for_row,
+    email_idempotency_key,
+    find_email_header,
+    send_pdf_email_via_resend,
+)
+from email_queue import STATUS_SENT, EmailJobQueue
+from pdf_cache import PdfDiskCache
+from status_writer import CELL_FAILED, CELL_WRITTEN, StatusWriteBuffer, validate_status_cell
+from drive_metadata import DriveMetadataCache
+
+
+# Precalentamiento al arrancar: clientes de Google y cachés de las pestañas
+GOOGLE_WARMUP = os.getenv("GOOGLE_WARMUP", "1") == "1"
+
+# Espejo local (SQLite) de las pestañas y de los índices de carpetas
+sheet_mirror = SheetMirror()
+# Caché compartida entre workers (CACHE_BACKEND=sqlite) o sólo en memoria (por defecto)
+cache_backend = cache_backend_from_env()
+# Índice incremental de las carpetas de PDFs de Google Drive
+drive_folder_index = DriveFolderIndexer(get_drive_service, mirror=sheet_mirror, shared=cache_backend)
+# Caché de rangos de Google Sheets, revalidada según la versión de la hoja en Drive
+sheet_range_cache = SheetRangeCache(get_sheet_service, get_drive_service, mirror=sheet_mirror, shared=cache_backend)
+# Índices de consulta por pestaña: (spreadsheet_id, rango, carpeta) -> (snapshot, generación de carpeta, índice)
+_tab_indexes: dict[tuple[str, str, str], tuple] = {}
+# Caché en disco de los PDFs de Drive, por ID de archivo y MD5
+pdf_disk_cache = PdfDiskCache(get_drive_service)
+# Caché LRU con expiración de metadatos de Drive (enlaces de visualización de los PDFs)
+drive_metadata_cache = DriveMetadataCache(get_drive_service, shared=cache_backend)
+# Aciertos del caché de índices de consulta por pestaña
+tab_index_cache_stats = metrics.HitCounter()
+
+# Escrituras diferidas de las marcas de 'Enviado', agrupadas en un values.batchUpdate
+status_writer = StatusWriteBuffer(get_sheet_service, sheet_range_cache)
+
+metrics.register_cache('sheet_ranges', sheet_range_cache)
+metrics.register_cache('drive_folders', drive_folder_index)
+metrics.register_cache('tab_indexes', tab_index_cache_stats)
+metrics.register_cache('pdf_files', pdf_disk_cache)
+metrics.register_cache('drive_metadata', drive_metadata_cache)
+metrics.CallbackMetric(
+    'status_writes_pending', "Marcas de 'Enviado' pendientes de escribir en la hoja.", (), lambda: {(): status_writer.pending})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El precalentamiento corre en segundo plano para no demorar la apertura del puerto
+    warmup_task = asyncio.create_task(warm_up()) if GOOGLE_WARMUP else None
+    # Sincronización en segundo plano del índice de carpetas con el feed de cambios de Drive
+    sync_task = asyncio.create_task(drive_folder_index.run_forever())
+    # Flusher de las marcas de 'Enviado' y workers de la cola de envíos de email
+    await status_writer.start()
+    await email_job_queue.start()
+    try:
+        yield
+    finally:
+        sync_task.cancel()
+        if warmup_task is not None:
+            warmup_task.cancel()
+        await email_job_queue.stop()
+        await status_writer.stop()
 
 
-def find_pdf_drive_id(pdf_name_from_sheet: str | None, pdf_name_to_id_map: dict) -> str | None:
-    """Busca el ID de Drive para un PDF dado su nombre, con coincidencia flexible."""
-    if not pdf_name_from_sheet:
-        return None
-    
-    lookup_name_with_ext = f"{pdf_name_from_sheet}.pdf".lower()
-    lookup_name_as_is = f"{pdf_name_from_sheet}".lower()
-    
-    # Búsqueda exacta
-    if lookup_name_with_ext in pdf_name_to_id_map:
-        return pdf_name_to_id_map[lookup_name_with_ext]
-    if lookup_name_as_is in pdf_name_to_id_map:
-        return pdf_name_to_id_map[lookup_name_as_is]
-    
-    # Búsqueda parcial: el nombre de la hoja está contenido en el nombre del archivo
-    for filename, file_id in pdf_name_to_id_map.items():
-        if lookup_name_as_is in filename:
-            return file_id
-    
-    return None
+async def warm_up() -> None:
+    """Construye los clientes de Google y llena las cachés de carpetas y hojas de cada pestaña."""
+    try:
+        await asyncio.to_thread(google_clients.warm_up)
+    except Exception as e:
+        print(f"ERROR: Fallo el precalentamiento de Google Sheets/Drive: {e}")
+    # Aun sin Google, las pestañas se pueden cargar desde el espejo local
+    results = await asyncio.gather(*(
+        load_tab_index(SPREADSHEET_ID, tab.range_name, tab.drive_folder_id) for tab in TABS.values()
+    ), return_exceptions=True)
+    for tab, result in zip(TABS.values(), results):
+        if isinstance(result, Exception):
+            print(f"ERROR: Fallo el precalentamiento de la pestaña {tab.key}: {result}")
+        else:
+            employee_index.update(tab, result)
 
 
+app = FastAPI(lifespan=lifespan)
 
 
+# Tamaño mínimo (bytes) a partir del cual se comprimen las respuestas
+COMPRESSION_MIN_SIZE = 1024
 
 # Configurar CORS para permitir que tu frontend de React se conecte
 origins = [
@@ -59,43 +139,55 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Request-ID", "Retry-After"], # El frontend reenvía el ETag en If-None-Match
 )
 
-# Configuración de Google Sheets y Google Drive API
-SCOPES = [
-    'https://www.googleapis.com/auth/spreadsheets',
-    'https://www.googleapis.com/auth/drive.readonly'
-]
-SERVICE_ACCOUNT_FILE = os.path.join(os.path.dirname(__file__), 'service_account.json')
-
-# --- Autenticación Google Sheets y Google Drive ---
-try:
-    with open(SERVICE_ACCOUNT_FILE, 'r', encoding='utf-8') as f:
-        service_account_data = json.load(f)
-
-    service_account_data['private_key'] = service_account_data['private_key'].replace('\\n', '\n')
-
-    creds = service_account.Credentials.from_service_account_info(service_account_data, scopes=SCOPES)
-    
-except Exception as e:
-    print(f"ERROR CRÍTICO: Fallo en la inicialización de credenciales de Google: {e}")
-    creds = None
-
-# Inicializar servicios de Google Sheets y Google Drive
-if creds:
-    sheet_service = build('sheets', 'v4', credentials=creds)
-    drive_service = build('drive', 'v3', credentials=creds)
-    print("DEBUG: Google Services initialized successfully.")
-else:
-    sheet_service = None
-    drive_service = None
-    print("DEBUG: CREDENTIALS FAILED - Services set to None.")
-
-# Resend API Configuration
-RESEND_API_KEY = os.getenv("RESEND_API_KEY")
-RESEND_FROM_EMAIL = os.getenv("RESEND_FROM_EMAIL")
-if RESEND_API_KEY:
-    resend.api_key = RESEND_API_KEY
+# Compresión gzip de las respuestas grandes
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """
+    Mide cada petición: histograma de latencia y tamaño por ruta, cabecera `X-Request-ID`
+    y una línea de log JSON con los tiempos de cada etapa y de cada llamada externa.
+    """
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    timings = metrics.start_request()
+    started = time.perf_counter()
+    status_code = 500
+    response = None
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        route = request.scope.get("route")
+        # Se etiqueta por plantilla de ruta (/pdf/{file_id}) para acotar la cardinalidad
+        route_path = getattr(route, "path", "unmatched")
+        metrics.HTTP_REQUEST_DURATION.observe(elapsed, request.method, route_path, status_code)
+        size = response.headers.get("content-length") if response is not None else None
+        if size is not None:
+            metrics.HTTP_RESPONSE_SIZE.observe(int(size), route_path)
+        metrics.log_request({
+            "request_id": request_id,
+            "method": request.method,
+            "route": route_path,
+            "status": status_code,
+            "duration_ms": round(elapsed * 1000, 2),
+            "bytes": int(size) if size is not None else None,
+            "stages_ms": {name: round(value * 1000, 2) for name, value in timings.items()},
+        })
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+# Envíos simultáneos del envío masivo
+EMAIL_BULK_CONCURRENCY = int(os.getenv("EMAIL_BULK_CONCURRENCY", "4"))
+EMAIL_BULK_MAX_CONCURRENCY = 16
+# Formatos de respuesta de los endpoints /sheets/*
+SHEET_FORMATS = ('json', 'columnar', 'ndjson')
+# IDs admitidos por petición en /pdf/metadata
+PDF_METADATA_MAX_IDS = 500
 
 
 # Pydantic model for the request body
@@ -109,6 +201,16 @@ class SendPdfEmailRequest(BaseModel):
     sheet_name: str # Nuevo: nombre de la hoja a actualizar (e.g., 'certificado_medico', 'licencia')
     update_column_letter: str # Nuevo: letra de la columna a actualizar (e.g., 'J', 'L')
 
+
+class PdfMetadataRequest(BaseModel):
+    file_ids: list[str]
+
+
+class BulkSendPdfEmailRequest(BaseModel):
+    items: list[SendPdfEmailRequest] = [] # Filas a enviar
+    tab: str | None = None # O bien: enviar todas las filas pendientes de esta pestaña (e.g., 'licencia')
+    max_concurrency: int | None = None # Envíos simultáneos (por defecto EMAIL_BULK_CONCURRENCY)
+
 # --- Lógica de Notificación Automática a Administradores (ELIMINADA) ---
 
 # Función auxiliar (Conservada si se necesita, pero get_sheet_all_values era para la automatización)
@@ -123,57 +225,238 @@ class SendPdfEmailRequest(BaseModel):
 async def read_root_test():
     return {"message": "Test root endpoint reached successfully!"}
 
-@app.post("/send_pdf_email")
-async def send_pdf_email(request: SendPdfEmailRequest):
+
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas en formato de texto de Prometheus."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+async def process_email_job(job: dict, save_progress) -> None:
+    """
+    Procesa un trabajo de la cola de emails. Cada etapa completada se guarda en el
+    progreso del trabajo, así un reintento no vuelve a enviar un email ya aceptado.
+    """
+    request = SendPdfEmailRequest(**job['payload'])
+    progress = dict(job['progress'])
+
+    if not progress.get('email_id'):
+        with metrics.stage('email.send'):
+            progress['email_id'] = await send_pdf_email_via_resend(
+                pdf_disk_cache,
+                pdf_drive_id=request.pdf_drive_id,
+                recipient_email=request.recipient_email,
+                subject=request.subject,
+                body_text=request.body_text,
+                filename=request.filename,
+                idempotency_key=job['idempotency_key'],
+            )
+        await save_progress(progress)
+
+    # 'sheet_updated' es el nombre que usaban los trabajos guardados antes de la escritura diferida
+    if not progress.get('sheet_queued') and not progress.get('sheet_updated'):
+        # La marca se escribe en diferido junto con las de otros envíos; desde acá ya se
+        # ve en las lecturas y queda guardada para reintentarla si Google falla
+        await status_writer.enqueue(SPREADSHEET_ID, request.sheet_name, request.update_column_letter, request.sheet_row_number)
+        sheet_events.publish_cell(request.sheet_name, request.sheet_row_number, request.update_column_letter, SENT_MARKER)
+        progress['sheet_queued'] = True
+        await save_progress(progress)
+
+
+# Cola persistente de envíos de email, procesada por workers en segundo plano
+email_job_queue = EmailJobQueue(process_email_job)
+
+
+async def email_job_response(job: dict) -> dict:
+    """
+    Estado de un trabajo de envío. `sheet_updated` sólo es verdadero cuando la marca de
+    'Enviado' ya se escribió en la hoja, no cuando quedó encolada.
+    """
+    progress = job['progress']
+    sheet_updated, sheet_update_error = False, None
+    if progress.get('sheet_updated'):
+        sheet_updated = True
+    elif progress.get('sheet_queued'):
+        payload = job['payload']
+        state, error = await status_writer.cell_state(
+            payload['sheet_name'], payload['update_column_letter'], payload['sheet_row_number']
+        )
+        sheet_updated = state == CELL_WRITTEN
+        sheet_update_error = error if state == CELL_FAILED else None
+    return {
+        "job_id": job['id'],
+        "status": job['status'],
+        "attempts": job['attempts'],
+        "email_id": progress.get('email_id'),
+        "sheet_updated": sheet_updated,
+        "sheet_update_error": sheet_update_error,
+        "last_error": job['last_error'],
+        "status_url": f"/send_pdf_email/jobs/{job['id']}",
+    }
+
+
+@app.post("/send_pdf_email", status_code=202)
+async def send_pdf_email(request: SendPdfEmailRequest, idempotency_key: str | None = Header(default=None)):
+    """
+    Encola el envío del PDF y responde `202` con el ID del trabajo; el estado se consulta en
+    `status_url`. Reenviar la misma fila (o la misma cabecera `Idempotency-Key`) devuelve el
+    trabajo existente en lugar de enviar otro email.
+    """
     try:
-        # 1. Fetch PDF content from Google Drive
-        request_drive_file = drive_service.files().get_media(fileId=request.pdf_drive_id)
-        file_content = request_drive_file.execute()
-
-        # 2. Encode PDF content to Base64
-        encoded_file = base64.b64encode(file_content).decode('utf-8')
-
-        # 3. Send email using Resend
-        r = resend.Emails.send({
-            "from": RESEND_FROM_EMAIL,
-            "to": request.recipient_email,
-            "subject": request.subject,
-            "html": "<p>" + request.body_text.replace('\n', '<br>') + "</p>",
-            "attachments": [
-                {
-                    "filename": request.filename,
-                    "content": encoded_file,
-                }
-            ]
-        })
+        validate_status_cell(request.sheet_name, request.update_column_letter, request.sheet_row_number)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    key = idempotency_key or email_idempotency_key(
+        request.sheet_name, request.sheet_row_number, request.pdf_drive_id, request.recipient_email
+    )
+    try:
+        job, _ = await email_job_queue.enqueue(request.model_dump(), key)
+    except Exception as e:
+        print(f"ERROR: Fallo al encolar el email: {e}")
+        raise HTTPException(status_code=500, detail=f"Error al enviar el email: {str(e)}")
 
+    status_code = 200 if job['status'] == STATUS_SENT else 202
+    return JSONResponse(status_code=status_code, content=await email_job_response(job))
 
-        if r and r.get('id'): # Resend API typically returns an ID on success
-            # Update Google Sheet
-            spreadsheet_id = "1VohQVfx1rmnV8nkT3cxQdx996bj0BkeLovAmqYZXuMA" # Hardcoded from get_sheet_data
-            range_to_update = f"{request.sheet_name}!{request.update_column_letter}{request.sheet_row_number}" # Dynamic update
 
-            value_input_option = "USER_ENTERED"
-            body = {
-                'values': [
-                    ['Enviado']
-                ]
-            }
+@app.get("/send_pdf_email/jobs/{job_id}")
+async def get_send_pdf_email_job(job_id: str):
+    """Estado de un trabajo de envío: queued, running, sent o failed."""
+    job = await email_job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No existe el trabajo de envío indicado.")
+    return await email_job_response(job)
 
-            sheet_service.spreadsheets().values().update(
-                spreadsheetId=spreadsheet_id,
-                range=range_to_update,
-                valueInputOption=value_input_option,
-                body=body
-            ).execute()
 
-            return {"message": "Email enviado con éxito y hoja actualizada!", "email_id": r.get('id')}
-        else:
-            raise HTTPException(status_code=500, detail="Error al enviar el email: Respuesta inesperada de Resend.")
+async def pending_email_requests(tab: TabConfig) -> tuple[list[SendPdfEmailRequest], list[dict]]:
+    """
+    Filas de la pestaña con la columna de estado vacía, listas para enviar. Devuelve también
+    las filas pendientes que no se pueden enviar (sin PDF o sin email).
+    """
+    tab_index = await load_tab_index(SPREADSHEET_ID, tab.range_name, tab.drive_folder_id)
+    headers = tab_index.headers
+    status_index = column_index(tab.status_column)
+    status_header = headers[status_index] if status_index < len(headers) else None
+    email_header = find_email_header(headers)
+
+    requests, skipped = [], []
+    for row in tab_index.iter_dicts():
+        if status_header and (row.get(status_header) or '').strip():
+            continue
+        if not row.get('pdf_drive_id') or not email_header or not row.get(email_header):
+            skipped.append({
+                "sheet_name": tab.key,
+                "sheet_row_number": row.get('sheet_row_number'),
+                "status": "skipped",
+                "error": "La fila no tiene PDF asociado o email de destino.",
+            })
+            continue
+        requests.append(SendPdfEmailRequest(
+            pdf_drive_id=row['pdf_drive_id'],
+            recipient_email=row[email_header],
+            sheet_row_number=row['sheet_row_number'],
+            sheet_name=tab.key,
+            update_column_letter=tab.status_column,
+            **email_fields_for_row(tab, headers, row),
+        ))
+    return requests, skipped
+
+
+@app.post("/send_pdf_email/batch")
+async def send_pdf_email_batch(request: BulkSendPdfEmailRequest):
+    """
+    Envío masivo: una lista de filas (`items`) o todas las filas pendientes de una pestaña
+    (`tab`, las que tienen vacía la columna de estado). Los PDFs se descargan y se envían
+    con concurrencia acotada; las marcas de 'Enviado' pasan por la cola de escrituras
+    diferidas y se escriben juntas antes de responder. Devuelve el resultado de cada fila.
+    """
+    if bool(request.items) == bool(request.tab):
+        raise HTTPException(status_code=400, detail="Indica 'items' o 'tab', pero no ambos.")
+    if request.tab and request.tab not in TABS:
+        raise HTTPException(status_code=400, detail=f"Pestaña desconocida: {request.tab}. Disponibles: {', '.join(TABS)}.")
+    for item in request.items:
+        try:
+            validate_status_cell(item.sheet_name, item.update_column_letter, item.sheet_row_number)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Fila {item.sheet_row_number} de {item.sheet_name}: {e}")
 
+    try:
+        if request.tab:
+            items, results = await pending_email_requests(TABS[request.tab])
+        else:
+            items, results = request.items, []
     except Exception as e:
-        print(f"ERROR: Fallo al enviar el email: {e}")
-        raise HTTPException(status_code=500, detail=f"Error al enviar el email: {str(e)}")
+        raise sheet_error(e)
+
+    concurrency = min(request.max_concurrency or EMAIL_BULK_CONCURRENCY, EMAIL_BULK_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def send_one(item: SendPdfEmailRequest) -> dict:
+        result = {"sheet_name": item.sheet_name, "sheet_row_number": item.sheet_row_number}
+        async with semaphore:
+            try:
+                result["email_id"] = await send_pdf_email_via_resend(
+                    pdf_disk_cache,
+                    pdf_drive_id=item.pdf_drive_id,
+                    recipient_email=item.recipient_email,
+                    subject=item.subject,
+                    body_text=item.body_text,
+                    filename=item.filename,
+                    idempotency_key=email_idempotency_key(
+                        item.sheet_name, item.sheet_row_number, item.pdf_drive_id, item.recipient_email
+                    ),
+                )
+                result["status"] = "sent"
+            except Exception as e:
+                print(f"ERROR: Fallo al enviar el email de {item.sheet_name} fila {item.sheet_row_number}: {e}")
+                result["status"] = "error"
+                result["error"] = str(e)
+        return result
+
+    # Resend no admite adjuntos en su envío por lotes, así que cada email se envía por separado
+    sent_results = await asyncio.gather(*(send_one(item) for item in items))
+
+    sent_items = [item for item, result in zip(items, sent_results) if result["status"] == "sent"]
+    # Las marcas van por la misma cola que los envíos individuales (superposición en las
+    # lecturas, reintentos, invalidación de la caché) y se escriben ya en un solo lote
+    for item in sent_items:
+        await status_writer.enqueue(SPREADSHEET_ID, item.sheet_name, item.update_column_letter, item.sheet_row_number)
+        sheet_events.publish_cell(item.sheet_name, item.sheet_row_number, item.update_column_letter, SENT_MARKER)
+    await status_writer.flush()
+    states = await status_writer.cell_states([
+        (item.sheet_name, item.update_column_letter, item.sheet_row_number) for item in sent_items
+    ])
+    sheet_update_error = next((error for state, error in states if state == CELL_FAILED), None)
+
+    results.extend(sent_results)
+    return {
+        "sent": len(sent_items),
+        "failed": sum(1 for result in sent_results if result["status"] == "error"),
+        "skipped": len(results) - len(sent_results),
+        "sheet_updated": all(state == CELL_WRITTEN for state, _ in states),
+        "sheet_update_error": sheet_update_error,
+        "results": results,
+    }
+
+
+@app.post("/pdf/metadata")
+async def get_pdf_metadata(request: PdfMetadataRequest):
+    """
+    Metadatos (nombre y enlace de visualización) de varios PDFs de Google Drive. Los que no
+    están en caché se resuelven juntos con peticiones por lotes de Drive.
+    """
+    if len(request.file_ids) > PDF_METADATA_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Se admiten como máximo {PDF_METADATA_MAX_IDS} IDs por petición.")
+    try:
+        metadata = await drive_metadata_cache.get_many(request.file_ids)
+    except GoogleRateLimitError as e:
+        raise quota_exceeded_error(e)
+    except Exception as e:
+        print(f"ERROR: Fallo al obtener metadatos de Google Drive: {e}")
+        raise HTTPException(status_code=500, detail=f"Error al acceder a Google Drive: {e}")
+    return {
+        "files": metadata,
+        "missing": [file_id for file_id in request.file_ids if file_id not in metadata],
+    }
 
 
 @app.get("/pdf/{file_id}")
@@ -182,327 +465,404 @@ async def get_pdf_link(file_id: str):
     Redirige al enlace de visualización de un PDF en Google Drive dado su ID.
     """
     try:
-        file_metadata = drive_service.files().get(fileId=file_id, fields='webViewLink').execute()
+        file_metadata = await drive_metadata_cache.get(file_id)
         web_view_link = file_metadata.get('webViewLink')
 
         if not web_view_link:
             raise HTTPException(status_code=404, detail="No se encontró un enlace de visualización para el archivo PDF o el archivo no es accesible.")
         
         return RedirectResponse(url=web_view_link, status_code=303)
+    except HTTPException:
+        raise
+    except GoogleRateLimitError as e:
+        raise quota_exceeded_error(e)
     except Exception as e:
         print(f"ERROR: Fallo al obtener el enlace del PDF de Google Drive para {file_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Error al acceder al PDF: {e}. Asegúrate de que el ID es válido y tienes permisos de acceso.")
 
-@app.get("/sheets/data")
-async def get_sheet_data(request: Request):
+
+class CachedPdfResponse(FileResponse):
+    """Envía un PDF de la caché en disco; el descarte no lo borra hasta que termina el envío."""
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(path, **kwargs)
+        pdf_disk_cache.hold(path)
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            pdf_disk_cache.release(self.path)
+
+
+@app.get("/pdf/{file_id}/download")
+async def download_pdf(file_id: str, v: str = "", name: str = "", expires: int = 0, signature: str = ""):
     """
-    Lee datos de una hoja de cálculo de Google y añade IDs de archivos de Google Drive para PDFs
-    de forma eficiente.
+    Descarga de un PDF enviado por email como enlace (los que superan el tamaño máximo de
+    adjunto). Exige la firma y el vencimiento del enlace; admite peticiones `Range`, así
+    que las descargas se pueden reanudar y los visores pueden leer el PDF por partes.
+    Sólo se sirve la versión (MD5) firmada: si el PDF cambió en Drive, responde `410`.
     """
-    # Los valores para spreadsheet_id y range_name se pueden pasar como query params
-    # o usar estos valores por defecto.
-    spreadsheet_id = request.query_params.get("spreadsheet_id", "1VohQVfx1rmnV8nkT3cxQdx996bj0BkeLovAmqYZXuMA")
-    range_name = request.query_params.get("range_name", "certificado_medico!A1:J")
-    
-    DRIVE_FOLDER_ID = "1-VzmLOGyhuWp9d26VcxOdI1JL8q7c5bG"
+    if not download_links.valid_signature(file_id, v, name, expires, signature):
+        raise HTTPException(status_code=403, detail="El enlace de descarga no es válido.")
+    if expires < time.time():
+        raise HTTPException(status_code=410, detail="El enlace de descarga venció.")
 
     try:
-        # 1. Obtener todos los archivos de la carpeta de Google Drive de una sola vez
-        query = f"'{DRIVE_FOLDER_ID}' in parents and mimeType = 'application/pdf' and trashed = false"
-        drive_response = drive_service.files().list(
-            q=query,
-            spaces='drive',
-            fields='files(id, name)'
-        ).execute()
-        
-        drive_files = drive_response.get('files', [])
-        
-        # 2. Crear un mapa en memoria (diccionario) para búsqueda rápida: { 'nombre_del_archivo.pdf': 'id_del_archivo' }
-        # Se normaliza el nombre a minúsculas para evitar problemas de mayúsculas/minúsculas.
-        pdf_name_to_id_map = {file['name'].lower(): file['id'] for file in drive_files}
-
-        # 3. Obtener los datos de la hoja de cálculo
-        sheet_result = sheet_service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range=range_name).execute()
-        
-        sheet_values = sheet_result.get('values', [])
-
-        if not sheet_values:
-            return {"headers": [], "data": [], "message": "No se encontraron datos en la hoja de cálculo."}
-        
+        # La copia que se descargó al enviar el email; si se descartó, se vuelve a bajar de Drive
+        path = pdf_disk_cache.cached_path(file_id, v or None)
+        if path is None:
+            path, md5_checksum = await pdf_disk_cache.get_versioned_path(file_id)
+            # El enlace es para la versión que se envió, no para la que haya hoy en Drive
+            if v and md5_checksum != v:
+                raise HTTPException(status_code=410, detail="El PDF cambió desde que se envió el enlace.")
+    except HTTPException:
+        raise
+    except GoogleRateLimitError as e:
+        raise quota_exceeded_error(e)
+    except Exception as e:
+        print(f"ERROR: Fallo al obtener el PDF {file_id} para su descarga: {e}")
+        raise HTTPException(status_code=500, detail=f"Error al acceder al PDF: {e}")
+    return CachedPdfResponse(
+        path,
+        media_type='application/pdf',
+        filename=name or None,
+        content_disposition_type='inline',
+        headers={"Cache-Control": "private, max-age=3600"},
+    )
+
+
+def build_tab_index_cached(cache_key: tuple, sheet_snapshot: SheetSnapshot, drive_folder: FolderIndex) -> TabIndex:
+    """
+    Añade a cada fila de la pestaña el ID de su PDF en Google Drive y devuelve el índice de
+    consulta. El índice se reutiliza mientras no cambien ni la hoja ni la carpeta.
+    """
+    cached = _tab_indexes.get(cache_key)
+    if cached is not None and cached[0] is sheet_snapshot and cached[1] == drive_folder.generation:
+        tab_index_cache_stats.hits += 1
+        return cached[2]
+    tab_index_cache_stats.misses += 1
+
+    sheet_values = sheet_snapshot.values
+    if not sheet_values:
+        tab_index = build_tab_index([], [])
+    else:
         headers = sheet_values[0]
+        width = len(headers)
         # Encontrar el índice de la columna 'id' (insensible a mayúsculas)
         try:
             id_column_index = [h.lower() for h in headers].index('id')
         except ValueError:
             # Si no hay columna 'id', no podemos asociar PDFs. Devolver los datos tal cual.
-            data_rows = [dict(zip(headers, row)) for row in sheet_values[1:]]
-            return {"headers": headers, "data": data_rows}
-
-        # 4. Procesar las filas de la hoja y enriquecer con el ID del PDF desde el mapa
-        data_with_drive_ids = []
-        for i, row_values in enumerate(sheet_values[1:]): # Start enumerate from 0 for sheet_values[1:]
-            sheet_row_number = i + 2 # +1 for header row, +1 for 0-based enumerate
-            row_dict = {}
-            # Rellenar con None si la fila es más corta que los encabezados
-            for j, header in enumerate(headers):
-                row_dict[header] = row_values[j] if j < len(row_values) else None
-
-            # Obtener el nombre del PDF de la columna 'id'
-            pdf_name_from_sheet = row_values[id_column_index] if id_column_index < len(row_values) else None
-            
-            # Usar la función auxiliar para buscar el PDF
-            pdf_drive_id = find_pdf_drive_id(pdf_name_from_sheet, pdf_name_to_id_map)
-            
-            row_dict['pdf_drive_id'] = pdf_drive_id
-            row_dict['sheet_row_number'] = sheet_row_number # Add this line
-            data_with_drive_ids.append(row_dict)
-        
-        return {"headers": headers, "data": data_with_drive_ids}
+            id_column_index = None
+
+        # Filas como tuplas compactas, rellenando con None si la fila es más corta que los encabezados
+        if id_column_index is None:
+            data_rows = [pad_row(row_values, width) for row_values in sheet_values[1:]]
+        else:
+            # Resolver de una vez los PDFs de toda la columna 'id' con el índice de la carpeta
+            with metrics.stage('pdf_match'):
+                pdf_drive_ids = drive_folder.matcher().find_many(
+                    row_values[id_column_index] if id_column_index < len(row_values) else None
+                    for row_values in sheet_values[1:]
+                )
+
+            # Enriquecer cada fila con el ID del PDF y su número de fila en la hoja
+            # (+1 por la fila de encabezados, +1 por el enumerate desde 0)
+            data_rows = [
+                pad_row(row_values, width) + (pdf_drive_ids[i], i + 2)
+                for i, row_values in enumerate(sheet_values[1:])
+            ]
 
+        with metrics.stage('tab_index.build'):
+            tab_index = build_tab_index(headers, data_rows, enriched=id_column_index is not None)
+
+    tab_index.version = (
+        f"{sheet_snapshot.version}@{sheet_snapshot.fetched_at}|{drive_folder.folder_id}#{drive_folder.fingerprint()}"
+    )
+    tab_index.sheet_version = sheet_snapshot.version
+    tab_index.indexed_columns = {
+        tab_index.headers[position].lower(): column
+        for column, position in indexed_columns(cache_key[1], tab_index.headers).items()
+        if position is not None and position < len(tab_index.headers)
+    }
+    _tab_indexes[cache_key] = (sheet_snapshot, drive_folder.generation, tab_index)
+    return tab_index
+
+
+async def load_tab_index(spreadsheet_id: str, range_name: str, drive_folder_id: str) -> TabIndex:
+    """Lee una pestaña y el índice de su carpeta de Drive en paralelo y los combina."""
+    drive_folder, sheet_snapshot = await asyncio.gather(
+        metrics.timed('drive.folder', drive_folder_index.get_folder(drive_folder_id)),
+        metrics.timed('sheets.read', sheet_range_cache.get(spreadsheet_id, range_name)),
+    )
+    cache_key = (spreadsheet_id, range_name, drive_folder_id)
+    return build_tab_index_cached(cache_key, sheet_snapshot, drive_folder)
+
+
+async def indexed_matches(tab_index: TabIndex, range_name: str, query: SheetQuery | None) -> list[int] | None:
+    """
+    Posiciones que cumplen los filtros sobre columnas indexadas, resueltas con los índices
+    del espejo local. None si no hay esos filtros o el espejo no tiene la versión del índice
+    (aún sincronizando, o con escrituras pendientes superpuestas): se filtra en memoria.
+    """
+    if query is None or tab_index.sheet_version is None:
+        return None
+    filters = {
+        tab_index.indexed_columns[column]: value
+        for column, value in query.filters.items() if column in tab_index.indexed_columns
+    }
+    if not filters:
+        return None
+    try:
+        stored = await sheet_mirror.match_rows(SPREADSHEET_ID, range_name, filters)
     except Exception as e:
-        print(f"ERROR: Fallo al procesar los datos: {e}")
-        # Proporcionar un error más detallado puede ayudar en el desarrollo
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error al procesar datos de Google Sheets o Drive: {str(e)}. "
-                   "Verifica que las credenciales son válidas, los IDs de hoja/carpeta son correctos "
-                   "y la cuenta de servicio tiene acceso."
-        )
+        print(f"ERROR: No se pudo filtrar {range_name} en el espejo local: {e}")
+        return None
+    if stored is None or stored[0] != tab_index.sheet_version:
+        return None
+    return [row_number - 2 for row_number in stored[1]]
+
 
-@app.get("/sheets/licencia-data")
-async def get_licencia_sheet_data(request: Request):
+def sheet_payload(tab_index: TabIndex, request: Request, matched: list[int] | None = None) -> dict:
+    """
+    Cuerpo de los endpoints /sheets/*: la pestaña completa o la página pedida, en formato
+    `json` (por defecto, una lista de objetos) o `columnar` (`?format=columnar`).
+    """
+    response_format = sheet_format(request)
+    query = parse_sheet_query(request.query_params)
+    if query is None:
+        payload = rows_payload(tab_index, range(len(tab_index.rows)), response_format)
+    else:
+        with metrics.stage('query'):
+            positions, paging = run_query(tab_index, query, matched)
+        payload = rows_payload(tab_index, positions, response_format)
+        payload.update(paging)
+        # Los enlaces de los PDFs de la página quedan listos para /pdf/{file_id}
+        if tab_index.enriched:
+            drive_metadata_cache.prefill(tab_index.rows[i][-2] for i in positions)
+    if not tab_index.headers:
+        payload["message"] = "No se encontraron datos en la hoja de cálculo."
+    return payload
+
+
+def sheet_response(tab_index: TabIndex, request: Request, matched: list[int] | None = None) -> Response:
+    """
+    Respuesta de los endpoints /sheets/*. Con `?format=ndjson` las filas se transmiten por
+    bloques: una primera línea con las columnas y los totales y luego una lista por fila.
+    """
+    etag = request_etag(request, tab_index.version)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    if sheet_format(request) != 'ndjson':
+        payload = sheet_payload(tab_index, request, matched)
+        with metrics.stage('serialize'):
+            return json_response(payload, headers=validator_headers(etag))
+
+    query = parse_sheet_query(request.query_params)
+    if query is None:
+        positions, paging = range(len(tab_index.rows)), {"total": len(tab_index.rows)}
+    else:
+        positions, paging = run_query(tab_index, query, matched)
+    columns = tab_index.headers + (list(ENRICHMENT_FIELDS) if tab_index.enriched else [])
+    return StreamingResponse(
+        ndjson_lines({"columns": columns, **paging}, (tab_index.rows[i] for i in positions)),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers=validator_headers(etag),
+    )
+
+
+def sheet_format(request: Request) -> str:
+    response_format = request.query_params.get("format", "json")
+    if response_format not in SHEET_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato desconocido '{response_format}'. Disponibles: {', '.join(SHEET_FORMATS)}.")
+    return response_format
+
+
+def quota_exceeded_error(e: GoogleRateLimitError) -> HTTPException:
+    """Cuota de Google agotada: 503 con `Retry-After` en lugar de un 500 genérico."""
+    print(f"ERROR: {e}")
+    return HTTPException(
+        status_code=503,
+        detail="Google Sheets/Drive está limitando las consultas. Intenta de nuevo en unos segundos.",
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+    )
+
+
+def sheet_error(e: Exception) -> HTTPException:
+    if isinstance(e, GoogleRateLimitError):
+        return quota_exceeded_error(e)
+    print(f"ERROR: Fallo al procesar los datos: {e}")
+    # Proporcionar un error más detallado puede ayudar en el desarrollo
+    return HTTPException(
+        status_code=500,
+        detail=f"Error al procesar datos de Google Sheets o Drive: {str(e)}. "
+               "Verifica que las credenciales son válidas, los IDs de hoja/carpeta son correctos "
+               "y la cuenta de servicio tiene acceso."
+    )
+
+
+@app.get("/sheets/batch")
+async def get_sheets_batch(request: Request):
     """
-    Lee datos de la hoja de cálculo 'licencia' de Google y añade IDs de archivos de Google Drive para PDFs
-    de forma eficiente.
+    Devuelve varias pestañas en una sola petición (`?tabs=licencia,81_inciso_D`; por defecto
+    todas). Los rangos se leen con un único `values.batchGet` y las carpetas de Drive en
+    paralelo, así que la latencia es la de la llamada más lenta y no la suma de todas.
+    Los parámetros de paginación, búsqueda y orden se aplican a cada pestaña.
     """
-    spreadsheet_id = "1VohQVfx1rmnV8nkT3cxQdx996bj0BkeLovAmqYZXuMA"
-    range_name = "licencia!A1:L"
-    
-    DRIVE_FOLDER_ID = "13QIHa4FES-bXp0rZsc6FNpi3xgfDB7hH" # Nuevo ID de carpeta para licencias
+    tab_keys = [key.strip() for key in request.query_params.get("tabs", "").split(",") if key.strip()]
+    unknown = [key for key in tab_keys if key not in TABS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Pestañas desconocidas: {', '.join(unknown)}. Disponibles: {', '.join(TABS)}.")
+    tabs = [TABS[key] for key in dict.fromkeys(tab_keys)] or list(TABS.values())
+    if sheet_format(request) == 'ndjson':
+        raise HTTPException(status_code=400, detail="El endpoint por lotes no admite format=ndjson.")
 
     try:
-        # 1. Obtener todos los archivos de la carpeta de Google Drive de una sola vez
-        query = f"'{DRIVE_FOLDER_ID}' in parents and mimeType = 'application/pdf' and trashed = false"
-        drive_response = drive_service.files().list(
-            q=query,
-            spaces='drive',
-            fields='files(id, name)'
-        ).execute()
-        
-        drive_files = drive_response.get('files', [])
-        
-        # 2. Crear un mapa en memoria (diccionario) para búsqueda rápida: { 'nombre_del_archivo.pdf': 'id_del_archivo' }
-        # Se normaliza el nombre a minúsculas para evitar problemas de mayúsculas/minúsculas.
-        pdf_name_to_id_map = {file['name'].lower(): file['id'] for file in drive_files}
-
-        # 3. Obtener los datos de la hoja de cálculo
-        sheet_result = sheet_service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range=range_name).execute()
-        
-        sheet_values = sheet_result.get('values', [])
+        sheet_snapshots, *drive_folders = await asyncio.gather(
+            metrics.timed('sheets.read', sheet_range_cache.get_many(SPREADSHEET_ID, [tab.range_name for tab in tabs])),
+            *(metrics.timed('drive.folder', drive_folder_index.get_folder(tab.drive_folder_id)) for tab in tabs),
+        )
+        tab_indexes = [
+            build_tab_index_cached((SPREADSHEET_ID, tab.range_name, tab.drive_folder_id), sheet_snapshot, drive_folder)
+            for tab, sheet_snapshot, drive_folder in zip(tabs, sheet_snapshots, drive_folders)
+        ]
+        etag = request_etag(request, *(tab_index.version for tab_index in tab_indexes))
+        if is_not_modified(request, etag):
+            return not_modified_response(etag)
+
+        query = parse_sheet_query(request.query_params)
+        matches = await asyncio.gather(*(
+            indexed_matches(tab_index, tab.range_name, query) for tab, tab_index in zip(tabs, tab_indexes)
+        ))
+        results = {
+            tab.key: sheet_payload(tab_index, request, matched)
+            for tab, tab_index, matched in zip(tabs, tab_indexes, matches)
+        }
+        return json_response({"tabs": results}, headers=validator_headers(etag))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise sheet_error(e)
 
-        if not sheet_values:
-            return {"headers": [], "data": [], "message": "No se encontraron datos en la hoja de cálculo."}
-        
-        headers = sheet_values[0]
-        # Encontrar el índice de la columna 'id' (insensible a mayúsculas)
-        try:
-            id_column_index = [h.lower() for h in headers].index('id')
-        except ValueError:
-            # Si no hay columna 'id', no podemos asociar PDFs. Devolver los datos tal cual.
-            data_rows = [dict(zip(headers, row)) for row in sheet_values[1:]]
-            return {"headers": headers, "data": data_rows}
-
-        # 4. Procesar las filas de la hoja y enriquecer con el ID del PDF desde el mapa
-        data_with_drive_ids = []
-        for i, row_values in enumerate(sheet_values[1:]): # Start enumerate from 0 for sheet_values[1:]
-            sheet_row_number = i + 2 # +1 for header row, +1 for 0-based enumerate
-            row_dict = {}
-            # Rellenar con None si la fila es más corta que los encabezados
-            for j, header in enumerate(headers):
-                row_dict[header] = row_values[j] if j < len(row_values) else None
-
-            # Obtener el nombre del PDF de la columna 'id'
-            pdf_name_from_sheet = row_values[id_column_index] if id_column_index < len(row_values) else None
-            
-            # Usar la función auxiliar para buscar el PDF
-            pdf_drive_id = find_pdf_drive_id(pdf_name_from_sheet, pdf_name_to_id_map)
-            
-            row_dict['pdf_drive_id'] = pdf_drive_id
-            row_dict['sheet_row_number'] = sheet_row_number # Add this line
-            data_with_drive_ids.append(row_dict)
-        
-        return {"headers": headers, "data": data_with_drive_ids}
 
-    except Exception as e:
-        print(f"ERROR: Fallo al procesar los datos: {e}")
-        # Proporcionar un error más detallado puede ayudar en el desarrollo
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error al procesar datos de Google Sheets o Drive: {str(e)}. "
-                   "Verifica que las credenciales son válidas, los IDs de hoja/carpeta son correctos "
-                   "y la cuenta de servicio tiene acceso."
-        )
+async def load_registered_tab(tab: TabConfig) -> TabIndex:
+    return await load_tab_index(SPREADSHEET_ID, tab.range_name, tab.drive_folder_id)
+
+
+# Cambios por fila de cada pestaña para los clientes conectados por SSE
+sheet_events = SheetEventHub(load_registered_tab)
+
 
-@app.get("/sheets/formulario-81-d-data")
-async def get_formulario_81_d_sheet_data(request: Request):
+@app.get("/sheets/{tab_key}/events")
+async def get_sheet_events(tab_key: str):
     """
-    Lee datos de la hoja de cálculo '81_inciso_D' de Google y añade IDs de archivos de Google Drive para PDFs
-    de forma eficiente.
+    Server-Sent Events con los cambios por fila de una pestaña (`patch`), detectados una
+    sola vez en el backend para todos los clientes conectados. Ver `sheet_events.py`.
     """
-    spreadsheet_id = "1VohQVfx1rmnV8nkT3cxQdx996bj0BkeLovAmqYZXuMA"
-    range_name = "81_inciso_D!A1:J"
-    
-    DRIVE_FOLDER_ID = "1QAwBtekeHsHU-6bUjn7ug2QgSElHtC8o" # ID de carpeta para Formulario 81_inciso_D
+    if tab_key not in TABS:
+        raise HTTPException(status_code=404, detail=f"Pestaña desconocida: {tab_key}. Disponibles: {', '.join(TABS)}.")
+    return StreamingResponse(sheet_events.subscribe(TABS[tab_key]), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
 
-    try:
-        # 1. Obtener todos los archivos de la carpeta de Google Drive de una sola vez
-        query = f"'{DRIVE_FOLDER_ID}' in parents and mimeType = 'application/pdf' and trashed = false"
-        drive_response = drive_service.files().list(
-            q=query,
-            spaces='drive',
-            fields='files(id, name)'
-        ).execute()
-        
-        drive_files = drive_response.get('files', [])
-        
-        # 2. Crear un mapa en memoria (diccionario) para búsqueda rápida: { 'nombre_del_archivo.pdf': 'id_del_archivo' }
-        # Se normaliza el nombre a minúsculas para evitar problemas de mayúsculas/minúsculas.
-        pdf_name_to_id_map = {file['name'].lower(): file['id'] for file in drive_files}
-
-        # 3. Obtener los datos de la hoja de cálculo
-        sheet_result = sheet_service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range=range_name).execute()
-        
-        sheet_values = sheet_result.get('values', [])
 
-        if not sheet_values:
-            return {"headers": [], "data": [], "message": "No se encontraron datos en la hoja de cálculo."}
-        
-        headers = sheet_values[0]
-        # Encontrar el índice de la columna 'id' (insensible a mayúsculas)
-        try:
-            id_column_index = [h.lower() for h in headers].index('id')
-        except ValueError:
-            # Si no hay columna 'id', no podemos asociar PDFs. Devolver los datos tal cual.
-            data_rows = [dict(zip(headers, row)) for row in sheet_values[1:]]
-            return {"headers": headers, "data": data_rows}
-
-        # 4. Procesar las filas de la hoja y enriquecer con el ID del PDF desde el mapa
-        data_with_drive_ids = []
-        for i, row_values in enumerate(sheet_values[1:]): # Start enumerate from 0 for sheet_values[1:]
-            sheet_row_number = i + 2 # +1 for header row, +1 for 0-based enumerate
-            row_dict = {}
-            # Rellenar con None si la fila es más corta que los encabezados
-            for j, header in enumerate(headers):
-                row_dict[header] = row_values[j] if j < len(row_values) else None
-
-            # Obtener el nombre del PDF de la columna 'id'
-            pdf_name_from_sheet = row_values[id_column_index] if id_column_index < len(row_values) else None
-            
-            # Usar la función auxiliar para buscar el PDF
-            pdf_drive_id = find_pdf_drive_id(pdf_name_from_sheet, pdf_name_to_id_map)
-            
-            row_dict['pdf_drive_id'] = pdf_drive_id
-            row_dict['sheet_row_number'] = sheet_row_number # Add this line
-            data_with_drive_ids.append(row_dict)
-        
-        return {"headers": headers, "data": data_with_drive_ids}
+# Índice de empleados (legajo, email y nombre) que cruza todas las pestañas
+employee_index = EmployeeIndex()
 
-    except Exception as e:
-        print(f"ERROR: Fallo al procesar los datos: {e}")
-        # Proporcionar un error más detallado puede ayudar en el desarrollo
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error al procesar datos de Google Sheets o Drive: {str(e)}. "
-                   "Verifica que las credenciales son válidas, los IDs de hoja/carpeta son correctos "
-                   "y la cuenta de servicio tiene acceso."
-        )
 
-@app.get("/sheets/formulario-81-f-data")
-async def get_formulario_81_f_sheet_data(request: Request):
+async def refresh_employee_index() -> list[TabIndex]:
+    """Carga las pestañas (desde la caché) y reindexa sólo las que cambiaron."""
+    tab_indexes = await asyncio.gather(*(load_registered_tab(tab) for tab in TABS.values()))
+    with metrics.stage('employee_index'):
+        for tab, tab_index in zip(TABS.values(), tab_indexes):
+            employee_index.update(tab, tab_index)
+    return tab_indexes
+
+
+@app.get("/employees")
+async def search_employees(request: Request, prefix: str = "", limit: int = EMPLOYEE_SEARCH_LIMIT):
     """
-    Lee datos de la hoja de cálculo '81_inciso_F' de Google y añade IDs de archivos de Google Drive para PDFs
-    de forma eficiente.
+    Búsqueda por prefijo de legajo, email o nombre (`?prefix=gom`) en todas las pestañas.
+    Devuelve las claves encontradas; el historial de cada una está en `/employees/{key}`.
     """
-    spreadsheet_id = "1VohQVfx1rmnV8nkT3cxQdx996bj0BkeLovAmqYZXuMA"
-    range_name = "81_inciso_F!A1:J"
-    
-    DRIVE_FOLDER_ID = "1mi00TEyRbjaOosGwyFjsSo-OrFRGcF9d" # ID de carpeta para Formulario 81_inciso_F
+    limit = min(max(limit, 1), EMPLOYEE_SEARCH_MAX_LIMIT)
+    try:
+        tab_indexes = await refresh_employee_index()
+    except Exception as e:
+        raise sheet_error(e)
+
+    etag = request_etag(request, *(tab_index.version for tab_index in tab_indexes))
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    return json_response({"results": employee_index.search(prefix, limit)}, headers=validator_headers(etag))
 
+
+async def mirror_employee_records(key: str, tab_indexes: list[TabIndex]) -> list[dict] | None:
+    """Filas de todas las pestañas con ese legajo o email según el espejo local, o None si no está al día."""
     try:
-        # 1. Obtener todos los archivos de la carpeta de Google Drive de una sola vez
-        query = f"'{DRIVE_FOLDER_ID}' in parents and mimeType = 'application/pdf' and trashed = false"
-        drive_response = drive_service.files().list(
-            q=query,
-            spaces='drive',
-            fields='files(id, name)'
-        ).execute()
-        
-        drive_files = drive_response.get('files', [])
-        
-        # 2. Crear un mapa en memoria (diccionario) para búsqueda rápida: { 'nombre_del_archivo.pdf': 'id_del_archivo' }
-        # Se normaliza el nombre a minúsculas para evitar problemas de mayúsculas/minúsculas.
-        pdf_name_to_id_map = {file['name'].lower(): file['id'] for file in drive_files}
-
-        # 3. Obtener los datos de la hoja de cálculo
-        sheet_result = sheet_service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range=range_name).execute()
-        
-        sheet_values = sheet_result.get('values', [])
+        stored = await sheet_mirror.find_employee_rows(SPREADSHEET_ID, normalize_key(key))
+    except Exception as e:
+        print(f"ERROR: No se pudo buscar '{key}' en el espejo local: {e}")
+        return None
+    records = []
+    for tab, tab_index in zip(TABS.values(), tab_indexes):
+        version, row_numbers = stored.get(tab.range_name, (None, []))
+        if version is None or version != tab_index.sheet_version:
+            return None
+        records.extend(
+            {"tab": tab.key, **tab_index.row_dict(row_number - 2), ROW_NUMBER_FIELD: row_number}
+            for row_number in row_numbers
+        )
+    return records
 
-        if not sheet_values:
-            return {"headers": [], "data": [], "message": "No se encontraron datos en la hoja de cálculo."}
-        
-        headers = sheet_values[0]
-        # Encontrar el índice de la columna 'id' (insensible a mayúsculas)
-        try:
-            id_column_index = [h.lower() for h in headers].index('id')
-        except ValueError:
-            # Si no hay columna 'id', no podemos asociar PDFs. Devolver los datos tal cual.
-            data_rows = [dict(zip(headers, row)) for row in sheet_values[1:]]
-            return {"headers": headers, "data": data_rows}
-
-        # 4. Procesar las filas de la hoja y enriquecer con el ID del PDF desde el mapa
-        data_with_drive_ids = []
-        for i, row_values in enumerate(sheet_values[1:]): # Start enumerate from 0 for sheet_values[1:]
-            sheet_row_number = i + 2 # +1 for header row, +1 for 0-based enumerate
-            row_dict = {}
-            # Rellenar con None si la fila es más corta que los encabezados
-            for j, header in enumerate(headers):
-                row_dict[header] = row_values[j] if j < len(row_values) else None
-
-            # Obtener el nombre del PDF de la columna 'id'
-            pdf_name_from_sheet = row_values[id_column_index] if id_column_index < len(row_values) else None
-            
-            # Usar la función auxiliar para buscar el PDF
-            pdf_drive_id = find_pdf_drive_id(pdf_name_from_sheet, pdf_name_to_id_map)
-            
-            row_dict['pdf_drive_id'] = pdf_drive_id
-            row_dict['sheet_row_number'] = sheet_row_number # Add this line
-            data_with_drive_ids.append(row_dict)
-        
-        return {"headers": headers, "data": data_with_drive_ids}
 
+@app.get("/employees/{key}")
+async def get_employee(key: str, request: Request):
+    """
+    Historial de un empleado (por legajo, email o nombre completo) en las cuatro pestañas,
+    con el `pdf_drive_id` de cada fila, sin descargar las pestañas completas.
+    """
+    try:
+        tab_indexes = await refresh_employee_index()
     except Exception as e:
-        print(f"ERROR: Fallo al procesar los datos: {e}")
+        raise sheet_error(e)
 
-# ... (Previous code)
+    etag = request_etag(request, *(tab_index.version for tab_index in tab_indexes))
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    # El legajo y el email se buscan con los índices del espejo local; el nombre (o un
+    # espejo que aún no tiene la versión de alguna pestaña), en el índice en memoria
+    records = await mirror_employee_records(key, tab_indexes) or employee_index.lookup(key)
+    if not records:
+        raise HTTPException(status_code=404, detail=f"No se encontraron registros para '{key}'.")
+    return json_response({"key": key, "total": len(records), "records": records}, headers=validator_headers(etag))
 
-        # Proporcionar un error más detallado puede ayudar en el desarrollo
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error al procesar datos de Google Sheets o Drive: {str(e)}. "
-                   "Verifica que las credenciales son válidas, los IDs de hoja/carpeta son correctos "
-                   "y la cuenta de servicio tiene acceso."
-        )
 
+async def get_tab_data(tab: TabConfig, request: Request):
+    """
+    Lee los datos de una pestaña de la hoja de cálculo de Google y añade los IDs de sus PDFs
+    en Google Drive. La hoja y el rango salen siempre del registro de pestañas.
+    Acepta `page`, `page_size`, `q` (texto libre), `filter=columna:valor` y `sort` (`columna` o
+    `-columna`) para paginar, buscar y ordenar en el servidor, y `format` (`json`, `columnar`
+    o `ndjson`) para elegir el formato de la respuesta.
+    """
+    try:
+        tab_index = await load_registered_tab(tab)
+        matched = await indexed_matches(tab_index, tab.range_name, parse_sheet_query(request.query_params))
+        return sheet_response(tab_index, request, matched)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise sheet_error(e)
 
 
+def _tab_endpoint(tab: TabConfig):
+    async def endpoint(request: Request):
+        return await get_tab_data(tab, request)
+    endpoint.__doc__ = get_tab_data.__doc__
+    return endpoint
 
 
+# Un endpoint por pestaña del registro, en sus rutas históricas (/sheets/data, /sheets/licencia-data, ...)
+for _tab in TABS.values():
+    app.add_api_route(_tab.route, _tab_endpoint(_tab), methods=["GET"], name=f"get_{_tab.key}_sheet_data")
@@ -0,0 +1,255 @@
+"""
+Métricas del backend en formato de texto de Prometheus (`GET /metrics`).
+
+Registro mínimo de contadores e histogramas con etiquetas, más medidores calculados al
+exportar (p. ej. las tasas de acierto de las cachés). Además lleva, por petición, los
+tiempos de cada etapa (`stage`) para el log estructurado del middleware de tiempos.
+"""
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Límites (en segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Límites (en bytes) de los histogramas de tamaño
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+# Límites (en elementos) de los histogramas de tamaño de lote
+BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 200, 500)
+
+_registry: list = []
+_lock = threading.Lock()
+# Tiempos por etapa de la petición en curso (None fuera de una petición)
+_request_timings: ContextVar[dict | None] = ContextVar('request_timings', default=None)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, *labelvalues, amount: float = 1.0) -> None:
+        key = tuple(str(value) for value in labelvalues)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # etiquetas -> [conteo por límite, suma, total]
+        self._values: dict[tuple, list] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, *labelvalues) -> None:
+        key = tuple(str(v) for v in labelvalues)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            position = bisect_left(self.buckets, value)
+            if position < len(self.buckets):
+                state[0][position] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (bucket_counts, total_sum, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = _labels(self.labelnames + ('le',), key + (_number(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total_sum)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class CallbackMetric:
+    """Métrica cuyo valor se calcula al exportar: `collect()` devuelve {etiquetas: valor}."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...], collect, metric_type: str = 'gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.metric_type = metric_type
+        self._collect = collect
+        _registry.append(self)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        try:
+            values = self._collect()
+        except Exception as e:
+            print(f"ERROR: No se pudo calcular la métrica {self.name}: {e}")
+            return lines
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, tuple(str(v) for v in key))} {_number(value)}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- Métricas del backend ---
+
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Duración de las peticiones HTTP.', ('method', 'route', 'status'))
+HTTP_RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Tamaño de las respuestas HTTP enviadas.', ('route',), buckets=SIZE_BUCKETS)
+STAGE_DURATION = Histogram(
+    'stage_duration_seconds', 'Duración de cada etapa de los handlers (lecturas, enriquecimiento, envío...).', ('stage',))
+EMAIL_ATTACHMENT_SIZE = Histogram(
+    'email_attachment_size_bytes', 'Tamaño de los PDFs enviados por email (adjuntos o como enlace).', (), buckets=SIZE_BUCKETS)
+EMAIL_DELIVERY_MODE = Counter(
+    'email_delivery_mode_total', 'Emails enviados con el PDF adjunto o como enlace de descarga.', ('mode',))
+UPSTREAM_CALLS = Counter(
+    'upstream_calls_total', 'Llamadas a APIs externas (Google Sheets/Drive, Resend).', ('api', 'method'))
+UPSTREAM_ERRORS = Counter(
+    'upstream_errors_total', 'Llamadas a APIs externas que fallaron, por motivo.', ('api', 'method', 'reason'))
+UPSTREAM_DURATION = Histogram(
+    'upstream_call_duration_seconds', 'Duración de las llamadas a APIs externas.', ('api', 'method'))
+UPSTREAM_RETRIES = Counter(
+    'upstream_retries_total', 'Reintentos de llamadas a Google por error transitorio.', ('api', 'method', 'reason'))
+SINGLE_FLIGHT_SHARED = Counter(
+    'upstream_single_flight_shared_total', 'Lecturas resueltas con una llamada idéntica ya en curso.', ('api', 'method'))
+RATE_LIMIT_WAIT = Histogram(
+    'upstream_rate_limit_wait_seconds', 'Esperas por la cubeta de tokens de cada API.', ('bucket',))
+STATUS_WRITE_BATCH_SIZE = Histogram(
+    'status_write_batch_size', "Marcas de 'Enviado' escritas por cada values.batchUpdate diferido.", (), buckets=BATCH_BUCKETS)
+
+
+class HitCounter:
+    """Aciertos y fallos de una caché que no lleva sus propios contadores."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+
+_caches: dict[str, object] = {}
+
+
+def register_cache(name: str, cache) -> None:
+    """Expone los contadores `hits` / `misses` de una caché y su tasa de aciertos."""
+    _caches[name] = cache
+
+
+def _cache_requests() -> dict:
+    values = {}
+    for name, cache in _caches.items():
+        values[(name, 'hit')] = cache.hits
+        values[(name, 'miss')] = cache.misses
+    return values
+
+
+def _cache_hit_ratio() -> dict:
+    values = {}
+    for name, cache in _caches.items():
+        total = cache.hits + cache.misses
+        values[(name,)] = cache.hits / total if total else 0.0
+    return values
+
+
+CallbackMetric('cache_requests_total', 'Consultas a cada caché, por resultado.', ('cache', 'result'), _cache_requests, 'counter')
+CallbackMetric('cache_hit_ratio', 'Proporción de consultas resueltas desde la caché.', ('cache',), _cache_hit_ratio)
+
+
+# --- Instrumentación ---
+
+def start_request() -> dict:
+    """Abre el registro de tiempos por etapa de la petición actual."""
+    timings: dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+@contextmanager
+def stage(name: str):
+    """Mide una etapa: la suma al histograma y a los tiempos de la petición en curso."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.observe(elapsed, name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+async def timed(name: str, awaitable):
+    """Espera `awaitable` midiéndolo como la etapa `name` (útil dentro de `asyncio.gather`)."""
+    with stage(name):
+        return await awaitable
+
+
+@asynccontextmanager
+async def upstream_call(api: str, method: str):
+    """Cuenta y mide una llamada a una API externa, y sus errores por motivo."""
+    UPSTREAM_CALLS.inc(api, method)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        UPSTREAM_ERRORS.inc(api, method, error_reason(e))
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        UPSTREAM_DURATION.observe(elapsed, api, method)
+        timings = _request_timings.get()
+        if timings is not None:
+            key = f"upstream:{api}.{method}"
+            timings[key] = timings.get(key, 0.0) + elapsed
+
+
+def error_reason(error: Exception) -> str:
+    # HttpError de googleapiclient: el código HTTP; si no, el tipo de excepción
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    return f"http_{status}" if status else type(error).__name__
+
+
+def log_request(record: dict) -> None:
+    """Una línea JSON por petición, con el ID de la petición y los tiempos por etapa."""
+    print(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
@@ -0,0 +1,185 @@
+"""
+Caché en disco de los PDFs de Google Drive, direccionada por contenido.
+
+Cada archivo se guarda como `<file_id>-<md5Checksum>.pdf`: si el PDF cambia en Drive
+cambia su MD5 y la entrada vieja deja de usarse. Las descargas se hacen por bloques
+(`MediaIoBaseDownload`) directamente a disco, y el Base64 para el adjunto se genera
+leyendo el archivo por partes, de modo que nunca se tiene el PDF completo en memoria
+además de su codificación. La caché tiene un tamaño máximo y descarta primero los
+archivos usados hace más tiempo, salvo los que se están descargando o sirviendo
+(`hold`/`release`). Como otro worker puede descartar un archivo en cualquier momento,
+quien lo abre lo vuelve a descargar si ya no está (`open_versioned`).
+"""
+
+import asyncio
+import base64
+import os
+import threading
+from typing import BinaryIO
+
+import google_async
+
+
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(os.path.dirname(__file__), 'data', 'pdf_cache'))
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+PDF_DOWNLOAD_CHUNK_SIZE = int(os.getenv("PDF_DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+PDF_DOWNLOAD_TIMEOUT = float(os.getenv("PDF_DOWNLOAD_TIMEOUT", "120"))
+# Bloque de lectura para el Base64 incremental (múltiplo de 3 para no partir grupos)
+_BASE64_READ_SIZE = 3 * 256 * 1024
+
+
+class PdfDiskCache:
+    def __init__(
+        self,
+        get_drive_service,
+        cache_dir: str = PDF_CACHE_DIR,
+        max_bytes: int = PDF_CACHE_MAX_BYTES,
+        chunk_size: int = PDF_DOWNLOAD_CHUNK_SIZE,
+    ):
+        self._get_drive_service = get_drive_service
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.hits = 0
+        self.misses = 0
+        self._locks: dict[str, asyncio.Lock] = {}
+        # Archivos en uso (ruta -> cantidad de usos); el descarte no los borra
+        self._in_use: dict[str, int] = {}
+        self._evict_lock = threading.Lock()
+
+    async def get_path(self, file_id: str) -> str:
+        """Ruta local del PDF, descargándolo por bloques si no está en la caché."""
+        return (await self.get_versioned_path(file_id))[0]
+
+    async def open_versioned(self, file_id: str) -> tuple[BinaryIO, str | None]:
+        """
+        El PDF abierto para leer (lo cierra quien lo pidió) y su MD5 en Drive. Si otro worker
+        descartó el archivo entre la consulta y la apertura, se vuelve a descargar; ya
+        abierto, el descarte no lo afecta.
+        """
+        path, md5_checksum = await self.get_versioned_path(file_id)
+        try:
+            return open(path, 'rb'), md5_checksum
+        except FileNotFoundError:
+            path, md5_checksum = await self.get_versioned_path(file_id)
+            return open(path, 'rb'), md5_checksum
+
+    def hold(self, path: str) -> None:
+        """Marca el archivo como en uso: el descarte no lo borra hasta el `release`."""
+        self._in_use[path] = self._in_use.get(path, 0) + 1
+
+    def release(self, path: str) -> None:
+        remaining = self._in_use.get(path, 0) - 1
+        if remaining > 0:
+            self._in_use[path] = remaining
+        else:
+            self._in_use.pop(path, None)
+
+    def cached_path(self, file_id: str, md5_checksum: str | None) -> str | None:
+        """Ruta de una versión concreta del PDF si ya está en la caché, sin consultar a Drive."""
+        path = self._path_for(file_id, md5_checksum)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    async def get_versioned_path(self, file_id: str) -> tuple[str, str | None]:
+        """Como `get_path`, pero devuelve también el MD5 del archivo en Drive."""
+        metadata = await google_async.execute(self._get_drive_service().files().get(
+            fileId=file_id,
+            fields='md5Checksum, size'))
+        md5_checksum = metadata.get('md5Checksum')
+        path = self._path_for(file_id, md5_checksum)
+
+        lock = self._locks.setdefault(path, asyncio.Lock())
+        try:
+            async with lock:
+                try:
+                    # La fecha de modificación marca el último uso para el descarte LRU
+                    os.utime(path)
+                    self.hits += 1
+                    return path, md5_checksum
+                except FileNotFoundError:
+                    pass
+
+                self.misses += 1
+                request = self._get_drive_service().files().get_media(fileId=file_id)
+                await google_async.throttle('drive')
+                await google_async.run_blocking(
+                    self._download, request, path,
+                    timeout=PDF_DOWNLOAD_TIMEOUT,
+                    label='drive.files.get_media',
+                )
+        finally:
+            # También si la descarga falló, para no acumular un lock por intento
+            if self._locks.get(path) is lock:
+                del self._locks[path]
+        await asyncio.to_thread(self._evict, keep=path)
+        return path, md5_checksum
+
+    def _path_for(self, file_id: str, md5_checksum: str | None) -> str:
+        safe_id = ''.join(c for c in file_id if c.isalnum() or c in '-_')
+        return os.path.join(self.cache_dir, f"{safe_id}-{md5_checksum or 'sin-md5'}.pdf")
+
+    def _download(self, request, path: str) -> None:
+        """Descarga por bloques a un archivo temporal (en un hilo del pool de Google)."""
+        # Import diferido: googleapiclient no se carga al importar la app
+        from googleapiclient.http import MediaIoBaseDownload
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Cada hilo usa su propio transporte httplib2
+        request.http = google_async.thread_http()
+        tmp_path = f"{path}.{threading.get_ident()}.part"
+        try:
+            with open(tmp_path, 'wb') as fd:
+                downloader = MediaIoBaseDownload(fd, request, chunksize=self.chunk_size)
+                done = False
+                while not done:
+                    _, done = downloader.next_chunk(num_retries=2)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _cached_files(self) -> list[tuple[float, int, str]]:
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith('.pdf'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _evict(self, keep: str | None = None) -> None:
+        """
+        Elimina los archivos usados hace más tiempo hasta respetar `max_bytes`, salvo los que
+        están en uso o con una descarga en curso.
+        """
+        with self._evict_lock:
+            entries = sorted(self._cached_files())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep or path in self._in_use or path in self._locks:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+
+
+def encode_file_base64(fd: BinaryIO) -> str:
+    """Codifica un archivo abierto en Base64 leyéndolo por bloques."""
+    parts = []
+    while True:
+        chunk = fd.read(_BASE64_READ_SIZE)
+        if not chunk:
+            break
+        parts.append(base64.b64encode(chunk).decode('ascii'))
+    return ''.join(parts)
@@ -0,0 +1,110 @@
+"""
+Búsqueda de PDFs de Drive por el nombre que figura en la hoja.
+
+`find_pdf_drive_id` es la implementación de referencia: coincidencia exacta (con y sin
+`.pdf`) y, si no la hay, el primer archivo cuyo nombre contiene el de la hoja. Esa
+búsqueda parcial recorre todo el mapa por cada fila. `PdfNameMatcher` da exactamente el
+mismo resultado usando un índice de trigramas construido una sola vez por listado de
+carpeta, y permite resolver una columna completa de una vez.
+"""
+
+
+def find_pdf_drive_id(pdf_name_from_sheet: str | None, pdf_name_to_id_map: dict) -> str | None:
+    """Busca el ID de Drive para un PDF dado su nombre, con coincidencia flexible."""
+    if not pdf_name_from_sheet:
+        return None
+
+    lookup_name_with_ext = f"{pdf_name_from_sheet}.pdf".lower()
+    lookup_name_as_is = f"{pdf_name_from_sheet}".lower()
+
+    # Búsqueda exacta
+    if lookup_name_with_ext in pdf_name_to_id_map:
+        return pdf_name_to_id_map[lookup_name_with_ext]
+    if lookup_name_as_is in pdf_name_to_id_map:
+        return pdf_name_to_id_map[lookup_name_as_is]
+
+    # Búsqueda parcial: el nombre de la hoja está contenido en el nombre del archivo
+    for filename, file_id in pdf_name_to_id_map.items():
+        if lookup_name_as_is in filename:
+            return file_id
+
+    return None
+
+
+_NGRAM = 3
+
+
+class PdfNameMatcher:
+    """
+    Índice de trigramas sobre los nombres de archivo de una carpeta.
+
+    Para la búsqueda parcial sólo se verifican los archivos que contienen el trigrama
+    menos frecuente del nombre buscado; como las listas de posiciones están en el orden
+    del mapa, el primer candidato que coincide es el mismo que devolvería el recorrido
+    lineal. Los nombres más cortos que un trigrama se resuelven con una tabla de la
+    primera aparición de cada subcadena corta.
+    """
+
+    def __init__(self, pdf_name_to_id_map: dict[str, str]):
+        self._name_map = pdf_name_to_id_map
+        self._filenames = list(pdf_name_to_id_map.keys())
+        self._file_ids = list(pdf_name_to_id_map.values())
+        self._postings: dict[str, list[int]] = {}
+        self._short_first: dict[str, int] = {}
+
+        for position, filename in enumerate(self._filenames):
+            seen = set()
+            for start in range(len(filename) - _NGRAM + 1):
+                gram = filename[start:start + _NGRAM]
+                if gram not in seen:
+                    seen.add(gram)
+                    self._postings.setdefault(gram, []).append(position)
+            for length in range(1, _NGRAM):
+                for start in range(len(filename) - length + 1):
+                    self._short_first.setdefault(filename[start:start + length], position)
+
+    def find(self, pdf_name_from_sheet: str | None) -> str | None:
+        """Equivalente a `find_pdf_drive_id(pdf_name_from_sheet, pdf_name_to_id_map)`."""
+        if not pdf_name_from_sheet:
+            return None
+
+        lookup_name_with_ext = f"{pdf_name_from_sheet}.pdf".lower()
+        lookup_name_as_is = f"{pdf_name_from_sheet}".lower()
+
+        # Búsqueda exacta
+        if lookup_name_with_ext in self._name_map:
+            return self._name_map[lookup_name_with_ext]
+        if lookup_name_as_is in self._name_map:
+            return self._name_map[lookup_name_as_is]
+
+        position = self._first_containing(lookup_name_as_is)
+        return None if position is None else self._file_ids[position]
+
+    def find_many(self, pdf_names_from_sheet) -> list[str | None]:
+        """Resuelve una columna completa; los nombres repetidos se buscan una sola vez."""
+        resolved: dict = {}
+        results = []
+        for pdf_name in pdf_names_from_sheet:
+            if pdf_name not in resolved:
+                resolved[pdf_name] = self.find(pdf_name)
+            results.append(resolved[pdf_name])
+        return results
+
+    def _first_containing(self, lookup_name: str) -> int | None:
+        if len(lookup_name) < _NGRAM:
+            return self._short_first.get(lookup_name)
+
+        candidates = None
+        for start in range(len(lookup_name) - _NGRAM + 1):
+            postings = self._postings.get(lookup_name[start:start + _NGRAM])
+            if postings is None:
+                # Algún trigrama no aparece en ningún archivo: no hay coincidencia posible
+                return None
+            if candidates is None or len(postings) < len(candidates):
+                candidates = postings
+
+        filenames = self._filenames
+        for position in candidates:
+            if lookup_name in filenames[position]:
+                return position
+        return None
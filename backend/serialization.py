@@ -0,0 +1,45 @@
+"""
+Serialización JSON rápida de las respuestas de datos.
+
+Si `orjson` está instalado se usa para codificar; si no, se recurre al módulo `json` de
+la librería estándar. Las respuestas muy grandes pueden enviarse como NDJSON por
+bloques, sin construir el cuerpo completo en memoria.
+"""
+
+import json
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional
+    orjson = None
+
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+# Filas por bloque al transmitir NDJSON
+NDJSON_CHUNK_ROWS = 500
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(content, status_code: int = 200, headers: dict | None = None) -> Response:
+    """Respuesta JSON ya codificada (evita el recorrido de `jsonable_encoder`)."""
+    return Response(content=dumps(content), status_code=status_code, headers=headers, media_type='application/json')
+
+
+def ndjson_lines(header: dict, rows):
+    """Primera línea con `header` y luego una línea por fila, agrupadas en bloques."""
+    yield dumps(header) + b'\n'
+    chunk = []
+    for row in rows:
+        chunk.append(dumps(row))
+        if len(chunk) >= NDJSON_CHUNK_ROWS:
+            yield b'\n'.join(chunk) + b'\n'
+            chunk = []
+    if chunk:
+        yield b'\n'.join(chunk) + b'\n'
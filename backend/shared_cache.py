@@ -0,0 +1,332 @@
+"""
+Backend de caché compartido entre los workers de uvicorn.
+
+Las cachés de la app (rangos de la hoja, carpetas de Drive y metadatos de PDFs) guardan
+sus valores en memoria y, además, los publican en un `CacheBackend`:
+
+- `LocalCacheBackend` (por defecto): en memoria del proceso; para un único worker.
+- `SqliteCacheBackend` (`CACHE_BACKEND=sqlite`): un archivo SQLite (WAL) compartido por
+  todos los workers de la máquina. Lo que descarga un worker lo reutilizan los demás.
+
+Además de `get`/`set`, el backend ofrece:
+- Invalidación entre procesos: `invalidate(namespace, prefix)` borra las entradas y deja
+  un registro que los demás workers leen con `poll_invalidations` para descartar sus
+  copias en memoria.
+- Un lock por clave (`refresh_lock`) para que sólo un worker a la vez consulte a Google
+  por la misma clave; los demás esperan y luego toman el resultado del backend. El lock
+  vence solo si su dueño muere, y se renueva mientras el refresco sigue en curso.
+
+Cada caché que invalida un espacio de nombres lee también sus invalidaciones.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "local")
+SHARED_CACHE_DB = os.getenv(
+    "SHARED_CACHE_DB",
+    os.path.join(os.path.dirname(__file__), 'data', 'shared_cache.sqlite3'),
+)
+# Duración (segundos) del lock de refresco; si el worker que lo tiene muere, vence solo
+CACHE_LOCK_LEASE = float(os.getenv("CACHE_LOCK_LEASE", "60"))
+# Intervalo (segundos) entre intentos de tomar un lock ocupado por otro worker
+CACHE_LOCK_POLL_INTERVAL = 0.05
+# Espera máxima (segundos) por un lock ajeno; como se renueva mientras su dueño refresca,
+# puede durar más que CACHE_LOCK_LEASE
+CACHE_LOCK_MAX_WAIT = float(os.getenv("CACHE_LOCK_MAX_WAIT", "300"))
+# Intervalo mínimo (segundos) entre lecturas del registro de invalidaciones
+CACHE_INVALIDATION_POLL_INTERVAL = float(os.getenv("CACHE_INVALIDATION_POLL_INTERVAL", "0.5"))
+# Antigüedad (segundos) a partir de la cual se borran las invalidaciones registradas
+CACHE_INVALIDATION_RETENTION = 3600.0
+# Entradas máximas del backend en memoria (se descartan las menos usadas)
+LOCAL_CACHE_MAX_ENTRIES = int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", "20000"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS cache_invalidations (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    namespace TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    origin TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cache_locks (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class CacheBackend:
+    """Interfaz común. Los valores deben ser serializables como JSON."""
+
+    async def get(self, namespace: str, key: str):
+        return (await self.get_many(namespace, [key])).get(key)
+
+    async def get_many(self, namespace: str, keys: list[str]) -> dict:
+        raise NotImplementedError
+
+    async def set(self, namespace: str, key: str, value, ttl: float | None = None) -> None:
+        await self.set_many(namespace, {key: value}, ttl)
+
+    async def set_many(self, namespace: str, values: dict, ttl: float | None = None) -> None:
+        raise NotImplementedError
+
+    async def invalidate(self, namespace: str, prefix: str = '') -> None:
+        """Borra las entradas cuya clave empieza con `prefix` y avisa a los demás workers."""
+        raise NotImplementedError
+
+    async def poll_invalidations(self, namespace: str, cursor: int | None) -> tuple[int | None, list[str]]:
+        """
+        Prefijos invalidados por otros workers desde `cursor`, y el cursor nuevo. La primera
+        vez se pasa None: el cursor arranca al final del registro.
+        """
+        raise NotImplementedError
+
+    def refresh_lock(self, namespace: str, key: str):
+        """Context manager asíncrono: sólo un worker a la vez refresca `key`."""
+        raise NotImplementedError
+
+
+class LocalCacheBackend(CacheBackend):
+    """En memoria del proceso: los valores se guardan por referencia, sin serializar."""
+
+    def __init__(self, max_entries: int = LOCAL_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], tuple[float | None, object]] = OrderedDict()
+        self._locks: dict[tuple[str, str], asyncio.Lock] = {}
+
+    async def get_many(self, namespace: str, keys: list[str]) -> dict:
+        now = time.time()
+        found = {}
+        for key in keys:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                continue
+            expires_at, value = entry
+            if expires_at is not None and expires_at < now:
+                del self._entries[(namespace, key)]
+                continue
+            self._entries.move_to_end((namespace, key))
+            found[key] = value
+        return found
+
+    async def set_many(self, namespace: str, values: dict, ttl: float | None = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        for key, value in values.items():
+            self._entries[(namespace, key)] = (expires_at, value)
+            self._entries.move_to_end((namespace, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def invalidate(self, namespace: str, prefix: str = '') -> None:
+        for entry_key in [k for k in self._entries if k[0] == namespace and k[1].startswith(prefix)]:
+            del self._entries[entry_key]
+
+    async def poll_invalidations(self, namespace: str, cursor: int | None) -> tuple[int | None, list[str]]:
+        # Un único proceso: no hay invalidaciones ajenas
+        return cursor, []
+
+    def refresh_lock(self, namespace: str, key: str):
+        return self._locks.setdefault((namespace, key), asyncio.Lock())
+
+
+class SqliteCacheBackend(CacheBackend):
+    """Archivo SQLite compartido por los procesos de la máquina (WAL)."""
+
+    def __init__(self, db_path: str = SHARED_CACHE_DB, lock_lease: float = CACHE_LOCK_LEASE):
+        self.db_path = db_path
+        self.lock_lease = lock_lease
+        # Identifica a este proceso en los locks y en el registro de invalidaciones
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._db_lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._local_locks: dict[str, asyncio.Lock] = {}
+        self._last_poll: dict[str, float] = {}
+        self._writes = 0
+
+    # --- API pública ---
+
+    async def get_many(self, namespace: str, keys: list[str]) -> dict:
+        if not keys:
+            return {}
+        return await asyncio.to_thread(self._get_many, namespace, keys)
+
+    async def set_many(self, namespace: str, values: dict, ttl: float | None = None) -> None:
+        if values:
+            await asyncio.to_thread(self._set_many, namespace, values, ttl)
+
+    async def invalidate(self, namespace: str, prefix: str = '') -> None:
+        await asyncio.to_thread(self._invalidate, namespace, prefix)
+
+    async def poll_invalidations(self, namespace: str, cursor: int | None) -> tuple[int | None, list[str]]:
+        now = time.monotonic()
+        if cursor is not None and now - self._last_poll.get(namespace, 0.0) < CACHE_INVALIDATION_POLL_INTERVAL:
+            return cursor, []
+        self._last_poll[namespace] = now
+        return await asyncio.to_thread(self._poll_invalidations, namespace, cursor)
+
+    @asynccontextmanager
+    async def refresh_lock(self, namespace: str, key: str):
+        name = f"{namespace}|{key}"
+        # Primero se serializan las corrutinas del proceso y luego los procesos entre sí
+        async with self._local_locks.setdefault(name, asyncio.Lock()):
+            deadline = time.monotonic() + max(CACHE_LOCK_MAX_WAIT, self.lock_lease)
+            acquired = False
+            while not acquired:
+                acquired = await asyncio.to_thread(self._try_lock, name)
+                if not acquired:
+                    if time.monotonic() > deadline:
+                        print(f"ERROR: No se obtuvo el lock de caché {name}; se continúa sin él")
+                        break
+                    await asyncio.sleep(CACHE_LOCK_POLL_INTERVAL)
+            # Un refresco largo no debe perder el lock a mitad de camino
+            keeper = asyncio.create_task(self._keep_lock(name)) if acquired else None
+            try:
+                yield
+            finally:
+                if keeper is not None:
+                    keeper.cancel()
+                    await asyncio.gather(keeper, return_exceptions=True)
+                if acquired:
+                    await asyncio.to_thread(self._unlock, name)
+
+    async def _keep_lock(self, name: str) -> None:
+        """Renueva el vencimiento del lock cada tercio de su duración."""
+        while True:
+            await asyncio.sleep(self.lock_lease / 3)
+            try:
+                if not await asyncio.to_thread(self._renew_lock, name):
+                    print(f"ERROR: Se perdió el lock de caché {name}; otro worker puede refrescar a la vez")
+                    return
+            except Exception as e:
+                print(f"ERROR: No se pudo renovar el lock de caché {name}: {e}")
+
+    # --- Acceso a SQLite (se ejecuta en hilos, serializado con _db_lock) ---
+
+    def _open(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _get_many(self, namespace: str, keys: list[str]) -> dict:
+        now = time.time()
+        placeholders = ', '.join('?' for _ in keys)
+        with self._db_lock:
+            rows = self._open().execute(
+                f"SELECT key, value FROM cache_entries WHERE namespace = ? AND key IN ({placeholders}) "
+                "AND (expires_at IS NULL OR expires_at >= ?)",
+                (namespace, *keys, now),
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def _set_many(self, namespace: str, values: dict, ttl: float | None) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        rows = [
+            (namespace, key, json.dumps(value, ensure_ascii=False, separators=(',', ':')), expires_at)
+            for key, value in values.items()
+        ]
+        with self._db_lock:
+            conn = self._open()
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                conn.execute("DELETE FROM cache_entries WHERE expires_at < ?", (now,))
+
+    def _invalidate(self, namespace: str, prefix: str) -> None:
+        now = time.time()
+        with self._db_lock:
+            conn = self._open()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND substr(key, 1, ?) = ?",
+                    (namespace, len(prefix), prefix),
+                )
+                conn.execute(
+                    "INSERT INTO cache_invalidations (namespace, prefix, origin, created_at) VALUES (?, ?, ?, ?)",
+                    (namespace, prefix, self.origin, now),
+                )
+                conn.execute("DELETE FROM cache_invalidations WHERE created_at < ?", (now - CACHE_INVALIDATION_RETENTION,))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _poll_invalidations(self, namespace: str, cursor: int | None) -> tuple[int, list[str]]:
+        with self._db_lock:
+            conn = self._open()
+            if cursor is None:
+                latest = conn.execute("SELECT MAX(seq) FROM cache_invalidations").fetchone()[0]
+                return latest or 0, []
+            rows = conn.execute(
+                "SELECT seq, prefix, origin FROM cache_invalidations WHERE namespace = ? AND seq > ? ORDER BY seq",
+                (namespace, cursor),
+            ).fetchall()
+        if not rows:
+            return cursor, []
+        return rows[-1][0], [prefix for _, prefix, origin in rows if origin != self.origin]
+
+    def _try_lock(self, name: str) -> bool:
+        now = time.time()
+        with self._db_lock:
+            conn = self._open()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT owner, expires_at FROM cache_locks WHERE name = ?", (name,)).fetchone()
+                acquired = row is None or row[0] == self.origin or row[1] < now
+                if acquired:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO cache_locks (name, owner, expires_at) VALUES (?, ?, ?)",
+                        (name, self.origin, now + self.lock_lease),
+                    )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return acquired
+
+    def _renew_lock(self, name: str) -> bool:
+        with self._db_lock:
+            cursor = self._open().execute(
+                "UPDATE cache_locks SET expires_at = ? WHERE name = ? AND owner = ?",
+                (time.time() + self.lock_lease, name, self.origin),
+            )
+        return cursor.rowcount > 0
+
+    def _unlock(self, name: str) -> None:
+        with self._db_lock:
+            self._open().execute("DELETE FROM cache_locks WHERE name = ? AND owner = ?", (name, self.origin))
+
+
+def cache_backend_from_env() -> CacheBackend:
+    """Backend según `CACHE_BACKEND`: 'local' (por defecto) o 'sqlite'."""
+    if CACHE_BACKEND == 'sqlite':
+        return SqliteCacheBackend()
+    if CACHE_BACKEND != 'local':
+        print(f"ERROR: CACHE_BACKEND desconocido '{CACHE_BACKEND}'; se usa la caché local")
+    return LocalCacheBackend()
@@ -0,0 +1,408 @@
+"""
+Caché stale-while-revalidate de rangos de Google Sheets.
+
+Cada par (spreadsheet_id, rango) guarda la última respuesta de `values().get`. Las
+lecturas devuelven el valor en caché inmediatamente y, si es más antiguo que
+`revalidate_after`, lanzan una revalidación en segundo plano. La revalidación consulta
+primero `version`/`modifiedTime` de la hoja en Drive y sólo vuelve a descargar el
+rango si cambió. Si el valor supera `max_staleness` (o fue invalidado explícitamente
+tras una escritura propia) la lectura espera a la revalidación.
+
+Con un `SheetMirror`, cada versión descargada se sincroniza al espejo local en segundo
+plano. Tras un reinicio las lecturas parten del espejo con la antigüedad de su última
+sincronización: una copia reciente se sirve mientras se revalida en segundo plano y una
+que supera `max_staleness` se revalida antes; si Google falla se sirve igual.
+
+Con varios workers, la versión de la hoja y los rangos descargados se publican en el
+`CacheBackend` compartido: un worker que necesita revalidar toma el lock del rango y
+reutiliza lo que ya descargó otro worker para la misma versión. Las invalidaciones por
+escrituras propias se propagan a los demás workers.
+
+Las escrituras pendientes de la cola de estados (`status_writer.py`) se superponen a los
+valores servidos (`set_pending`), así que una marca de 'Enviado' se ve de inmediato aunque
+todavía no se haya escrito en la hoja.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+
+import google_async
+from shared_cache import CacheBackend, LocalCacheBackend
+from sheet_mirror import SheetMirror
+from tabs import column_index, sheet_name_of
+
+
+# Segundos tras los cuales un valor se revalida en segundo plano
+SHEET_CACHE_REVALIDATE_AFTER = float(os.getenv("SHEET_CACHE_REVALIDATE_AFTER", "5"))
+# Antigüedad máxima (segundos) que se tolera servir sin revalidar antes
+SHEET_CACHE_MAX_STALENESS = float(os.getenv("SHEET_CACHE_MAX_STALENESS", "300"))
+
+# Espacios de nombres en el backend compartido
+_SHARED_RANGES = 'sheet_ranges'
+_SHARED_VERSIONS = 'sheet_versions'
+
+
+@dataclass
+class SheetSnapshot:
+    """Valores de un rango junto con la versión de la hoja de la que provienen."""
+    values: list[list[str]]
+    version: str | None
+    fetched_at: float  # Hora (time.time()) de la descarga; igual en todos los workers
+    checked_at: float = field(default=0.0)
+    invalidated: bool = False
+
+
+class SheetRangeCache:
+    def __init__(
+        self,
+        get_sheet_service,
+        get_drive_service,
+        revalidate_after: float = SHEET_CACHE_REVALIDATE_AFTER,
+        max_staleness: float = SHEET_CACHE_MAX_STALENESS,
+        mirror: SheetMirror | None = None,
+        shared: CacheBackend | None = None,
+    ):
+        self._get_sheet_service = get_sheet_service
+        self._get_drive_service = get_drive_service
+        self.revalidate_after = revalidate_after
+        self.max_staleness = max_staleness
+        self._entries: dict[tuple[str, str], SheetSnapshot] = {}
+        self._locks: dict[tuple[str, str], asyncio.Lock] = {}
+        self._background: dict[tuple[str, str], asyncio.Task] = {}
+        self._mirror = mirror
+        self._mirror_tasks: set[asyncio.Task] = set()
+        self._mirror_lock = asyncio.Lock()
+        self._shared = shared or LocalCacheBackend()
+        self._invalidation_cursor: int | None = None
+        # Invalidaciones recibidas por rango; una revalidación que empezó antes de la última
+        # invalidación puede haber leído datos viejos y su resultado no cuenta como fresco
+        self._invalidations: dict[tuple[str, str], int] = {}
+        # Escrituras pendientes por (spreadsheet_id, pestaña): { (fila, columna): valor }
+        self._pending: dict[tuple[str, str], dict[tuple[int, int], str]] = {}
+        self._pending_generations: dict[tuple[str, str], int] = {}
+        # Rango -> (snapshot base, generación, snapshot con las escrituras pendientes)
+        self._overlaid: dict[tuple[str, str], tuple[SheetSnapshot, int, SheetSnapshot]] = {}
+        # Rangos servidos desde la caché / que hubo que revalidar antes de servir
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, spreadsheet_id: str, range_name: str) -> SheetSnapshot:
+        return (await self.get_many(spreadsheet_id, [range_name]))[0]
+
+    async def get_many(self, spreadsheet_id: str, range_names: list[str]) -> list[SheetSnapshot]:
+        """
+        Devuelve varios rangos de la misma hoja. Los que deben revalidarse antes de servirse
+        se descargan juntos con una única llamada a `values.batchGet`.
+        """
+        await self._apply_shared_invalidations()
+        now = time.monotonic()
+        blocking = []
+        for range_name in dict.fromkeys(range_names):
+            key = (spreadsheet_id, range_name)
+            entry = self._entries.get(key)
+            if entry is None and self._mirror is not None:
+                # La copia local conserva la antigüedad de su última sincronización: se revalida
+                # en segundo plano o, si es demasiado vieja, antes de servirla
+                entry = await self._restore(key)
+            if entry is None or entry.invalidated or now - entry.checked_at > self.max_staleness:
+                blocking.append(key)
+            elif now - entry.checked_at > self.revalidate_after:
+                self._schedule_refresh(key)
+
+        self.misses += len(blocking)
+        self.hits += len(range_names) - len(blocking)
+        if blocking:
+            try:
+                await self._refresh(blocking)
+                # Una invalidación llegada durante la descarga obliga a repetirla
+                raced = [key for key in blocking if key in self._entries and self._entries[key].invalidated]
+                if raced:
+                    await self._refresh(raced)
+            except Exception as e:
+                if any(key not in self._entries for key in blocking):
+                    raise
+                # Google no responde: se sirve la última copia conocida
+                print(f"ERROR: Fallo al revalidar {', '.join(r for _, r in blocking)}; se sirve la última copia: {e}")
+        return [self._with_pending((spreadsheet_id, range_name)) for range_name in range_names]
+
+    def set_pending(self, spreadsheet_id: str, sheet_name: str, sheet_row_number: int, column_letter: str, value: str) -> None:
+        """Registra una escritura aún no enviada a la hoja para servirla superpuesta."""
+        sheet = (spreadsheet_id, sheet_name)
+        self._pending.setdefault(sheet, {})[(sheet_row_number, column_index(column_letter))] = value
+        self._pending_generations[sheet] = self._pending_generations.get(sheet, 0) + 1
+
+    def clear_pending(self, spreadsheet_id: str, sheet_name: str, sheet_row_number: int, column_letter: str) -> None:
+        """Quita una escritura ya aplicada en la hoja."""
+        sheet = (spreadsheet_id, sheet_name)
+        cells = self._pending.get(sheet)
+        if cells is None or cells.pop((sheet_row_number, column_index(column_letter)), None) is None:
+            return
+        if not cells:
+            del self._pending[sheet]
+        self._pending_generations[sheet] = self._pending_generations.get(sheet, 0) + 1
+
+    def replace_pending(self, cells, value: str) -> None:
+        """
+        Reemplaza todas las escrituras pendientes por `cells` (spreadsheet_id, pestaña, fila,
+        columna), p. ej. las que comparten los workers. Sólo cambian las pestañas afectadas.
+        """
+        pending: dict[tuple[str, str], dict[tuple[int, int], str]] = {}
+        for spreadsheet_id, sheet_name, sheet_row_number, column_letter in cells:
+            pending.setdefault((spreadsheet_id, sheet_name), {})[(sheet_row_number, column_index(column_letter))] = value
+        for sheet in set(self._pending) | set(pending):
+            if self._pending.get(sheet) != pending.get(sheet):
+                self._pending_generations[sheet] = self._pending_generations.get(sheet, 0) + 1
+        self._pending = pending
+
+    async def invalidate(self, spreadsheet_id: str, sheet_name: str | None = None) -> None:
+        """
+        Marca como inválidos los rangos de la hoja (o de una pestaña concreta) para que la
+        próxima lectura vuelva a descargarlos, también en los demás workers. Se llama tras
+        escribir en la hoja.
+        """
+        for key in set(self._entries) | set(self._locks):
+            cached_spreadsheet_id, range_name = key
+            if cached_spreadsheet_id != spreadsheet_id:
+                continue
+            if sheet_name is None or sheet_name_of(range_name) == sheet_name:
+                self._mark_invalidated(key)
+        prefix = _shared_key((spreadsheet_id, f"{sheet_name}!" if sheet_name else ''))
+        try:
+            await self._shared.invalidate(_SHARED_RANGES, prefix)
+            await self._shared.invalidate(_SHARED_VERSIONS, spreadsheet_id)
+        except Exception as e:
+            print(f"ERROR: No se pudo propagar la invalidación de {prefix}: {e}")
+
+    async def _apply_shared_invalidations(self) -> None:
+        """Marca como inválidos los rangos que otros workers invalidaron."""
+        try:
+            self._invalidation_cursor, prefixes = await self._shared.poll_invalidations(
+                _SHARED_RANGES, self._invalidation_cursor
+            )
+        except Exception as e:
+            print(f"ERROR: No se pudieron leer las invalidaciones compartidas: {e}")
+            return
+        for prefix in prefixes:
+            for key in set(self._entries) | set(self._locks):
+                if _shared_key(key).startswith(prefix):
+                    self._mark_invalidated(key)
+
+    def _mark_invalidated(self, key: tuple[str, str]) -> None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.invalidated = True
+        self._invalidations[key] = self._invalidations.get(key, 0) + 1
+
+    def _schedule_refresh(self, key: tuple[str, str]) -> None:
+        task = self._background.get(key)
+        if task is not None and not task.done():
+            return
+        self._background[key] = asyncio.create_task(self._refresh_quietly(key))
+
+    async def _refresh_quietly(self, key: tuple[str, str]) -> None:
+        try:
+            await self._refresh([key])
+        except Exception as e:
+            # Se sigue sirviendo el último valor conocido
+            print(f"ERROR: Fallo al revalidar {key[1]} en segundo plano: {e}")
+
+    async def _refresh(self, keys: list[tuple[str, str]]) -> None:
+        """Revalida rangos de una misma hoja; descarga sólo los que cambiaron de versión."""
+        async with AsyncExitStack() as stack:
+            # Orden fijo de adquisición para no bloquearse con otras revalidaciones; el lock
+            # compartido evita que otro worker descargue el mismo rango a la vez
+            for key in sorted(keys):
+                await stack.enter_async_context(self._locks.setdefault(key, asyncio.Lock()))
+                await stack.enter_async_context(self._shared.refresh_lock(_SHARED_RANGES, _shared_key(key)))
+
+            now = time.monotonic()
+            # Otra corrutina pudo haber revalidado mientras se esperaban los locks
+            pending = [key for key in keys if not self._is_fresh(self._entries.get(key), now)]
+            if not pending:
+                return
+            started = {key: self._invalidations.get(key, 0) for key in pending}
+
+            spreadsheet_id = pending[0][0]
+            version = await self._shared_version(spreadsheet_id)
+            to_fetch = []
+            for key in pending:
+                entry = self._entries.get(key)
+                if entry is not None and not entry.invalidated and version is not None and entry.version == version:
+                    entry.checked_at = now
+                else:
+                    to_fetch.append(key)
+            to_fetch = await self._adopt_shared(to_fetch, version, now, started)
+            if not to_fetch:
+                return
+
+            sheets = self._get_sheet_service().spreadsheets()
+            if len(to_fetch) == 1:
+                sheet_result = await google_async.execute(sheets.values().get(
+                    spreadsheetId=spreadsheet_id,
+                    range=to_fetch[0][1]))
+                value_ranges = [sheet_result]
+            else:
+                batch_result = await google_async.execute(sheets.values().batchGet(
+                    spreadsheetId=spreadsheet_id,
+                    ranges=[range_name for _, range_name in to_fetch]))
+                value_ranges = batch_result.get('valueRanges', [])
+
+            fetched_at = time.time()
+            published = {}
+            for key, value_range in zip(to_fetch, value_ranges):
+                self._entries[key] = SheetSnapshot(
+                    values=value_range.get('values', []),
+                    version=version,
+                    fetched_at=fetched_at,
+                    checked_at=now,
+                    invalidated=self._invalidations.get(key, 0) != started[key],
+                )
+                if self._entries[key].invalidated:
+                    continue
+                self._sync_mirror(key, self._entries[key])
+                if version is not None:
+                    published[_shared_key(key)] = {
+                        "values": self._entries[key].values, "version": version, "fetched_at": fetched_at,
+                    }
+            try:
+                await self._shared.set_many(_SHARED_RANGES, published)
+            except Exception as e:
+                print(f"ERROR: No se pudieron publicar los rangos en la caché compartida: {e}")
+
+    async def _shared_version(self, spreadsheet_id: str) -> str | None:
+        """Versión de la hoja; si otro worker la consultó hace poco se reutiliza la suya."""
+        try:
+            stored = await self._shared.get(_SHARED_VERSIONS, spreadsheet_id)
+        except Exception as e:
+            print(f"ERROR: No se pudo leer la versión compartida de {spreadsheet_id}: {e}")
+            stored = None
+        if stored is not None and time.time() - stored['checked_at'] <= self.revalidate_after:
+            return stored['version']
+
+        version = await self._spreadsheet_version(spreadsheet_id)
+        if version is not None:
+            try:
+                await self._shared.set(_SHARED_VERSIONS, spreadsheet_id, {"version": version, "checked_at": time.time()})
+            except Exception as e:
+                print(f"ERROR: No se pudo publicar la versión de {spreadsheet_id}: {e}")
+        return version
+
+    async def _adopt_shared(
+        self, keys: list[tuple[str, str]], version: str | None, now: float, started: dict[tuple[str, str], int],
+    ) -> list[tuple[str, str]]:
+        """Toma de la caché compartida los rangos ya descargados en esta versión; devuelve los que faltan."""
+        if version is None:
+            return keys
+        try:
+            stored = await self._shared.get_many(_SHARED_RANGES, [_shared_key(key) for key in keys])
+        except Exception as e:
+            print(f"ERROR: No se pudo leer la caché compartida de rangos: {e}")
+            return keys
+        missing = []
+        for key in keys:
+            entry = stored.get(_shared_key(key))
+            if entry is None or entry['version'] != version:
+                missing.append(key)
+                continue
+            self._entries[key] = SheetSnapshot(
+                values=entry['values'],
+                version=version,
+                fetched_at=entry['fetched_at'],
+                checked_at=now,
+                invalidated=self._invalidations.get(key, 0) != started[key],
+            )
+        return missing
+
+    async def _restore(self, key: tuple[str, str]) -> SheetSnapshot | None:
+        """Carga el rango desde el espejo local (sólo si aún no está en memoria)."""
+        try:
+            stored = await self._mirror.load_range(*key)
+        except Exception as e:
+            print(f"ERROR: No se pudo leer {key[1]} del espejo local: {e}")
+            return None
+        if stored is None:
+            return None
+        if key not in self._entries:
+            values, version, synced_at = stored
+            age = max(time.time() - synced_at, 0.0)
+            self._entries[key] = SheetSnapshot(
+                values=values,
+                version=version,
+                fetched_at=synced_at,
+                checked_at=time.monotonic() - age,
+            )
+        return self._entries[key]
+
+    def _sync_mirror(self, key: tuple[str, str], snapshot: SheetSnapshot) -> None:
+        if self._mirror is None:
+            return
+        task = asyncio.create_task(self._sync_mirror_quietly(key, snapshot))
+        self._mirror_tasks.add(task)
+        task.add_done_callback(self._mirror_tasks.discard)
+
+    async def _sync_mirror_quietly(self, key: tuple[str, str], snapshot: SheetSnapshot) -> None:
+        try:
+            async with self._mirror_lock:
+                # Si mientras tanto llegó una versión más nueva, se guarda sólo esa
+                if self._entries.get(key) is snapshot:
+                    await self._mirror.save_range(key[0], key[1], snapshot.version, snapshot.values)
+        except Exception as e:
+            print(f"ERROR: No se pudo sincronizar {key[1]} con el espejo local: {e}")
+
+    def _with_pending(self, key: tuple[str, str]) -> SheetSnapshot:
+        """
+        El snapshot con las escrituras pendientes superpuestas. Se memoriza por snapshot y
+        generación para que el índice de la pestaña se reconstruya sólo cuando algo cambió.
+        """
+        snapshot = self._entries[key]
+        sheet = (key[0], sheet_name_of(key[1]))
+        cells = self._pending.get(sheet)
+        # Las filas se ubican por posición: sólo vale para rangos que empiezan en A1
+        if not cells or not key[1].partition('!')[2].upper().startswith('A1'):
+            return snapshot
+        generation = self._pending_generations[sheet]
+        memo = self._overlaid.get(key)
+        if memo is not None and memo[0] is snapshot and memo[1] == generation:
+            return memo[2]
+
+        values = list(snapshot.values)
+        for (row_number, column), value in cells.items():
+            if 1 < row_number <= len(values):
+                row = list(values[row_number - 1])
+                row.extend([''] * (column + 1 - len(row)))
+                row[column] = value
+                values[row_number - 1] = row
+        # La versión depende de las celdas superpuestas (no de la generación, que es local)
+        # para que todos los workers den el mismo ETag con las mismas escrituras pendientes
+        cells_json = json.dumps(sorted(cells.items()), ensure_ascii=False, separators=(',', ':'))
+        overlaid = SheetSnapshot(
+            values=values,
+            version=f"{snapshot.version}+{hashlib.sha256(cells_json.encode('utf-8')).hexdigest()[:12]}",
+            fetched_at=snapshot.fetched_at,
+            checked_at=snapshot.checked_at,
+        )
+        self._overlaid[key] = (snapshot, generation, overlaid)
+        return overlaid
+
+    def _is_fresh(self, entry: SheetSnapshot | None, now: float) -> bool:
+        return entry is not None and not entry.invalidated and now - entry.checked_at <= self.revalidate_after
+
+    async def _spreadsheet_version(self, spreadsheet_id: str) -> str | None:
+        """Versión de la hoja según Drive; None si no se puede determinar."""
+        try:
+            metadata = await google_async.execute(self._get_drive_service().files().get(
+                fileId=spreadsheet_id,
+                fields='version, modifiedTime'))
+        except Exception as e:
+            print(f"ERROR: No se pudo obtener la versión de la hoja {spreadsheet_id}: {e}")
+            return None
+        return f"{metadata.get('version')}:{metadata.get('modifiedTime')}"
+
+
+def _shared_key(key: tuple[str, str]) -> str:
+    return f"{key[0]}|{key[1]}"
@@ -0,0 +1,138 @@
+"""
+Cambios por fila de cada pestaña, enviados a los navegadores con Server-Sent Events.
+
+Mientras haya clientes conectados a `/sheets/{tab}/events`, un único vigilante por
+pestaña relee la pestaña por la caché (que revalida contra la versión de la hoja) y
+compara cada índice nuevo con el anterior: las filas modificadas, agregadas o quitadas
+se envían una sola vez a todos los clientes. Las escrituras propias del backend (la
+marca de 'Enviado') se publican en el momento, sin esperar a la próxima revalidación.
+
+Eventos:
+- `ready`: conexión establecida; el cliente vuelve a pedir su página (con ETag, suele
+  ser un 304) para no perder cambios anteriores a la suscripción.
+- `patch`: `{"tab", "rows": [filas completas o parciales], "added": [...], "removed": [...]}`,
+  con las filas identificadas por `sheet_row_number`.
+- `reset`: el cliente debe volver a pedir su página (cambiaron los encabezados o se
+  atrasó y se descartaron eventos).
+"""
+
+import asyncio
+import json
+import os
+from collections.abc import AsyncIterator
+
+from sheet_query import ROW_NUMBER_FIELD, TabIndex
+from tabs import TabConfig, column_index
+
+
+# Intervalo (segundos) entre relecturas de una pestaña con clientes conectados
+SHEET_EVENTS_POLL_INTERVAL = float(os.getenv("SHEET_EVENTS_POLL_INTERVAL", "5"))
+# Cada cuántos segundos se envía un comentario para mantener viva la conexión
+SHEET_EVENTS_KEEPALIVE = 15.0
+# Eventos pendientes por cliente antes de descartarlos y pedirle que recargue
+SHEET_EVENTS_QUEUE_SIZE = 100
+
+SSE_MEDIA_TYPE = 'text/event-stream'
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+class SheetEventHub:
+    def __init__(self, load_tab, poll_interval: float = SHEET_EVENTS_POLL_INTERVAL):
+        # load_tab(tab) -> TabIndex actual de la pestaña (pasando por la caché)
+        self._load_tab = load_tab
+        self.poll_interval = poll_interval
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+        self._watchers: dict[str, asyncio.Task] = {}
+        self._last: dict[str, TabIndex] = {}
+        self._event_id = 0
+
+    async def subscribe(self, tab: TabConfig) -> AsyncIterator[str]:
+        """Flujo SSE de un cliente; termina cuando el cliente se desconecta."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SHEET_EVENTS_QUEUE_SIZE)
+        self._subscribers.setdefault(tab.key, set()).add(queue)
+        if tab.key not in self._watchers:
+            self._watchers[tab.key] = asyncio.create_task(self._watch(tab))
+        try:
+            yield self._format('ready', {"tab": tab.key})
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SHEET_EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield event
+        finally:
+            subscribers = self._subscribers.get(tab.key, set())
+            subscribers.discard(queue)
+            if not subscribers:
+                self._subscribers.pop(tab.key, None)
+                self._last.pop(tab.key, None)
+                watcher = self._watchers.pop(tab.key, None)
+                if watcher is not None:
+                    watcher.cancel()
+
+    def observe(self, tab_key: str, tab_index: TabIndex) -> None:
+        """Compara el índice con el último visto y publica las diferencias."""
+        previous = self._last.get(tab_key)
+        if previous is tab_index or tab_key not in self._subscribers:
+            return
+        self._last[tab_key] = tab_index
+        if previous is None:
+            return
+        if previous.headers != tab_index.headers:
+            self._publish(tab_key, self._format('reset', {"tab": tab_key}))
+            return
+        rows, added, removed = diff_tab_indexes(previous, tab_index)
+        if rows or removed:
+            self._publish(tab_key, self._format('patch', {"tab": tab_key, "rows": rows, "added": added, "removed": removed}))
+
+    def publish_cell(self, tab_key: str, sheet_row_number: int, column_letter: str, value) -> None:
+        """Publica una escritura propia en una celda (p. ej. la marca de 'Enviado')."""
+        tab_index = self._last.get(tab_key)
+        if tab_index is None:
+            return
+        position = column_index(column_letter)
+        if position >= len(tab_index.headers):
+            return
+        row = {ROW_NUMBER_FIELD: sheet_row_number, tab_index.headers[position]: value}
+        self._publish(tab_key, self._format('patch', {"tab": tab_key, "rows": [row], "added": [], "removed": []}))
+
+    def _publish(self, tab_key: str, event: str) -> None:
+        for queue in self._subscribers.get(tab_key, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Cliente atrasado: se descartan sus eventos y se le pide recargar
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._format('reset', {"tab": tab_key}))
+
+    def _format(self, event: str, data: dict) -> str:
+        self._event_id += 1
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        return f"id: {self._event_id}\nevent: {event}\ndata: {payload}\n\n"
+
+    async def _watch(self, tab: TabConfig) -> None:
+        while True:
+            try:
+                self.observe(tab.key, await self._load_tab(tab))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"ERROR: Fallo al vigilar cambios de la pestaña {tab.key}: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+
+def diff_tab_indexes(previous: TabIndex, current: TabIndex) -> tuple[list[dict], list[int], list[int]]:
+    """Filas modificadas o agregadas (completas), sus números de fila agregados y los quitados."""
+    rows, added = [], []
+    previous_rows, current_rows = previous.rows, current.rows
+    for i, row in enumerate(current_rows):
+        if i >= len(previous_rows):
+            added.append(i + 2)
+        elif row == previous_rows[i]:
+            continue
+        # Las filas de datos empiezan en la 2 (la 1 son los encabezados)
+        rows.append({**current.row_dict(i), ROW_NUMBER_FIELD: i + 2})
+    removed = list(range(len(current_rows) + 2, len(previous_rows) + 2))
+    return rows, added, removed
@@ -0,0 +1,329 @@
+"""
+Espejo local (SQLite) de las pestañas de la hoja y de los índices de carpetas de Drive.
+
+Cada rango descargado se guarda fila por fila con columnas indexadas (`id`, `email`,
+`legajo` y la columna de estado de la pestaña), que resuelven sin recorrer la pestaña la
+búsqueda de empleados y los filtros por esas columnas. La sincronización es incremental: sólo
+ocurre cuando la caché descarga una versión nueva de la hoja y sólo se escriben las
+filas que cambiaron. Los índices de carpetas se guardan junto con el token del feed de
+cambios de Drive, así que al arrancar se restauran y se ponen al día con los cambios
+pendientes en lugar de volver a listar cada carpeta.
+
+Tras un reinicio, o si Google no responde, las lecturas se sirven desde este espejo; la
+hora de la última sincronización indica a la caché si hay que revalidar antes de servirlas.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from tabs import TABS, column_index, sheet_name_of
+
+
+SHEET_MIRROR_DB = os.getenv(
+    "SHEET_MIRROR_DB",
+    os.path.join(os.path.dirname(__file__), 'data', 'sheet_mirror.sqlite3'),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheet_ranges (
+    spreadsheet_id TEXT NOT NULL,
+    range_name TEXT NOT NULL,
+    version TEXT,
+    headers TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (spreadsheet_id, range_name)
+);
+CREATE TABLE IF NOT EXISTS sheet_rows (
+    spreadsheet_id TEXT NOT NULL,
+    range_name TEXT NOT NULL,
+    row_number INTEGER NOT NULL,
+    id TEXT,
+    email TEXT,
+    legajo TEXT,
+    status TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (spreadsheet_id, range_name, row_number)
+);
+CREATE TABLE IF NOT EXISTS drive_files (
+    folder_id TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (folder_id, file_id)
+);
+CREATE TABLE IF NOT EXISTS mirror_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Se crean después de sumar las columnas indexadas a las bases que no las tenían
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS sheet_rows_id ON sheet_rows (id);
+CREATE INDEX IF NOT EXISTS sheet_rows_email ON sheet_rows (email);
+CREATE INDEX IF NOT EXISTS sheet_rows_legajo ON sheet_rows (legajo);
+CREATE INDEX IF NOT EXISTS sheet_rows_status ON sheet_rows (range_name, status);
+"""
+# Columnas indexadas de sheet_rows; guardan el valor de la celda sin espacios alrededor y en
+# minúsculas, o NULL si la celda está vacía
+INDEXED_COLUMNS = ('id', 'email', 'legajo', 'status')
+
+_DRIVE_PAGE_TOKEN = 'drive_page_token'
+# Segundos que una conexión espera a que otro worker suelte la base antes de fallar
+_BUSY_TIMEOUT = 30
+
+
+class SheetMirror:
+    def __init__(self, db_path: str = SHEET_MIRROR_DB):
+        self.db_path = db_path
+        self._db_lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    # --- API pública ---
+
+    async def save_range(self, spreadsheet_id: str, range_name: str, version: str | None, values: list[list]) -> int:
+        """Sincroniza un rango descargado. Devuelve cuántas filas cambiaron."""
+        return await asyncio.to_thread(self._save_range, spreadsheet_id, range_name, version, values)
+
+    async def load_range(self, spreadsheet_id: str, range_name: str) -> tuple[list[list], str | None, float] | None:
+        """
+        Valores guardados del rango (encabezados incluidos), su versión y la hora
+        (time.time()) de la última sincronización, o None.
+        """
+        return await asyncio.to_thread(self._load_range, spreadsheet_id, range_name)
+
+    async def match_rows(self, spreadsheet_id: str, range_name: str, filters: dict[str, str]) -> tuple[str | None, list[int]] | None:
+        """
+        Versión guardada del rango y números de fila cuyas columnas indexadas valen
+        exactamente lo pedido ({ columna: valor en minúsculas }; '' busca celdas vacías), o None.
+        """
+        return await asyncio.to_thread(self._match_rows, spreadsheet_id, range_name, dict(filters))
+
+    async def find_employee_rows(self, spreadsheet_id: str, key: str) -> dict[str, tuple[str | None, list[int]]]:
+        """Por rango guardado: su versión y los números de fila con ese email o legajo."""
+        return await asyncio.to_thread(self._find_employee_rows, spreadsheet_id, key)
+
+    async def load_drive_state(self) -> tuple[str | None, dict[str, dict[str, str]]]:
+        """Token del feed de cambios y archivos de cada carpeta: { folder_id: { file_id: nombre } }."""
+        return await asyncio.to_thread(self._load_drive_state)
+
+    async def save_folder(self, folder_id: str, files: dict[str, str], page_token: str | None) -> None:
+        await asyncio.to_thread(self._save_folder, folder_id, dict(files), page_token)
+
+    async def apply_drive_changes(self, changes: list[tuple[str, str, str | None]], page_token: str | None) -> None:
+        """Aplica cambios (carpeta, archivo, nombre o None si se quitó) y guarda el nuevo token."""
+        await asyncio.to_thread(self._apply_drive_changes, changes, page_token)
+
+    async def clear_drive_state(self) -> None:
+        await asyncio.to_thread(self._clear_drive_state)
+
+    # --- Acceso a SQLite (se ejecuta en hilos, serializado con _db_lock) ---
+
+    def _open(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=_BUSY_TIMEOUT)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(sheet_rows)")}
+            missing = [column for column in INDEXED_COLUMNS if column not in columns]
+            for column in missing:
+                conn.execute(f"ALTER TABLE sheet_rows ADD COLUMN {column} TEXT")
+            if missing:
+                # Las filas guardadas no tienen los valores indexados: se vuelven a sincronizar
+                conn.execute("DELETE FROM sheet_rows")
+                conn.execute("DELETE FROM sheet_ranges")
+            conn.executescript(_INDEXES)
+            self._conn = conn
+        return self._conn
+
+    def _transaction(self, conn: sqlite3.Connection, statements) -> None:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            statements(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _save_range(self, spreadsheet_id: str, range_name: str, version: str | None, values: list[list]) -> int:
+        headers = values[0] if values else []
+        rows = values[1:]
+        columns = indexed_columns(range_name, headers)
+        headers_json = json.dumps(headers, ensure_ascii=False)
+
+        with self._db_lock:
+            conn = self._open()
+            stored = conn.execute(
+                "SELECT headers FROM sheet_ranges WHERE spreadsheet_id = ? AND range_name = ?",
+                (spreadsheet_id, range_name),
+            ).fetchone()
+            # Si cambiaron los encabezados cambian las columnas indexadas: se reescribe todo
+            existing = {}
+            if stored is not None and stored[0] == headers_json:
+                existing = dict(conn.execute(
+                    "SELECT row_number, data FROM sheet_rows WHERE spreadsheet_id = ? AND range_name = ?",
+                    (spreadsheet_id, range_name),
+                ))
+
+            changed = []
+            for row_number, row in enumerate(rows, start=2):
+                data = json.dumps(row, ensure_ascii=False)
+                if existing.get(row_number) != data:
+                    changed.append((
+                        spreadsheet_id, range_name, row_number,
+                        *(_cell(row, columns[column]) for column in INDEXED_COLUMNS),
+                        data,
+                    ))
+
+            def statements(conn):
+                conn.executemany(
+                    "INSERT OR REPLACE INTO sheet_rows "
+                    "(spreadsheet_id, range_name, row_number, id, email, legajo, status, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    changed,
+                )
+                conn.execute(
+                    "DELETE FROM sheet_rows WHERE spreadsheet_id = ? AND range_name = ? AND row_number > ?",
+                    (spreadsheet_id, range_name, len(rows) + 1),
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO sheet_ranges "
+                    "(spreadsheet_id, range_name, version, headers, row_count, synced_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (spreadsheet_id, range_name, version, headers_json, len(rows), time.time()),
+                )
+
+            self._transaction(conn, statements)
+        return len(changed)
+
+    def _load_range(self, spreadsheet_id: str, range_name: str) -> tuple[list[list], str | None, float] | None:
+        with self._db_lock:
+            conn = self._open()
+            stored = conn.execute(
+                "SELECT version, headers, synced_at FROM sheet_ranges WHERE spreadsheet_id = ? AND range_name = ?",
+                (spreadsheet_id, range_name),
+            ).fetchone()
+            if stored is None:
+                return None
+            rows = conn.execute(
+                "SELECT data FROM sheet_rows WHERE spreadsheet_id = ? AND range_name = ? ORDER BY row_number",
+                (spreadsheet_id, range_name),
+            ).fetchall()
+        headers = json.loads(stored[1])
+        values = [headers] if headers else []
+        values.extend(json.loads(data) for (data,) in rows)
+        return values, stored[0], stored[2]
+
+    def _match_rows(self, spreadsheet_id: str, range_name: str, filters: dict[str, str]) -> tuple[str | None, list[int]] | None:
+        unknown = set(filters) - set(INDEXED_COLUMNS)
+        if unknown:
+            raise ValueError(f"Columnas no indexadas: {', '.join(sorted(unknown))}")
+        # `IS` compara también con NULL (celda vacía) y usa los índices igual que `=`
+        conditions = ''.join(f" AND {column} IS ?" for column in filters)
+        with self._db_lock:
+            conn = self._open()
+            stored = conn.execute(
+                "SELECT version FROM sheet_ranges WHERE spreadsheet_id = ? AND range_name = ?",
+                (spreadsheet_id, range_name),
+            ).fetchone()
+            if stored is None:
+                return None
+            rows = conn.execute(
+                "SELECT row_number FROM sheet_rows WHERE spreadsheet_id = ? AND range_name = ?"
+                f"{conditions} ORDER BY row_number",
+                (spreadsheet_id, range_name, *(value or None for value in filters.values())),
+            ).fetchall()
+        return stored[0], [row_number for (row_number,) in rows]
+
+    def _find_employee_rows(self, spreadsheet_id: str, key: str) -> dict[str, tuple[str | None, list[int]]]:
+        with self._db_lock:
+            conn = self._open()
+            found = {
+                range_name: (version, []) for range_name, version in conn.execute(
+                    "SELECT range_name, version FROM sheet_ranges WHERE spreadsheet_id = ?", (spreadsheet_id,)
+                )
+            }
+            rows = conn.execute(
+                "SELECT range_name, row_number FROM sheet_rows "
+                "WHERE spreadsheet_id = ? AND (email = ? OR legajo = ?) ORDER BY range_name, row_number",
+                (spreadsheet_id, key, key),
+            ).fetchall()
+        for range_name, row_number in rows:
+            if range_name in found:
+                found[range_name][1].append(row_number)
+        return found
+
+    def _load_drive_state(self) -> tuple[str | None, dict[str, dict[str, str]]]:
+        with self._db_lock:
+            conn = self._open()
+            token = conn.execute("SELECT value FROM mirror_state WHERE key = ?", (_DRIVE_PAGE_TOKEN,)).fetchone()
+            folders: dict[str, dict[str, str]] = {}
+            for folder_id, file_id, name in conn.execute("SELECT folder_id, file_id, name FROM drive_files"):
+                folders.setdefault(folder_id, {})[file_id] = name
+        return (token[0] if token else None), folders
+
+    def _save_folder(self, folder_id: str, files: dict[str, str], page_token: str | None) -> None:
+        def statements(conn):
+            conn.execute("DELETE FROM drive_files WHERE folder_id = ?", (folder_id,))
+            conn.executemany(
+                "INSERT INTO drive_files (folder_id, file_id, name) VALUES (?, ?, ?)",
+                [(folder_id, file_id, name) for file_id, name in files.items()],
+            )
+            _set_state(conn, _DRIVE_PAGE_TOKEN, page_token)
+
+        with self._db_lock:
+            self._transaction(self._open(), statements)
+
+    def _apply_drive_changes(self, changes: list[tuple[str, str, str | None]], page_token: str | None) -> None:
+        def statements(conn):
+            for folder_id, file_id, name in changes:
+                if name is None:
+                    conn.execute("DELETE FROM drive_files WHERE folder_id = ? AND file_id = ?", (folder_id, file_id))
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO drive_files (folder_id, file_id, name) VALUES (?, ?, ?)",
+                        (folder_id, file_id, name),
+                    )
+            _set_state(conn, _DRIVE_PAGE_TOKEN, page_token)
+
+        with self._db_lock:
+            self._transaction(self._open(), statements)
+
+    def _clear_drive_state(self) -> None:
+        def statements(conn):
+            conn.execute("DELETE FROM drive_files")
+            conn.execute("DELETE FROM mirror_state WHERE key = ?", (_DRIVE_PAGE_TOKEN,))
+
+        with self._db_lock:
+            self._transaction(self._open(), statements)
+
+
+def indexed_columns(range_name: str, headers: list[str]) -> dict[str, int | None]:
+    """Posición de las columnas indexadas; la de estado sale del registro de pestañas."""
+    lowered = [str(header).strip().lower() for header in headers]
+
+    def position(name: str) -> int | None:
+        return lowered.index(name) if name in lowered else None
+
+    tab = TABS.get(sheet_name_of(range_name))
+    return {
+        'id': position('id'),
+        'email': position('email'),
+        'legajo': position('legajo'),
+        'status': column_index(tab.status_column) if tab else None,
+    }
+
+
+def _cell(row: list, position: int | None) -> str | None:
+    if position is None or position >= len(row) or row[position] in (None, ''):
+        return None
+    return str(row[position]).strip().lower() or None
+
+
+def _set_state(conn: sqlite3.Connection, key: str, value: str | None) -> None:
+    conn.execute("INSERT OR REPLACE INTO mirror_state (key, value) VALUES (?, ?)", (key, value))
@@ -0,0 +1,207 @@
+"""
+Paginación, búsqueda y orden del lado del servidor para las pestañas de la hoja.
+
+Por cada versión de una pestaña se construye una única vez un `TabIndex` con las filas
+como tuplas compactas (valores de las columnas y, si la pestaña tiene columna 'id',
+`pdf_drive_id` y `sheet_row_number` al final), el texto de búsqueda de cada fila ya
+normalizado y las columnas en minúsculas. Las consultas (`page`, `page_size`, `q`,
+`filter`, `sort`) se resuelven contra ese índice y sólo se materializa la página
+pedida, como objetos por fila o en formato columnar.
+
+Los filtros sobre las columnas que el espejo local indexa (`id`, `email`, `legajo` y la
+de estado) comparan el valor completo en lugar de buscarlo dentro de la celda, así que
+se pueden resolver con esos índices; `filter=estado:` devuelve las filas sin estado.
+"""
+
+import math
+from dataclasses import dataclass, field
+
+from fastapi import HTTPException
+
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 200
+ROW_NUMBER_FIELD = 'sheet_row_number'
+# Columnas añadidas al final de cada fila cuando la pestaña tiene columna 'id'
+ENRICHMENT_FIELDS = ('pdf_drive_id', ROW_NUMBER_FIELD)
+# Separador entre columnas del texto de búsqueda, para que una coincidencia no cruce columnas
+_SEARCH_SEPARATOR = '\x00'
+
+
+@dataclass
+class TabIndex:
+    headers: list[str]
+    rows: list[tuple]
+    enriched: bool
+    search_text: list[str]
+    columns: dict[str, list[str]]
+    # Versión de los datos de origen (hoja y carpeta de Drive), usada para el ETag
+    version: str = ''
+    # Versión de la hoja de la que sale el índice, para cruzarlo con el espejo local
+    sheet_version: str | None = None
+    # Encabezado en minúsculas -> columna indexada del espejo local ('id', 'email', ...)
+    indexed_columns: dict[str, str] = field(default_factory=dict)
+    _orderings: dict[str, list[int]] = field(default_factory=dict)
+
+    def row_dict(self, position: int) -> dict:
+        """La fila como objeto { encabezado: valor }, igual que la respuesta histórica."""
+        row = self.rows[position]
+        row_dict = dict(zip(self.headers, row))
+        if self.enriched:
+            row_dict['pdf_drive_id'] = row[-2]
+            row_dict[ROW_NUMBER_FIELD] = row[-1]
+        return row_dict
+
+    def iter_dicts(self):
+        return (self.row_dict(i) for i in range(len(self.rows)))
+
+
+@dataclass
+class SheetQuery:
+    page: int = 1
+    page_size: int = DEFAULT_PAGE_SIZE
+    q: str = ''
+    filters: dict[str, str] = field(default_factory=dict)
+    sort: str | None = None
+
+
+def pad_row(row_values: list, width: int) -> tuple:
+    """Fila como tupla de `width` valores, rellenando con None si es más corta."""
+    if len(row_values) >= width:
+        return tuple(row_values[:width])
+    return tuple(row_values) + (None,) * (width - len(row_values))
+
+
+def build_tab_index(headers: list[str], rows: list[tuple], enriched: bool = False) -> TabIndex:
+    """Precalcula el texto de búsqueda y los valores normalizados de cada columna."""
+    columns = {
+        header.lower(): [_normalize(row[j]) for row in rows]
+        for j, header in enumerate(headers)
+    }
+    column_lists = [columns[header.lower()] for header in headers]
+    search_text = [
+        _SEARCH_SEPARATOR.join(values[i] for values in column_lists)
+        for i in range(len(rows))
+    ]
+    return TabIndex(headers=headers, rows=rows, enriched=enriched, search_text=search_text, columns=columns)
+
+
+def parse_sheet_query(query_params) -> SheetQuery | None:
+    """
+    Lee los parámetros de consulta. Devuelve None si no se pidió paginar, buscar ni
+    ordenar, en cuyo caso se responde con la pestaña completa como hasta ahora.
+    """
+    keys = {'page', 'page_size', 'q', 'filter', 'sort'}
+    if not keys.intersection(query_params.keys()):
+        return None
+
+    try:
+        page = max(int(query_params.get('page', 1)), 1)
+        page_size = min(max(int(query_params.get('page_size', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Los parámetros 'page' y 'page_size' deben ser enteros.")
+
+    filters = {}
+    # Filtros por columna con la forma ?filter=columna:valor (se pueden repetir)
+    for raw_filter in query_params.getlist('filter'):
+        column, separator, value = raw_filter.partition(':')
+        if not separator:
+            raise HTTPException(status_code=400, detail=f"Filtro inválido '{raw_filter}': se espera 'columna:valor'.")
+        filters[column.strip().lower()] = value.strip().lower()
+
+    return SheetQuery(
+        page=page,
+        page_size=page_size,
+        q=query_params.get('q', '').strip().lower(),
+        filters=filters,
+        sort=query_params.get('sort') or None,
+    )
+
+
+def run_query(index: TabIndex, query: SheetQuery, matched: list[int] | None = None) -> tuple[list[int], dict]:
+    """
+    Filtra, ordena y pagina el índice. Devuelve las posiciones de la página y los totales.
+    `matched` son las posiciones que cumplen los filtros sobre columnas indexadas, si ya
+    se resolvieron con el espejo local.
+    """
+    positions = _ordering(index, query.sort)
+    if matched is not None:
+        matched = set(matched)
+        positions = [i for i in positions if i in matched]
+
+    if query.q:
+        search_text = index.search_text
+        positions = [i for i in positions if query.q in search_text[i]]
+
+    for column, value in query.filters.items():
+        values = index.columns.get(column)
+        if values is None:
+            raise HTTPException(status_code=400, detail=f"La columna '{column}' no existe en la hoja.")
+        if column not in index.indexed_columns:
+            positions = [i for i in positions if value in values[i]]
+        elif matched is None:
+            positions = [i for i in positions if values[i].strip() == value]
+
+    total = len(positions)
+    start = (query.page - 1) * query.page_size
+    return positions[start:start + query.page_size], {
+        "page": query.page,
+        "page_size": query.page_size,
+        "total": total,
+        "total_rows": len(index.rows),
+        "pages": math.ceil(total / query.page_size),
+    }
+
+
+def rows_payload(index: TabIndex, positions, response_format: str) -> dict:
+    """
+    Filas de `positions` en el formato pedido: `json` (una lista de objetos por fila) o
+    `columnar` (encabezados una vez, filas como listas y columnas de enriquecimiento paralelas).
+    """
+    if response_format == 'columnar':
+        width = len(index.headers)
+        rows = [index.rows[i] for i in positions]
+        payload = {"format": "columnar", "headers": index.headers, "rows": [row[:width] for row in rows]}
+        if index.enriched:
+            payload['pdf_drive_id'] = [row[-2] for row in rows]
+            payload[ROW_NUMBER_FIELD] = [row[-1] for row in rows]
+        return payload
+    return {"headers": index.headers, "data": [index.row_dict(i) for i in positions]}
+
+
+def _ordering(index: TabIndex, sort: str | None) -> list[int]:
+    """Posiciones de las filas según `sort` ('columna' o '-columna'), memorizadas por índice."""
+    if not sort:
+        return list(range(len(index.rows)))
+
+    cached = index._orderings.get(sort)
+    if cached is not None:
+        return cached
+
+    descending = sort.startswith('-')
+    column = sort.lstrip('-+').lower()
+    if column == ROW_NUMBER_FIELD:
+        # El orden de la hoja es el orden de las filas
+        ordering = list(range(len(index.rows)))
+        if descending:
+            ordering.reverse()
+    else:
+        values = index.columns.get(column)
+        if values is None:
+            raise HTTPException(status_code=400, detail=f"No se puede ordenar por '{column}': la columna no existe.")
+        ordering = sorted(range(len(index.rows)), key=lambda i: _sort_key(values[i]), reverse=descending)
+
+    index._orderings[sort] = ordering
+    return ordering
+
+
+def _normalize(value) -> str:
+    return '' if value is None else str(value).lower()
+
+
+def _sort_key(value: str):
+    # Los valores numéricos se ordenan como números y antes que el texto
+    try:
+        return (0, float(value), '')
+    except ValueError:
+        return (1, 0.0, value)
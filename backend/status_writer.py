@@ -0,0 +1,441 @@
+"""
+Escritura diferida (write-behind) de las marcas de 'Enviado' en la hoja.
+
+Cada envío de email encola su celda de estado en SQLite y sigue sin esperar a Google.
+Un único flusher en segundo plano junta las celdas pendientes de todas las peticiones y
+las escribe con un solo `values.batchUpdate`: a los `STATUS_WRITE_FLUSH_INTERVAL`
+segundos de la primera celda pendiente, o en cuanto se juntan `STATUS_WRITE_MAX_BATCH`.
+Si la escritura falla, las celdas quedan en la tabla y se reintentan con espera
+exponencial, también tras un reinicio. Un error 4xx de Google no se reintenta: el lote se
+parte en mitades hasta aislar la celda rechazada, que queda marcada como fallida
+(`failed_at`) junto con las que agotan `STATUS_WRITE_MAX_ATTEMPTS` intentos.
+
+La tabla es compartida por todos los workers de la máquina. Cada flusher reserva su lote
+(`claimed_by`/`claimed_until`) antes de escribirlo, así que cada celda se escribe una
+sola vez aunque haya varios; si el worker muere, la reserva vence y otro la retoma.
+
+Mientras una celda está pendiente, la caché de la hoja la sirve superpuesta
+(`SheetRangeCache.set_pending`), así que quien marcó la fila la ve marcada al volver a leer.
+Cada worker relee además las celdas que encolaron los demás (cada
+`STATUS_WRITE_SHARE_INTERVAL` segundos, sólo si la tabla cambió) y las superpone también.
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+import metrics
+from email_delivery import SENT_MARKER, mark_as_sent, status_cell_range
+from google_async import RETRYABLE_STATUSES, GoogleRateLimitError
+from sheet_cache import SheetRangeCache
+from tabs import TABS
+
+
+STATUS_WRITE_DB = os.getenv(
+    "STATUS_WRITE_DB",
+    os.path.join(os.path.dirname(__file__), 'data', 'status_writes.sqlite3'),
+)
+# Segundos que se esperan para juntar celdas antes de escribirlas
+STATUS_WRITE_FLUSH_INTERVAL = float(os.getenv("STATUS_WRITE_FLUSH_INTERVAL", "1"))
+# Celdas por `values.batchUpdate`; al juntarse esta cantidad se escriben sin esperar
+STATUS_WRITE_MAX_BATCH = int(os.getenv("STATUS_WRITE_MAX_BATCH", "200"))
+STATUS_WRITE_RETRY_BASE_DELAY = float(os.getenv("STATUS_WRITE_RETRY_BASE_DELAY", "5"))
+STATUS_WRITE_RETRY_MAX_DELAY = 300.0
+# Intentos de escritura de una celda antes de darla por fallida
+STATUS_WRITE_MAX_ATTEMPTS = int(os.getenv("STATUS_WRITE_MAX_ATTEMPTS", "8"))
+# Duración (segundos) de la reserva de un lote; si el worker que lo escribe muere, vence sola
+STATUS_WRITE_CLAIM_LEASE = float(os.getenv("STATUS_WRITE_CLAIM_LEASE", "60"))
+# Intervalo (segundos) entre relecturas de las celdas encoladas por otros workers
+STATUS_WRITE_SHARE_INTERVAL = float(os.getenv("STATUS_WRITE_SHARE_INTERVAL", "0.5"))
+# Segundos que una conexión espera a que otro worker suelte la base antes de fallar
+_BUSY_TIMEOUT = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS status_writes (
+    cell_range TEXT PRIMARY KEY,
+    spreadsheet_id TEXT NOT NULL,
+    sheet_name TEXT NOT NULL,
+    column_letter TEXT NOT NULL,
+    sheet_row_number INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    claimed_by TEXT,
+    claimed_until REAL,
+    failed_at REAL
+);
+CREATE INDEX IF NOT EXISTS status_writes_due ON status_writes (next_attempt_at);
+"""
+# Columnas agregadas después de crear la tabla; se suman a las bases existentes al abrirlas
+_ADDED_COLUMNS = (('claimed_by', 'TEXT'), ('claimed_until', 'REAL'), ('failed_at', 'REAL'))
+
+# Estado de una celda encolada
+CELL_PENDING = 'pending'
+CELL_WRITTEN = 'written'
+CELL_FAILED = 'failed'
+
+
+def validate_status_cell(sheet_name: str, column_letter: str, sheet_row_number: int) -> None:
+    """Lanza ValueError si la celda no es la columna de estado de una fila de datos de una pestaña registrada."""
+    tab = TABS.get(sheet_name)
+    if tab is None:
+        raise ValueError(f"Pestaña desconocida: {sheet_name}. Disponibles: {', '.join(TABS)}.")
+    if column_letter.strip().upper() != tab.status_column:
+        raise ValueError(f"La columna de estado de {sheet_name} es {tab.status_column}, no {column_letter}.")
+    if sheet_row_number < 2:
+        raise ValueError(f"Fila inválida: {sheet_row_number}. La fila 1 es la de encabezados.")
+
+
+def _is_permanent(error: Exception) -> bool:
+    """Un 4xx de Google (salvo los transitorios) no se arregla reintentando."""
+    if isinstance(error, GoogleRateLimitError):
+        return False
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    return status is not None and 400 <= int(status) < 500 and int(status) not in RETRYABLE_STATUSES | {408}
+
+
+class StatusWriteBuffer:
+    def __init__(
+        self,
+        get_sheet_service,
+        sheet_cache: SheetRangeCache,
+        db_path: str = STATUS_WRITE_DB,
+        flush_interval: float = STATUS_WRITE_FLUSH_INTERVAL,
+        max_batch: int = STATUS_WRITE_MAX_BATCH,
+    ):
+        self._get_sheet_service = get_sheet_service
+        self._sheet_cache = sheet_cache
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.pending = 0
+        # Identifica a este proceso en las reservas de lotes
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._db_lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._share_task: asyncio.Task | None = None
+        # Serializa los cambios de la superposición con la relectura de la tabla compartida,
+        # para que una relectura vieja no pise una celda recién encolada o escrita
+        self._overlay_lock = asyncio.Lock()
+        self._data_version: int | None = None
+
+    # --- Ciclo de vida ---
+
+    async def start(self) -> None:
+        """Restaura las celdas pendientes (y su superposición en la caché) y lanza el flusher."""
+        await self._sync_shared()
+        self._task = asyncio.create_task(self._run())
+        self._share_task = asyncio.create_task(self._follow_shared())
+
+    async def stop(self) -> None:
+        """Escribe lo pendiente antes de detenerse; lo que falle queda para el próximo arranque."""
+        for task in (self._task, self._share_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._task = self._share_task = None
+        try:
+            while await self._flush_due(force=True):
+                pass
+        except Exception as e:
+            print(f"ERROR: No se pudieron escribir las marcas pendientes al detener: {e}")
+
+    # --- API pública ---
+
+    async def enqueue(self, spreadsheet_id: str, sheet_name: str, column_letter: str, sheet_row_number: int) -> None:
+        """
+        Encola la marca de 'Enviado' de una fila. Vuelve en cuanto quedó guardada; lanza
+        ValueError si la celda no es la columna de estado de una pestaña registrada.
+        """
+        validate_status_cell(sheet_name, column_letter, sheet_row_number)
+        column_letter = column_letter.strip().upper()
+        async with self._overlay_lock:
+            self.pending = await asyncio.to_thread(
+                self._insert, spreadsheet_id, sheet_name, column_letter, sheet_row_number
+            )
+            self._sheet_cache.set_pending(spreadsheet_id, sheet_name, sheet_row_number, column_letter, SENT_MARKER)
+        self._wakeup.set()
+
+    async def cell_state(self, sheet_name: str, column_letter: str, sheet_row_number: int) -> tuple[str, str | None]:
+        """
+        Estado de una celda encolada: pendiente, escrita (ya no está en la tabla) o fallida,
+        con el último error de Google.
+        """
+        return (await self.cell_states([(sheet_name, column_letter, sheet_row_number)]))[0]
+
+    async def cell_states(self, cells: list[tuple[str, str, int]]) -> list[tuple[str, str | None]]:
+        """Como `cell_state`, para varias celdas (pestaña, columna, fila) con una sola consulta."""
+        if not cells:
+            return []
+        cell_ranges = [
+            status_cell_range(sheet_name, column_letter.strip().upper(), sheet_row_number)
+            for sheet_name, column_letter, sheet_row_number in cells
+        ]
+        return await asyncio.to_thread(self._states, cell_ranges)
+
+    async def flush(self) -> None:
+        """
+        Escribe ya las celdas encoladas sin esperar al intervalo. Las que esperan un reintento
+        o que reservó otro worker siguen su curso.
+        """
+        while await self._flush_due():
+            pass
+
+    # --- Flusher ---
+
+    async def _run(self) -> None:
+        while True:
+            # Se limpia antes de mirar la tabla para no perder un aviso de `enqueue`
+            self._wakeup.clear()
+            next_due, ready = await asyncio.to_thread(self._next_due)
+            # Un lote completo se escribe sin esperar a que venza el intervalo
+            wait = None if next_due is None else 0 if ready >= self.max_batch else next_due - time.time()
+            if wait is None or wait > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._flush_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"ERROR: Fallo el flusher de marcas de 'Enviado': {e}")
+
+    async def _flush_due(self, force: bool = False) -> int:
+        """
+        Escribe un lote con las celdas vencidas y todas las nuevas (las que esperan un
+        reintento no se adelantan, salvo con `force`). Devuelve cuántas se escribieron.
+        """
+        cells = await asyncio.to_thread(self._claim_batch, force)
+        written = 0
+        by_spreadsheet: dict[str, list[tuple]] = {}
+        for cell in cells:
+            by_spreadsheet.setdefault(cell[0], []).append(cell)
+
+        for spreadsheet_id, group in by_spreadsheet.items():
+            done, failed = await self._write(spreadsheet_id, group)
+            if done:
+                metrics.STATUS_WRITE_BATCH_SIZE.observe(len(done))
+                written += len(done)
+                # Primero se invalida (aquí y en los demás workers) y sólo después se quita la
+                # superposición: así ninguna lectura sirve la copia vieja sin el 'Enviado'
+                for sheet_name in {sheet_name for _, sheet_name, _, _ in done}:
+                    await self._sheet_cache.invalidate(spreadsheet_id, sheet_name)
+            async with self._overlay_lock:
+                if done:
+                    self.pending = await asyncio.to_thread(self._delete, [self._range_of(cell) for cell in done])
+                # Las fallidas dejan de superponerse: la hoja no tiene la marca
+                for _, sheet_name, row, column_letter in done + failed:
+                    self._sheet_cache.clear_pending(spreadsheet_id, sheet_name, row, column_letter)
+        return written
+
+    async def _write(self, spreadsheet_id: str, group: list[tuple]) -> tuple[list[tuple], list[tuple]]:
+        """
+        Escribe un lote de celdas; devuelve las escritas y las que quedaron fallidas. Si Google
+        rechaza el lote con un 4xx, se parte en mitades para escribir las demás celdas.
+        """
+        ranges = [self._range_of(cell) for cell in group]
+        try:
+            with metrics.stage('email.sheet_update'):
+                await mark_as_sent(self._get_sheet_service(), spreadsheet_id, ranges)
+        except Exception as e:
+            if not _is_permanent(e):
+                print(f"ERROR: Fallo al escribir {len(ranges)} marcas de 'Enviado'; se reintentará: {e}")
+                failed = await asyncio.to_thread(self._reschedule, ranges, str(e))
+                return [], [cell for cell in group if self._range_of(cell) in failed]
+            if len(group) > 1:
+                middle = len(group) // 2
+                first_done, first_failed = await self._write(spreadsheet_id, group[:middle])
+                second_done, second_failed = await self._write(spreadsheet_id, group[middle:])
+                return first_done + second_done, first_failed + second_failed
+            print(f"ERROR: Google rechazó la marca de 'Enviado' en {ranges[0]}; no se reintentará: {e}")
+            await asyncio.to_thread(self._reschedule, ranges, str(e), True)
+            return [], group
+        return group, []
+
+    @staticmethod
+    def _range_of(cell: tuple) -> str:
+        _, sheet_name, row, column_letter = cell
+        return status_cell_range(sheet_name, column_letter, row)
+
+    # --- Celdas encoladas por otros workers ---
+
+    async def _follow_shared(self) -> None:
+        while True:
+            await asyncio.sleep(STATUS_WRITE_SHARE_INTERVAL)
+            try:
+                await self._sync_shared()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"ERROR: No se pudieron releer las marcas de 'Enviado' pendientes: {e}")
+
+    async def _sync_shared(self) -> None:
+        """Superpone las celdas pendientes de la tabla (de todos los workers) si la tabla cambió."""
+        async with self._overlay_lock:
+            cells = await asyncio.to_thread(self._load_if_changed)
+            if cells is not None:
+                self._sheet_cache.replace_pending(cells, SENT_MARKER)
+
+    # --- Acceso a SQLite (se ejecuta en hilos, serializado con _db_lock) ---
+
+    def _open(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=_BUSY_TIMEOUT)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(status_writes)")}
+            for column, column_type in _ADDED_COLUMNS:
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE status_writes ADD COLUMN {column} {column_type}")
+            self._conn = conn
+        return self._conn
+
+    def _count(self, conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT COUNT(*) FROM status_writes WHERE failed_at IS NULL").fetchone()[0]
+
+    def _insert(self, spreadsheet_id: str, sheet_name: str, column_letter: str, sheet_row_number: int) -> int:
+        now = time.time()
+        with self._db_lock:
+            conn = self._open()
+            # Una celda ya pendiente no se duplica ni pierde su lugar en la cola; una fallida
+            # vuelve a intentarse desde cero
+            conn.execute(
+                "INSERT INTO status_writes "
+                "(cell_range, spreadsheet_id, sheet_name, column_letter, sheet_row_number, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (cell_range) DO UPDATE SET attempts = 0, last_error = NULL, failed_at = NULL, "
+                "next_attempt_at = excluded.next_attempt_at, created_at = excluded.created_at "
+                "WHERE failed_at IS NOT NULL",
+                (status_cell_range(sheet_name, column_letter, sheet_row_number), spreadsheet_id, sheet_name,
+                 column_letter, sheet_row_number, now + self.flush_interval, now),
+            )
+            return self._count(conn)
+
+    def _load_if_changed(self) -> list[tuple] | None:
+        """Todas las celdas pendientes, o None si ningún otro proceso tocó la tabla desde la última vez."""
+        with self._db_lock:
+            conn = self._open()
+            # data_version cambia sólo con los commits de otras conexiones
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return None
+            self._data_version = data_version
+            self.pending = self._count(conn)
+            return conn.execute(
+                "SELECT spreadsheet_id, sheet_name, sheet_row_number, column_letter FROM status_writes "
+                "WHERE failed_at IS NULL"
+            ).fetchall()
+
+    def _next_due(self) -> tuple[float | None, int]:
+        """
+        Vencimiento más próximo (las celdas reservadas por otro worker, al vencer su reserva)
+        y cantidad de celdas libres que no esperan un reintento.
+        """
+        now = time.time()
+        with self._db_lock:
+            next_due, ready = self._open().execute(
+                "SELECT MIN(MAX(next_attempt_at, COALESCE(claimed_until, 0))), "
+                "SUM(attempts = 0 AND (claimed_until IS NULL OR claimed_until < ?)) FROM status_writes "
+                "WHERE failed_at IS NULL",
+                (now,),
+            ).fetchone()
+        return next_due, ready or 0
+
+    def _claim_batch(self, force: bool) -> list[tuple]:
+        """Reserva para este worker un lote de celdas libres (o con la reserva vencida)."""
+        now = time.time()
+        # Los reintentos que vencen dentro del intervalo se adelantan para ir en el mismo lote
+        horizon = now + self.flush_interval
+        with self._db_lock:
+            conn = self._open()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cells = conn.execute(
+                    "SELECT cell_range, spreadsheet_id, sheet_name, sheet_row_number, column_letter FROM status_writes "
+                    "WHERE failed_at IS NULL AND (claimed_until IS NULL OR claimed_until < ?) "
+                    "AND (? OR attempts = 0 OR next_attempt_at <= ?) "
+                    "ORDER BY created_at LIMIT ?",
+                    (now, force, horizon, self.max_batch),
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE status_writes SET claimed_by = ?, claimed_until = ? WHERE cell_range = ?",
+                    [(self.origin, now + STATUS_WRITE_CLAIM_LEASE, cell[0]) for cell in cells],
+                )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return [cell[1:] for cell in cells]
+
+    def _reschedule(self, cell_ranges: list[str], error: str, permanent: bool = False) -> set[str]:
+        """Programa el reintento de las celdas; devuelve las que se dan por fallidas."""
+        now = time.time()
+        failed = set()
+        with self._db_lock:
+            conn = self._open()
+            for cell_range in cell_ranges:
+                stored = conn.execute(
+                    "SELECT attempts FROM status_writes WHERE cell_range = ? AND claimed_by = ?",
+                    (cell_range, self.origin),
+                ).fetchone()
+                if stored is None:
+                    # La reserva venció y la tomó otro worker
+                    continue
+                attempts = stored[0] + 1
+                if permanent or attempts >= STATUS_WRITE_MAX_ATTEMPTS:
+                    conn.execute(
+                        "UPDATE status_writes SET attempts = ?, last_error = ?, failed_at = ?, "
+                        "claimed_by = NULL, claimed_until = NULL WHERE cell_range = ?",
+                        (attempts, error, now, cell_range),
+                    )
+                    failed.add(cell_range)
+                    continue
+                delay = min(STATUS_WRITE_RETRY_BASE_DELAY * 2 ** (attempts - 1), STATUS_WRITE_RETRY_MAX_DELAY)
+                conn.execute(
+                    "UPDATE status_writes SET attempts = ?, next_attempt_at = ?, last_error = ?, "
+                    "claimed_by = NULL, claimed_until = NULL WHERE cell_range = ?",
+                    (attempts, now + delay * random.uniform(0.5, 1.0), error, cell_range),
+                )
+            self.pending = self._count(conn)
+        return failed
+
+    def _delete(self, cell_ranges: list[str]) -> int:
+        with self._db_lock:
+            conn = self._open()
+            # Si la reserva venció y otro worker la tomó, la fila queda para que la borre ese worker
+            conn.executemany(
+                "DELETE FROM status_writes WHERE cell_range = ? AND claimed_by = ?",
+                [(r, self.origin) for r in cell_ranges],
+            )
+            return self._count(conn)
+
+    def _states(self, cell_ranges: list[str]) -> list[tuple[str, str | None]]:
+        with self._db_lock:
+            conn = self._open()
+            stored = {
+                row[0]: row[1:] for row in conn.execute(
+                    "SELECT cell_range, failed_at, last_error FROM status_writes "
+                    f"WHERE cell_range IN ({', '.join('?' * len(cell_ranges))})",
+                    cell_ranges,
+                )
+            }
+        states = []
+        for cell_range in cell_ranges:
+            if cell_range not in stored:
+                states.append((CELL_WRITTEN, None))
+            else:
+                failed_at, last_error = stored[cell_range]
+                states.append((CELL_FAILED if failed_at is not None else CELL_PENDING, last_error))
+        return states
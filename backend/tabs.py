@@ -0,0 +1,94 @@
+"""
+Registro de las pestañas de la hoja de Recursos Humanos.
+
+Cada pestaña define su rango, la carpeta de Google Drive donde están sus PDFs, la
+columna donde se marca 'Enviado' y la plantilla del email con el que se envía cada
+PDF. Los endpoints /sheets/*, el endpoint por lotes y el envío masivo se generan a
+partir de este registro.
+"""
+
+from dataclasses import dataclass
+
+
+SPREADSHEET_ID = "1VohQVfx1rmnV8nkT3cxQdx996bj0BkeLovAmqYZXuMA"
+
+
+@dataclass(frozen=True)
+class TabConfig:
+    key: str               # Nombre de la pestaña en la hoja (e.g., 'licencia')
+    range_name: str        # Rango leído (e.g., 'licencia!A1:L')
+    drive_folder_id: str   # Carpeta de Google Drive con los PDFs de la pestaña
+    status_column: str     # Letra de la columna donde se marca 'Enviado'
+    route: str             # Ruta histórica del endpoint
+    name_headers: tuple[str, ...]     # Encabezados posibles del nombre (en minúsculas)
+    surname_headers: tuple[str, ...]  # Encabezados posibles del apellido/legajo
+    subject_template: str  # Asunto del email; admite {nombre} y {apellido}
+    body_template: str     # Frase principal del cuerpo del email
+    filename_prefix: str   # Prefijo del nombre del adjunto
+
+
+TABS: dict[str, TabConfig] = {
+    tab.key: tab for tab in (
+        TabConfig(
+            key="certificado_medico",
+            range_name="certificado_medico!A1:J",
+            drive_folder_id="1-VzmLOGyhuWp9d26VcxOdI1JL8q7c5bG",
+            status_column="J",
+            route="/sheets/data",
+            name_headers=("nombre", "name"),
+            surname_headers=("apellido", "surname", "legajo"),
+            subject_template="Autorización de {nombre} {apellido}",
+            body_template="Adjuntamos la autorización de {nombre} {apellido}.",
+            filename_prefix="Autorizacion",
+        ),
+        TabConfig(
+            key="licencia",
+            range_name="licencia!A1:L",
+            drive_folder_id="13QIHa4FES-bXp0rZsc6FNpi3xgfDB7hH",
+            status_column="L",
+            route="/sheets/licencia-data",
+            name_headers=("nombre", "name"),
+            surname_headers=("apellido", "surname", "legajo"),
+            subject_template="Autorización de Licencia para {nombre} {apellido}",
+            body_template="Adjuntamos la autorización de licencia para {nombre} {apellido}.",
+            filename_prefix="Licencia",
+        ),
+        TabConfig(
+            key="81_inciso_D",
+            range_name="81_inciso_D!A1:J",
+            drive_folder_id="1QAwBtekeHsHU-6bUjn7ug2QgSElHtC8o",
+            status_column="J",
+            route="/sheets/formulario-81-d-data",
+            name_headers=("name",),
+            surname_headers=("apellido", "legajo"),
+            subject_template="Autorización de Formulario 81 Inciso D para {nombre} {apellido}",
+            body_template="Adjuntamos la autorización de Formulario 81 Inciso D para {nombre} {apellido}.",
+            filename_prefix="Formulario_81D",
+        ),
+        TabConfig(
+            key="81_inciso_F",
+            range_name="81_inciso_F!A1:J",
+            drive_folder_id="1mi00TEyRbjaOosGwyFjsSo-OrFRGcF9d",
+            status_column="J",
+            route="/sheets/formulario-81-f-data",
+            name_headers=("name",),
+            surname_headers=("apellido", "legajo"),
+            subject_template="Autorización de Formulario 81 Inciso F para {nombre} {apellido}",
+            body_template="Adjuntamos la autorización de Formulario 81 Inciso F para {nombre} {apellido}.",
+            filename_prefix="Formulario_81F",
+        ),
+    )
+}
+
+
+def sheet_name_of(range_name: str) -> str:
+    """Nombre de la pestaña de un rango A1 (e.g., "'licencia'!A1:L" -> 'licencia')."""
+    return range_name.split('!', 1)[0].strip("'")
+
+
+def column_index(column_letter: str) -> int:
+    """Índice (desde 0) de una columna en notación A1 (e.g., 'A' -> 0, 'L' -> 11, 'AA' -> 26)."""
+    index = 0
+    for char in column_letter.strip().upper():
+        index = index * 26 + (ord(char) - ord('A') + 1)
+    return index - 1
@@ -1,6 +1,12 @@
-import React, { useEffect, useState, useMemo } from 'react';
+import React, { useEffect, useState } from 'react';
 import './SheetData.css'; // Will create this file for card-specific styles
-import API_URL from './apiConfig'; // Import the API URL
+import {
+  applyRowPatches,
+  fetchSheetPage,
+  sendPdfEmail,
+  SEARCH_DEBOUNCE_MS,
+  subscribeToSheetEvents,
+} from './sheetApi';
 
 // Nuevo componente Card para manejar la lógica de colapsado
 function DataCard({ row, headers }) {
@@ -36,28 +42,18 @@ function DataCard({ row, headers }) {
     setEmailSendError(null);
 
     try {
-      const response = await fetch(`${API_URL}/send_pdf_email`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          pdf_drive_id: pdfDriveId,
-          recipient_email: recipientEmail,
-          subject: `Autorización de ${row[nameHeader] || ''} ${row[surnameHeader] || ''}`, // Asunto dinámico
-          body_text: `Estimado/a,\n\nAdjuntamos la autorización de ${row[nameHeader] || ''} ${row[surnameHeader] || ''}.\n\nSaludos,\nRecursos Humanos Traful`,
-          filename: `Autorizacion_${row[nameHeader] || ''}_${row[surnameHeader] || ''}.pdf`, // Nombre de archivo sugerido
-          sheet_row_number: row['sheet_row_number'],
-          sheet_name: 'certificado_medico',
-          update_column_letter: 'J'
-        }),
+      // El backend encola el envío; se espera a que el trabajo termine
+      await sendPdfEmail({
+        pdf_drive_id: pdfDriveId,
+        recipient_email: recipientEmail,
+        subject: `Autorización de ${row[nameHeader] || ''} ${row[surnameHeader] || ''}`, // Asunto dinámico
+        body_text: `Estimado/a,\n\nAdjuntamos la autorización de ${row[nameHeader] || ''} ${row[surnameHeader] || ''}.\n\nSaludos,\nRecursos Humanos Traful`,
+        filename: `Autorizacion_${row[nameHeader] || ''}_${row[surnameHeader] || ''}.pdf`, // Nombre de archivo sugerido
+        sheet_row_number: row['sheet_row_number'],
+        sheet_name: 'certificado_medico',
+        update_column_letter: 'J'
       });
 
-      if (!response.ok) {
-        const errorData = await response.json();
-        throw new Error(errorData.detail || 'Error al enviar el email.');
-      }
-
       setEmailSendStatus('success');
     } catch (error) {
       console.error('Error sending email:', error);
@@ -160,56 +156,52 @@ function DataCard({ row, headers }) {
 
 
 function SheetData({ onBackToMenu }) { // Accept onBackToMenu prop
-  const [data, setData] = useState({ headers: [], data: [] });
+  const [data, setData] = useState({ headers: [], data: [], pages: 0 });
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [searchTerm, setSearchTerm] = useState('');
   const [currentPage, setCurrentPage] = useState(1);
-  const recordsPerPage = 10;
+  const [reloadToken, setReloadToken] = useState(0);
+
+  // Cambios de filas enviados por el backend: se aplican sin volver a pedir la página
+  useEffect(() => subscribeToSheetEvents('certificado_medico', {
+    onRows: (rows) => setData(prev => ({ ...prev, data: applyRowPatches(prev.data, rows) })),
+    onReload: () => setReloadToken(token => token + 1),
+  }), []);
 
   useEffect(() => {
+    let cancelled = false;
+
     const fetchSheetData = async () => {
       try {
         const spreadsheetId = '1VohQVfx1rmnV8nkT3cxQdx996bj0BkeLovAmqYZXuMA'; // Tu ID de Google Sheet
         const rangeName = 'certificado_medico!A1:Z'; // Tu nombre de hoja y rango. 'Z' para leer hasta el final.
 
-        const requestUrl = `${API_URL}/sheets/data?spreadsheet_id=${spreadsheetId}&range_name=${rangeName}`;
-
-
-        const response = await fetch(requestUrl);
-        
-        if (!response.ok) {
-          throw new Error(`HTTP error! status: ${response.status}`);
+        // El backend devuelve sólo la página pedida, ya filtrada y con los más recientes primero
+        const result = await fetchSheetPage('/sheets/data', {
+          page: currentPage,
+          search: searchTerm,
+          extraParams: { spreadsheet_id: spreadsheetId, range_name: rangeName },
+        });
+        if (!cancelled) {
+          setData({ headers: result.headers, data: result.data, pages: result.pages || 0 });
         }
-        const result = await response.json();
-        // Reverse the data array to show latest first
-        setData({ headers: result.headers, data: result.data.slice().reverse() });
       } catch (e) {
-        setError(e);
+        if (!cancelled) setError(e);
       } finally {
-        setLoading(false);
+        if (!cancelled) setLoading(false);
       }
     };
 
-    fetchSheetData();
-  }, []);
-
-  const filteredData = useMemo(() => {
-    if (!searchTerm) {
-      return data.data;
-    }
-    return data.data.filter(row =>
-      Object.values(row).some(value =>
-        String(value).toLowerCase().includes(searchTerm.toLowerCase())
-      )
-    );
-  }, [data.data, searchTerm]);
+    const timer = setTimeout(fetchSheetData, searchTerm ? SEARCH_DEBOUNCE_MS : 0);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [currentPage, searchTerm, reloadToken]);
 
-  // Pagination logic
-  const indexOfLastRecord = currentPage * recordsPerPage;
-  const indexOfFirstRecord = indexOfLastRecord - recordsPerPage;
-  const currentRecords = filteredData.slice(indexOfFirstRecord, indexOfLastRecord);
-  const nPages = Math.ceil(filteredData.length / recordsPerPage);
+  const currentRecords = data.data;
+  const nPages = data.pages;
 
   const paginate = (pageNumber) => setCurrentPage(pageNumber);
 
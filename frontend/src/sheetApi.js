@@ -0,0 +1,115 @@
+// src/sheetApi.js
+// Consultas paginadas a los endpoints /sheets/* del backend
+import API_URL from './apiConfig';
+
+export const RECORDS_PER_PAGE = 10;
+// Espera (ms) antes de consultar al backend mientras se escribe en la búsqueda
+export const SEARCH_DEBOUNCE_MS = 300;
+
+// Últimas páginas recibidas con su ETag, para revalidarlas con If-None-Match
+const PAGE_CACHE_MAX_ENTRIES = 50;
+const pageCache = new Map();
+
+// Pide una página de registros; el backend filtra, ordena y pagina.
+// Por defecto se ordena por fila descendente para mostrar primero los más recientes.
+export async function fetchSheetPage(endpoint, { page, search = '', sort = '-sheet_row_number', extraParams = {} }) {
+  const params = new URLSearchParams({
+    ...extraParams,
+    page: String(page),
+    page_size: String(RECORDS_PER_PAGE),
+    sort,
+  });
+  if (search) {
+    params.set('q', search);
+  }
+
+  const url = `${API_URL}${endpoint}?${params.toString()}`;
+  const cached = pageCache.get(url);
+  const headers = cached ? { 'If-None-Match': cached.etag } : {};
+
+  const response = await fetch(url, { headers });
+  if (response.status === 304 && cached) {
+    // Los datos no cambiaron desde la última consulta: se reutiliza la respuesta guardada
+    return cached.data;
+  }
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+
+  const data = await response.json();
+  const etag = response.headers.get('ETag');
+  if (etag) {
+    pageCache.delete(url);
+    pageCache.set(url, { etag, data });
+    if (pageCache.size > PAGE_CACHE_MAX_ENTRIES) {
+      pageCache.delete(pageCache.keys().next().value);
+    }
+  }
+  return data;
+}
+
+// Se suscribe a los cambios por fila de una pestaña (Server-Sent Events).
+// `onRows` recibe las filas modificadas (completas o sólo las celdas que cambiaron);
+// `onReload` avisa que hay que volver a pedir la página: al conectarse, cuando se agregan
+// o quitan filas y cuando el backend descartó eventos. Devuelve la función para cerrarla.
+export function subscribeToSheetEvents(tabKey, { onRows, onReload }) {
+  const source = new EventSource(`${API_URL}/sheets/${encodeURIComponent(tabKey)}/events`);
+  source.addEventListener('ready', () => onReload());
+  source.addEventListener('reset', () => onReload());
+  source.addEventListener('patch', (event) => {
+    const patch = JSON.parse(event.data);
+    if (patch.added.length || patch.removed.length) {
+      onReload();
+    } else {
+      onRows(patch.rows);
+    }
+  });
+  return () => source.close();
+}
+
+// Aplica filas modificadas a los registros mostrados, identificándolas por `sheet_row_number`
+export function applyRowPatches(records, rows) {
+  const patches = new Map(rows.map(row => [row.sheet_row_number, row]));
+  return records.map(record => (
+    patches.has(record.sheet_row_number) ? { ...record, ...patches.get(record.sheet_row_number) } : record
+  ));
+}
+
+// Intervalo (ms) entre consultas del estado de un envío encolado
+const EMAIL_JOB_POLL_MS = 1000;
+// Tiempo máximo (ms) que se espera a que el backend procese el envío
+const EMAIL_JOB_TIMEOUT_MS = 120000;
+
+// Encola el envío del PDF por email y espera a que el backend lo procese.
+// El backend responde 202 con el trabajo; su estado se consulta en `status_url`.
+export async function sendPdfEmail(payload) {
+  const response = await fetch(`${API_URL}/send_pdf_email`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(payload),
+  });
+
+  let job = await response.json();
+  if (!response.ok) {
+    throw new Error(job.detail || 'Error al enviar el email.');
+  }
+
+  const deadline = Date.now() + EMAIL_JOB_TIMEOUT_MS;
+  while (job.status !== 'sent') {
+    if (job.status === 'failed') {
+      throw new Error(job.last_error || 'Error al enviar el email.');
+    }
+    if (Date.now() > deadline) {
+      throw new Error('El envío sigue en cola; revisá su estado más tarde.');
+    }
+    await new Promise(resolve => setTimeout(resolve, EMAIL_JOB_POLL_MS));
+    const statusResponse = await fetch(`${API_URL}${job.status_url}`);
+    if (!statusResponse.ok) {
+      throw new Error(`HTTP error! status: ${statusResponse.status}`);
+    }
+    job = await statusResponse.json();
+  }
+  return job;
+}